@@ -1,101 +1,266 @@
-from flask import Flask, jsonify, send_from_directory, make_response, request
+from flask import Flask, Response, jsonify, send_from_directory, make_response, request, abort
 from flask_cors import CORS
 import os
-import json
-from influx import get_current_values, get_minmax_24h, get_24h_history, get_indoor_values, get_indoor_24h_history
+import hashlib
+from datetime import datetime, timezone
+from influx import get_current_values, get_minmax_24h, get_24h_history, get_indoor_values, get_indoor_24h_history, get_aurora_history, influx_health, ensure_rollup_tasks, pop_query_timings
 from smhi import get_smhi_warnings, get_sun_times, get_smhi_forecast, get_smhi_timeseries
 from config import BACKEND_HOST, BACKEND_PORT
-from push_config import VAPID_PUBLIC_KEY, VAPID_PRIVATE_KEY_PATH, VAPID_CLAIMS, SUBSCRIPTIONS_FILE
-from push_handler import send_web_push
+from push_config import VAPID_PUBLIC_KEY
+from push_dispatcher import dispatcher as push_dispatcher
+from subscription_store import store as subscription_store
+from upstream_cache import cache_stats
+from static_assets import AssetStore, IMMUTABLE_MAX_AGE, MIN_COMPRESS_SIZE, choose_encoding, compress
+from aurora import engine as aurora_engine, FORECAST_HOURS, MAX_FORECAST_HOURS
+from locations import get_location, all_locations, DEFAULT_LOCATION
+from live_stream import stream as live_stream
+from dashboard import build_dashboard, parse_fields
 
 BASE_DIR = os.path.abspath(os.path.dirname(__file__))
 STATIC_DIR = os.path.join(BASE_DIR, "static")
 
 app = Flask(
     __name__,
-    static_folder=STATIC_DIR,      # <-- Serve index.html, CSS, JS from here
-    static_url_path=""             # <-- Makes /styles.css reachable
+    static_folder=None             # <-- Static files are served from memory by static_asset()
 )
 
+# Precompressed, content-hashed copies of everything in static/
+assets = AssetStore(STATIC_DIR)
+
 CORS(app)
 
-# Add cache control headers to prevent aggressive browser caching
+# Keep aurora feeds and score warm in the background
+aurora_engine.start()
+
+# Make sure history rollup tasks exist (no-op unless INFLUX_ROLLUP_BUCKET is set)
+try:
+    ensure_rollup_tasks()
+except Exception as e:
+    print(f"Could not set up history rollups: {e}")
+
+@app.before_request
+def reset_query_timings():
+    pop_query_timings()
+
+# Browser cache lifetime (seconds) per API endpoint; polling clients
+# revalidate with If-None-Match / If-Modified-Since after this and get 304s
+# while the data is unchanged. Anything not listed is never cached.
+API_MAX_AGE = {
+    "/api/current": 10,
+    "/api/indoor": 10,
+    "/api/dashboard": 10,
+    "/api/minmax": 30,
+    "/api/aurora": 30,
+    "/api/aurora/history": 60,
+    "/api/aurora/forecast": 300,
+    "/api/smhi": 120,
+    "/api/forecast": 300,
+    "/api/forecast-24h": 300,
+    "/api/history": 300,
+    "/api/indoor-history": 300,
+    "/api/sun": 600,
+    "/api/locations": 3600,
+}
+
+# (full path) -> (etag, time the payload last changed), for Last-Modified
+_payload_versions = {}
+_MAX_TRACKED_PAYLOADS = 1000
+
+def payload_last_modified(key, etag):
+    version = _payload_versions.get(key)
+    if version is None or version[0] != etag:
+        if len(_payload_versions) >= _MAX_TRACKED_PAYLOADS:
+            _payload_versions.clear()
+        version = (etag, datetime.now(timezone.utc).replace(microsecond=0))
+        _payload_versions[key] = version
+    return version[1]
+
+def _add_conditional_headers(response):
+    """Content-hash ETag + Last-Modified on cacheable API responses, 304 when unchanged"""
+    max_age = API_MAX_AGE.get(request.path)
+    if (max_age is None or request.method not in ("GET", "HEAD")
+            or response.status_code != 200 or response.direct_passthrough):
+        return False
+
+    # Weak, since the same payload may be sent gzip/br encoded
+    etag = hashlib.sha1(response.get_data()).hexdigest()
+    response.set_etag(etag, weak=True)
+    response.last_modified = payload_last_modified(request.full_path, etag)
+    response.headers['Cache-Control'] = f'public, max-age={max_age}, must-revalidate'
+    response.make_conditional(request)
+    return True
+
+def _compress_response(response):
+    """gzip/brotli-encode JSON responses the client accepts"""
+    if (response.status_code != 200 or response.direct_passthrough or response.is_streamed
+            or 'Content-Encoding' in response.headers or response.mimetype != 'application/json'):
+        return
+    data = response.get_data()
+    if len(data) < MIN_COMPRESS_SIZE:
+        return
+    response.vary.add('Accept-Encoding')
+    encoding = choose_encoding(request.accept_encodings)
+    if encoding is None:
+        return
+    # Fast levels: API payloads are compressed per request
+    response.set_data(compress(data, encoding, level=5 if encoding == 'br' else 6))
+    response.headers['Content-Encoding'] = encoding
+
+# Endpoints whose caching headers are set by _serve_asset()
+ASSET_ENDPOINTS = {"index", "manifest", "service_worker", "static_asset"}
+
 @app.after_request
 def add_header(response):
-    # Prevent caching of all responses to ensure fresh content
+    # Report InfluxDB query wall times, e.g. "Server-Timing: history;dur=41.2"
+    timings = pop_query_timings()
+    if timings:
+        response.headers['Server-Timing'] = ", ".join(
+            f"{label};dur={ms:.1f}" for label, ms in timings
+        )
+
+    if request.endpoint in ASSET_ENDPOINTS:
+        return response
+
+    cacheable = _add_conditional_headers(response)
+    _compress_response(response)
+    if cacheable:
+        return response
+
+    # Prevent caching of everything else to ensure fresh content
     response.headers['Cache-Control'] = 'no-store, no-cache, must-revalidate, max-age=0'
     response.headers['Pragma'] = 'no-cache'
     response.headers['Expires'] = '0'
     return response
 
 # ---------------------------------------------
-# Serve index.html
+# STATIC ASSETS
 # ---------------------------------------------
+def _serve_asset(path, mimetype=None):
+    """Serve a static file from the asset store, precompressed when possible.
+    URLs carrying the current content hash (?v=) are cached as immutable;
+    anything else is revalidated with its ETag."""
+    asset = assets.get(path)
+    if asset is None:
+        abort(404)
+
+    if asset.data is None:
+        # Binary assets (images) are streamed from disk
+        response = send_from_directory(STATIC_DIR, path, etag=asset.version)
+    else:
+        encoding = choose_encoding(request.accept_encodings)
+        body = {"br": asset.br, "gzip": asset.gzip}.get(encoding)
+        if body is None:
+            body, encoding = asset.data, None
+        response = make_response(body)
+        response.mimetype = asset.mimetype
+        if encoding:
+            response.headers['Content-Encoding'] = encoding
+        response.vary.add('Accept-Encoding')
+        response.set_etag(f"{asset.version}-{encoding or 'identity'}")
+
+    if mimetype:
+        response.mimetype = mimetype
+    if request.args.get('v') == asset.version:
+        response.headers['Cache-Control'] = f'public, max-age={IMMUTABLE_MAX_AGE}, immutable'
+    else:
+        response.headers['Cache-Control'] = 'no-cache'
+    return response.make_conditional(request)
+
 @app.route("/")
 def index():
-    return send_from_directory(STATIC_DIR, "index.html")
+    return _serve_asset("index.html")
 
 # ---------------------------------------------
 # PWA FILES
 # ---------------------------------------------
 @app.route("/manifest.json")
 def manifest():
-    response = make_response(send_from_directory(STATIC_DIR, "manifest.json"))
-    response.headers['Content-Type'] = 'application/manifest+json'
-    return response
+    return _serve_asset("manifest.json", mimetype='application/manifest+json')
 
 @app.route("/service-worker.js")
 def service_worker():
-    response = make_response(send_from_directory(STATIC_DIR, "service-worker.js"))
-    response.headers['Content-Type'] = 'application/javascript'
+    response = _serve_asset("service-worker.js", mimetype='application/javascript')
     response.headers['Service-Worker-Allowed'] = '/'
     return response
 
+@app.route("/<path:filename>")
+def static_asset(filename):
+    return _serve_asset(filename)
+
 # ---------------------------------------------
 # API ENDPOINTS
 # ---------------------------------------------
+def _requested_location():
+    """Resolve ?location= to a registered site, or abort with 404"""
+    location = get_location(request.args.get('location'))
+    if location is None:
+        abort(make_response(jsonify({"error": f"Unknown location: {request.args.get('location')}"}), 404))
+    return location
+
 @app.route("/api/current")
 def api_current():
     return jsonify(get_current_values())
 
+@app.route("/api/health")
+def api_health():
+    influx = influx_health()
+    status = 200 if influx["ok"] else 503
+    return jsonify({"influx": influx}), status
+
+@app.route("/api/cache-stats")
+def api_cache_stats():
+    return jsonify(cache_stats())
+
 @app.route("/api/minmax")
 def api_minmax():
     return jsonify(get_minmax_24h())
 
+@app.route("/api/locations")
+def api_locations():
+    return jsonify({"locations": all_locations(), "default": DEFAULT_LOCATION})
+
 @app.route("/api/smhi")
 def api_smhi():
-    return jsonify(get_smhi_warnings())
+    location = _requested_location()
+    return jsonify(get_smhi_warnings(location["region"]))
 
 @app.route("/api/sun")
 def api_sun():
-    return jsonify(get_sun_times())
+    location = _requested_location()
+    return jsonify(get_sun_times(location["lat"], location["lon"]))
 
 @app.route("/api/forecast")
 def api_forecast():
-    return jsonify(get_smhi_forecast())
+    location = _requested_location()
+    return jsonify(get_smhi_forecast(location["lat"], location["lon"]))
 
 @app.route("/api/forecast-24h")
 def api_forecast_24h():
     # Return simplified SMHI time series (24 entries)
-    return jsonify(get_smhi_timeseries(limit=24))
+    location = _requested_location()
+    return jsonify(get_smhi_timeseries(limit=24, lat=location["lat"], lon=location["lon"]))
+
+# ?range= values accepted by the history endpoints, in days
+HISTORY_RANGES = {
+    '24h': 1,
+    '2d': 2,
+    '4d': 4,
+    '1w': 7,
+    '1m': 30
+}
+
+def history_format(args):
+    """?format=compact[&encoding=f32] selects the columnar history format"""
+    compact = args.get('format') == 'compact'
+    encoding = 'f32' if args.get('encoding') == 'f32' else None
+    return compact, encoding
 
 @app.route("/api/history")
 def api_history():
-    from flask import request
     # Get range parameter (default to 1 day)
-    range_param = request.args.get('range', '24h')
-    
-    # Convert range to days
-    range_map = {
-        '24h': 1,
-        '2d': 2,
-        '4d': 4,
-        '1w': 7,
-        '1m': 30
-    }
-    
-    days = range_map.get(range_param, 1)
-    return jsonify(get_24h_history(days))
+    days = HISTORY_RANGES.get(request.args.get('range', '24h'), 1)
+    compact, encoding = history_format(request.args)
+    return jsonify(get_24h_history(days, compact=compact, encoding=encoding))
 
 @app.route("/api/indoor")
 def api_indoor():
@@ -103,286 +268,68 @@ def api_indoor():
 
 @app.route("/api/indoor-history")
 def api_indoor_history():
-    from flask import request
     # Get range parameter (default to 1 day)
-    range_param = request.args.get('range', '24h')
-    
-    # Convert range to days
-    range_map = {
-        '24h': 1,
-        '2d': 2,
-        '4d': 4,
-        '1w': 7,
-        '1m': 30
-    }
-    
-    days = range_map.get(range_param, 1)
-    return jsonify(get_indoor_24h_history(days))
+    days = HISTORY_RANGES.get(request.args.get('range', '24h'), 1)
+    compact, encoding = history_format(request.args)
+    return jsonify(get_indoor_24h_history(days, compact=compact, encoding=encoding))
 
 @app.route("/api/aurora")
 def api_aurora():
-    import requests
-    import math
+    # Precomputed by the background aurora engine
+    location = _requested_location()
+    return jsonify(aurora_engine.snapshot(location["id"]))
+
+@app.route("/api/aurora/history")
+def api_aurora_history():
+    location = _requested_location()
+    range_param = request.args.get('range')
+    if range_param is None:
+        # Last 24h of 5-minute samples kept in memory by the engine
+        return jsonify({"location": location["id"], "history": aurora_engine.history(location["id"])})
+
+    # Recorded inputs and scores from InfluxDB, aggregated like /api/history
+    days = HISTORY_RANGES.get(range_param, 1)
+    compact, encoding = history_format(request.args)
+    history = get_aurora_history(location["id"], days, compact=compact, encoding=encoding)
+    return jsonify(dict(history, location=location["id"]))
+
+@app.route("/api/aurora/forecast")
+def api_aurora_forecast():
+    """Hourly aurora visibility for the next ?hours= (default 24, max 48)"""
+    location = _requested_location()
+    hours = request.args.get('hours', FORECAST_HOURS, type=int)
+    hours = max(1, min(hours, MAX_FORECAST_HOURS))
     try:
-        # Check if it's daylight - aurora cannot be seen during daytime
-        sun_times = get_sun_times()
-        is_daylight = not sun_times.get('is_night', True)  # If not night, it's daylight
-        
-        # Fetch NOAA OVATION aurora forecast (updates every ~15 minutes)
-        ovation_response = requests.get('https://services.swpc.noaa.gov/json/ovation_aurora_latest.json', timeout=10)
-        ovation_data = ovation_response.json()
-        
-        # Find aurora probability for Ludvika (60.1°N, 15.2°E)
-        target_lat, target_lon = 60.1, 15.2
-        ovation_probability = 0
-        ovation_forecast_time = ovation_data.get('Forecast Time', '')
-        
-        # Find closest coordinate in OVATION model
-        if 'coordinates' in ovation_data:
-            closest = min(ovation_data['coordinates'], key=lambda c: abs(c[0]-target_lat) + abs(c[1]-target_lon))
-            ovation_probability = closest[2]  # Aurora probability percentage
-        
-        # Fetch NOAA space weather data
-        response = requests.get('https://services.swpc.noaa.gov/products/noaa-planetary-k-index.json', timeout=10)
-        kp_data = response.json()
-        
-        # Get latest KP index (last entry in the data)
-        if len(kp_data) > 1:
-            latest = kp_data[-1]
-            kp_index = float(latest[1])
-        else:
-            kp_index = 0
-        
-        # Fetch solar wind magnetic field data
-        mag_response = requests.get('https://services.swpc.noaa.gov/products/solar-wind/mag-1-day.json', timeout=10)
-        mag_data = mag_response.json()
-        
-        # Fetch solar wind plasma data (speed and density)
-        plasma_response = requests.get('https://services.swpc.noaa.gov/products/solar-wind/plasma-1-day.json', timeout=10)
-        plasma_data = plasma_response.json()
-        
-        solar_wind_speed = 0
-        bz_component = 0
-        bt_component = 0
-        density = 0
-        
-        # Get Bz and Bt from magnetic field data
-        # Format: ['time_tag', 'bx_gsm', 'by_gsm', 'bz_gsm', 'lon_gsm', 'lat_gsm', 'bt']
-        if len(mag_data) > 1:
-            latest_mag = mag_data[-1]
-            try:
-                bz_component = float(latest_mag[3]) if len(latest_mag) > 3 else 0  # bz_gsm
-                bt_component = float(latest_mag[6]) if len(latest_mag) > 6 else 0  # bt
-            except (ValueError, IndexError):
-                pass
-        
-        # Get speed and density from plasma data
-        # Format: ['time_tag', 'density', 'speed', 'temperature']
-        if len(plasma_data) > 1:
-            latest_plasma = plasma_data[-1]
-            try:
-                density = float(latest_plasma[1]) if len(latest_plasma) > 1 else 0      # density
-                solar_wind_speed = float(latest_plasma[2]) if len(latest_plasma) > 2 else 0  # speed
-            except (ValueError, IndexError):
-                pass
-        
-        # Get current weather conditions from SMHI
-        smhi_response = requests.get('https://opendata-download-metfcst.smhi.se/api/category/pmp3g/version/2/geotype/point/lon/15.1883/lat/60.1496/data.json', timeout=10)
-        smhi_data = smhi_response.json()
-        
-        cloud_coverage = 0
-        visibility_km = 10
-        precipitation = 0
-        
-        if smhi_data and 'timeSeries' in smhi_data and len(smhi_data['timeSeries']) > 0:
-            current_forecast = smhi_data['timeSeries'][0]
-            for param in current_forecast.get('parameters', []):
-                if param['name'] == 'tcc_mean':  # Total cloud cover (0-8 oktas)
-                    cloud_coverage = param['values'][0]
-                elif param['name'] == 'vis':  # Visibility in km
-                    visibility_km = param['values'][0]
-                elif param['name'] == 'pcat':  # Precipitation category
-                    precipitation = param['values'][0]
-        
-        # ADVANCED AURORA VISIBILITY CALCULATION
-        # Ludvika coordinates: 60.1°N, 15.2°E
-        # Magnetic latitude approximately 57-58°N
-        
-        # 1. Base probability from KP index (adjusted for magnetic latitude ~57°N)
-        if kp_index < 1:
-            base_prob = 5
-        elif kp_index < 2:
-            base_prob = 10 + (kp_index - 1) * 10
-        elif kp_index < 3:
-            base_prob = 20 + (kp_index - 2) * 10
-        elif kp_index < 4:
-            base_prob = 30 + (kp_index - 3) * 15
-        elif kp_index < 5:
-            base_prob = 45 + (kp_index - 4) * 15
-        elif kp_index < 6:
-            base_prob = 60 + (kp_index - 5) * 15
-        elif kp_index < 7:
-            base_prob = 75 + (kp_index - 6) * 10
-        else:
-            base_prob = min(98, 85 + (kp_index - 7) * 5)
-        
-        # 2. Bz component factor (southward Bz greatly increases probability)
-        bz_factor = 1.0
-        if bz_component < -5:
-            bz_factor = 1.4  # Strong southward, excellent
-        elif bz_component < -3:
-            bz_factor = 1.3
-        elif bz_component < -1:
-            bz_factor = 1.15
-        elif bz_component < 0:
-            bz_factor = 1.05
-        elif bz_component > 3:
-            bz_factor = 0.7  # Northward, suppresses aurora
-        elif bz_component > 0:
-            bz_factor = 0.85
-        
-        # 3. Solar wind speed factor (faster = more energy)
-        speed_factor = 1.0
-        if solar_wind_speed > 600:
-            speed_factor = 1.35  # Very fast, CME likely
-        elif solar_wind_speed > 500:
-            speed_factor = 1.2
-        elif solar_wind_speed > 450:
-            speed_factor = 1.1
-        elif solar_wind_speed > 400:
-            speed_factor = 1.05
-        elif solar_wind_speed < 300:
-            speed_factor = 0.85  # Slow, less energy
-        
-        # 4. Calculate dynamic pressure (indicates shock strength)
-        # P = ρ * v^2 (where ρ is density, v is speed)
-        dynamic_pressure = density * (solar_wind_speed ** 2) / 100000
-        pressure_factor = 1.0
-        if dynamic_pressure > 8:
-            pressure_factor = 1.15  # Strong compression
-        elif dynamic_pressure > 5:
-            pressure_factor = 1.08
-        elif dynamic_pressure < 2:
-            pressure_factor = 0.95
-        
-        # 5. Calculate geomagnetic probability
-        geomagnetic_prob = base_prob * bz_factor * speed_factor * pressure_factor
-        geomagnetic_prob = min(99, max(0, geomagnetic_prob))
-        
-        # 6. Weather visibility factor (clear skies needed!)
-        weather_factor = 1.0
-        weather_condition = "Unknown"
-        
-        # Check cloud coverage (0-8 oktas, where 8 = completely overcast)
-        if cloud_coverage <= 1:
-            weather_factor = 1.0
-            weather_condition = "Clear skies"
-        elif cloud_coverage <= 3:
-            weather_factor = 0.85
-            weather_condition = "Mostly clear"
-        elif cloud_coverage <= 5:
-            weather_factor = 0.5
-            weather_condition = "Partly cloudy"
-        elif cloud_coverage <= 7:
-            weather_factor = 0.2
-            weather_condition = "Mostly cloudy"
-        else:
-            weather_factor = 0.05
-            weather_condition = "Overcast"
-        
-        # Check visibility (fog, precipitation)
-        if visibility_km < 1:
-            weather_factor *= 0.1
-            weather_condition = "Fog/poor visibility"
-        elif visibility_km < 5:
-            weather_factor *= 0.5
-        
-        if precipitation > 0:  # Any precipitation
-            weather_factor *= 0.3
-            if precipitation == 1:
-                weather_condition = "Snow"
-            elif precipitation == 2:
-                weather_condition = "Snow/sleet mix"
-            elif precipitation == 3:
-                weather_condition = "Sleet"
-            elif precipitation == 4:
-                weather_condition = "Drizzle"
-            elif precipitation == 5:
-                weather_condition = "Rain"
-            elif precipitation == 6:
-                weather_condition = "Heavy rain"
-        
-        # Apply daylight factor (aurora cannot be seen during daytime)
-        if is_daylight:
-            weather_factor = 0.0
-            weather_condition = "Daylight (aurora not visible)"
-        
-        # 7. Final probability combining space weather and local weather
-        final_probability = geomagnetic_prob * weather_factor
-        final_probability = round(min(99, max(0, final_probability)), 0)
-        
-        # Determine activity level
-        if kp_index < 3:
-            activity = "Quiet"
-        elif kp_index < 5:
-            activity = "Unsettled"
-        elif kp_index < 7:
-            activity = "Active"
-        else:
-            activity = "Storm"
-        
-        # KP description
-        if kp_index < 2:
-            description = "Very Low Activity"
-        elif kp_index < 3:
-            description = "Low Activity"
-        elif kp_index < 4:
-            description = "Minor Storm"
-        elif kp_index < 5:
-            description = "Moderate Storm"
-        elif kp_index < 6:
-            description = "Strong Storm"
-        elif kp_index < 7:
-            description = "Severe Storm"
-        else:
-            description = "Extreme Storm"
-        
-        return jsonify({
-            'kp_index': round(kp_index, 1),
-            'description': description,
-            'probability': final_probability,
-            'ovation_probability': round(ovation_probability, 0),
-            'ovation_forecast_time': ovation_forecast_time,
-            'geomagnetic_probability': round(geomagnetic_prob, 0),
-            'weather_factor': round(weather_factor * 100, 0),
-            'weather_condition': weather_condition,
-            'activity': activity,
-            'solar_wind_speed': round(solar_wind_speed, 0),
-            'bz_component': round(bz_component, 1),
-            'cloud_coverage': cloud_coverage,
-            'visibility_km': round(visibility_km, 1),
-            'dynamic_pressure': round(dynamic_pressure, 2)
-        })
+        return jsonify(aurora_engine.forecast(location["id"], hours))
     except Exception as e:
-        print(f"Error fetching aurora data: {e}")
-        import traceback
-        traceback.print_exc()
-        return jsonify({
-            'kp_index': 0,
-            'description': 'Data Unavailable',
-            'probability': 0,
-            'ovation_probability': 0,
-            'ovation_forecast_time': '',
-            'geomagnetic_probability': 0,
-            'weather_factor': 0,
-            'weather_condition': 'Unknown',
-            'activity': 'Unknown',
-            'solar_wind_speed': 0,
-            'bz_component': 0,
-            'cloud_coverage': 0,
-            'visibility_km': 0,
-            'dynamic_pressure': 0
-        })
+        # NOAA or SMHI unreachable/malformed: a bad gateway, not an empty forecast
+        return jsonify({"error": f"Failed to build aurora forecast: {e}", "location": location["id"], "hours": []}), 502
+
+@app.route("/api/dashboard")
+def api_dashboard():
+    """All overview panels in one response, e.g. ?fields=current,indoor,aurora"""
+    location = _requested_location()
+    try:
+        fields = parse_fields(request.args.get('fields'))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify(build_dashboard(location, fields))
+
+@app.route("/api/stream")
+def api_stream():
+    """Server-Sent Events: snapshot on connect, then diffs whenever data changes"""
+    location = _requested_location()
+    subscriber = live_stream.subscribe(location)
+
+    def events():
+        try:
+            yield from subscriber.events()
+        finally:
+            live_stream.unsubscribe(subscriber)
+
+    response = Response(events(), mimetype="text/event-stream")
+    response.headers['X-Accel-Buffering'] = 'no'   # Don't let nginx buffer the stream
+    return response
 
 # ---------------------------------------------
 # WEB PUSH ENDPOINTS
@@ -406,38 +353,13 @@ def push_subscribe():
         if not subscription:
             return jsonify({"error": "No subscription data"}), 400
         
-        # Load existing subscriptions
-        subscriptions = []
-        if os.path.exists(SUBSCRIPTIONS_FILE):
-            with open(SUBSCRIPTIONS_FILE, 'r') as f:
-                subscriptions = json.load(f)
-        
-        # Check if subscription already exists (by endpoint)
-        endpoint = subscription.get('endpoint')
-        existing_idx = None
-        for idx, sub in enumerate(subscriptions):
-            if sub.get('subscription', {}).get('endpoint') == endpoint:
-                existing_idx = idx
-                break
-        
-        # Create subscription entry with settings
-        entry = {
-            'subscription': subscription,
-            'settings': settings
-        }
-        
-        if existing_idx is not None:
-            # Update existing subscription with new settings
-            subscriptions[existing_idx] = entry
-        else:
-            # Add new subscription
-            subscriptions.append(entry)
-            
-        # Save updated subscriptions
-        with open(SUBSCRIPTIONS_FILE, 'w') as f:
-            json.dump(subscriptions, f, indent=2)
+        if not subscription.get('endpoint'):
+            return jsonify({"error": "Subscription has no endpoint"}), 400
+
+        # One row per endpoint: re-subscribing updates its settings
+        subscription_id = subscription_store.upsert(subscription, settings)
         
-        return jsonify({"success": True, "message": "Subscription saved"})
+        return jsonify({"success": True, "message": "Subscription saved", "id": subscription_id})
     except Exception as e:
         print(f"Error saving subscription: {e}")
         return jsonify({"error": str(e)}), 500
@@ -446,17 +368,11 @@ def push_subscribe():
 def push_list_subscriptions():
     """List all active push subscriptions with their settings"""
     try:
-        if not os.path.exists(SUBSCRIPTIONS_FILE):
-            return jsonify({"subscriptions": []})
-        
-        with open(SUBSCRIPTIONS_FILE, 'r') as f:
-            subscriptions = json.load(f)
-        
         # Create simplified list with subscription info and settings
         subscription_list = []
-        for i, entry in enumerate(subscriptions):
-            subscription = entry.get('subscription', entry) if isinstance(entry, dict) else entry
-            settings = entry.get('settings', {}) if isinstance(entry, dict) else {}
+        for i, entry in enumerate(subscription_store.all()):
+            subscription = entry['subscription']
+            settings = entry['settings']
             
             # Count enabled notifications and include "once" info
             enabled_count = 0
@@ -483,7 +399,7 @@ def push_list_subscriptions():
                 device_name = f"Edge Device {i+1}"
             
             subscription_list.append({
-                "id": i,
+                "id": entry['id'],
                 "device_name": device_name,
                 "endpoint_preview": subscription.get('endpoint', '')[-50:] if subscription.get('endpoint') else 'unknown',
                 "enabled_notifications": enabled_count,
@@ -500,26 +416,13 @@ def push_list_subscriptions():
 def push_delete_subscription(subscription_id):
     """Delete a specific push subscription"""
     try:
-        if not os.path.exists(SUBSCRIPTIONS_FILE):
-            return jsonify({"error": "No subscriptions found"}), 404
-        
-        with open(SUBSCRIPTIONS_FILE, 'r') as f:
-            subscriptions = json.load(f)
-        
-        if subscription_id >= len(subscriptions) or subscription_id < 0:
+        if not subscription_store.delete(subscription_id):
             return jsonify({"error": "Subscription not found"}), 404
         
-        # Remove the subscription
-        removed_subscription = subscriptions.pop(subscription_id)
-        
-        # Save updated list
-        with open(SUBSCRIPTIONS_FILE, 'w') as f:
-            json.dump(subscriptions, f, indent=2)
-        
         return jsonify({
             "success": True, 
             "message": f"Subscription deleted successfully",
-            "remaining_count": len(subscriptions)
+            "remaining_count": subscription_store.count()
         })
     except Exception as e:
         print(f"Error deleting subscription: {e}")
@@ -527,54 +430,30 @@ def push_delete_subscription(subscription_id):
 
 @app.route("/api/push/send", methods=["POST"])
 def push_send():
-    """Send push notification to all subscribers"""
+    """Send push notification to all subscribers (concurrently, see push_dispatcher)"""
     try:
         data = request.json
         title = data.get('title', 'Weather Alert')
         body = data.get('body', 'Check your dashboard')
         
-        if not os.path.exists(SUBSCRIPTIONS_FILE):
+        subscriptions = subscription_store.all()
+        if not subscriptions:
             return jsonify({"error": "No subscriptions"}), 404
         
-        with open(SUBSCRIPTIONS_FILE, 'r') as f:
-            subscriptions = json.load(f)
-        
-        sent_count = 0
-        failed_endpoints = []
-        
-        for entry in subscriptions:
-            # Support both old format (just subscription) and new format (with settings)
-            subscription = entry.get('subscription', entry) if isinstance(entry, dict) else entry
-            
-            try:
-                success, message = send_web_push(
-                    subscription_info=subscription,
-                    title=title,
-                    body=body,
-                    private_key_path=VAPID_PRIVATE_KEY_PATH,
-                    vapid_subject=VAPID_CLAIMS["sub"]
-                )
-                
-                if success:
-                    sent_count += 1
-                    print(f"✓ Push sent: {title}")
-                else:
-                    print(f"✗ {message}")
-                    if "expired" in message.lower():
-                        failed_endpoints.append(subscription.get('endpoint'))
-            except Exception as e:
-                print(f"Push failed for {subscription.get('endpoint')}: {e}")
-        
+        summary = push_dispatcher.send([entry['subscription'] for entry in subscriptions], title, body)
+
         # Remove expired subscriptions
-        if failed_endpoints:
-            subscriptions = [s for s in subscriptions if s.get('endpoint') not in failed_endpoints]
-            with open(SUBSCRIPTIONS_FILE, 'w') as f:
-                json.dump(subscriptions, f, indent=2)
-        
+        expired = summary["expired"]
+        if expired:
+            subscription_store.delete_endpoints(expired)
+
         return jsonify({
             "success": True,
-            "sent": sent_count,
-            "failed": len(failed_endpoints)
+            "sent": summary["sent"],
+            "failed": summary["failed"],
+            "expired": len(expired),
+            # Endpoints are capability URLs; only their tail is shown, as in the list endpoint
+            "results": [dict(r, endpoint=r["endpoint"][-50:]) for r in summary["results"]]
         })
     except Exception as e:
         print(f"Error sending push: {e}")
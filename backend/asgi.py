@@ -0,0 +1,396 @@
+"""
+ASGI entry point for production serving
+
+The I/O-bound read endpoints below are served natively async: Influx
+queries go through InfluxDBClientAsync and SMHI fetches through httpx with
+a cap on concurrent requests per upstream host, so one slow upstream no
+longer ties up a worker thread per waiting client. /api/stream is served
+on the event loop too, so an open stream holds no thread. Every other
+route (static assets, push, health, ...) is the unchanged Flask app, run
+on a pool of WSGI_THREADS threads. Paths, parameters and JSON shapes are
+the same as app.py's, including ETag/304, compression and Server-Timing.
+
+Run with exactly one worker process; importing app.py starts the aurora
+engine, live stream and rollup task setup, which must not run twice:
+    gunicorn asgi:application -k uvicorn.workers.UvicornWorker -w 1 -b 0.0.0.0:5000
+    uvicorn asgi:application --host 0.0.0.0 --port 5000
+"""
+import asyncio
+import hashlib
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qsl
+
+from asgiref.sync import sync_to_async
+from asgiref.wsgi import WsgiToAsgi, WsgiToAsgiInstance
+from influxdb_client.client.influxdb_client_async import InfluxDBClientAsync
+from werkzeug.http import http_date, parse_accept_header, parse_date, parse_etags, quote_etag
+
+import influx
+import smhi
+from app import app as flask_app, API_MAX_AGE, HISTORY_RANGES, history_format, payload_last_modified
+from aurora import engine as aurora_engine
+from config import INFLUX_URL, INFLUX_TOKEN, INFLUX_ORG
+from dashboard import SECTIONS, parse_fields
+from live_stream import stream as live_stream, KEEPALIVE_SECONDS, RECONNECT_MS
+from locations import get_location
+from static_assets import MIN_COMPRESS_SIZE, choose_encoding, compress
+from upstream_async import upstream
+
+WSGI_THREADS = 16           # Flask requests (static, push, ...) served at once
+STREAM_POLL_SECONDS = 0.25  # How often an open /api/stream checks for new events
+
+_wsgi_pool = ThreadPoolExecutor(max_workers=WSGI_THREADS, thread_name_prefix="wsgi")
+
+
+class _PooledWsgiInstance(WsgiToAsgiInstance):
+    # WsgiToAsgi runs the app thread-sensitive, i.e. every request on one
+    # shared thread, so a single slow request stalls all others
+    run_wsgi_app = sync_to_async(WsgiToAsgiInstance.__dict__["run_wsgi_app"].func,
+                                 thread_sensitive=False, executor=_wsgi_pool)
+
+
+class PooledWsgiToAsgi(WsgiToAsgi):
+    """WsgiToAsgi serving requests concurrently from a thread pool"""
+
+    async def __call__(self, scope, receive, send):
+        await _PooledWsgiInstance(self.wsgi_application, self.duplicate_header_limit)(scope, receive, send)
+
+
+wsgi_app = PooledWsgiToAsgi(flask_app)
+
+
+class HTTPError(Exception):
+    def __init__(self, status, payload):
+        super().__init__(payload.get("error"))
+        self.status = status
+        self.payload = payload
+
+
+class Request:
+    """The bits of an ASGI HTTP scope the async handlers need"""
+
+    def __init__(self, scope):
+        self.method = scope["method"]
+        self.path = scope["path"]
+        query_string = scope.get("query_string", b"").decode("latin-1")
+        self.full_path = f"{self.path}?{query_string}"   # Same key as Flask's request.full_path
+        self.args = dict(parse_qsl(query_string))
+        self.headers = {k.decode("latin-1").lower(): v.decode("latin-1") for k, v in scope["headers"]}
+        self.timings = []
+
+    def location(self):
+        """Resolve ?location= to a registered site, or raise a 404"""
+        location = get_location(self.args.get("location"))
+        if location is None:
+            raise HTTPError(404, {"error": f"Unknown location: {self.args.get('location')}"})
+        return location
+
+
+# ------------------------------------------------------------
+# ASYNC INFLUX
+# ------------------------------------------------------------
+class AsyncInflux:
+    """Shared InfluxDBClientAsync; created on the event loop at startup"""
+
+    def __init__(self):
+        self._client = None
+
+    async def start(self):
+        if self._client is None:
+            self._client = InfluxDBClientAsync(
+                url=INFLUX_URL, token=INFLUX_TOKEN, org=INFLUX_ORG,
+                timeout=influx.INFLUX_TIMEOUT_MS,
+                connection_pool_maxsize=influx.INFLUX_POOL_SIZE,
+            )
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.close()
+            self._client = None
+
+    async def run(self, queries, timings):
+        """Run {label: flux} concurrently and return {label: tables}"""
+        await self.start()
+        query_api = self._client.query_api()
+
+        async def run_one(label, flux):
+            started = time.perf_counter()
+            try:
+                return label, await query_api.query(flux)
+            finally:
+                timings.append((label, (time.perf_counter() - started) * 1000))
+
+        return dict(await asyncio.gather(*(run_one(label, flux) for label, flux in queries.items())))
+
+
+db = AsyncInflux()
+
+
+# ------------------------------------------------------------
+# DATA SOURCES
+# ------------------------------------------------------------
+async def current_values(req):
+    return influx.parse_current(await db.run(influx.current_queries(), req.timings))
+
+
+async def indoor_values(req):
+    return influx.parse_indoor(await db.run(influx.indoor_queries(), req.timings))
+
+
+async def smhi_warnings(site):
+    try:
+        data = await upstream.get_json("smhi_warnings", smhi.SMHI_URL)
+    except Exception as e:
+        return {
+            "error": f"Failed to fetch SMHI warnings: {e}",
+            "warnings": []
+        }
+    return smhi.parse_warnings(data, site["region"])
+
+
+async def point_forecast(site):
+    # Cached as a parsed PointForecast, shared with the threaded code
+    url = smhi.SMHI_FORECAST_URL.format(lat=site["lat"], lon=site["lon"])
+    return await upstream.get_json("smhi_forecast", url, parse=smhi.PointForecast)
+
+
+async def smhi_forecast(site):
+    try:
+        return smhi.summarize_forecast(await point_forecast(site))
+    except Exception as e:
+        return {"error": f"Failed to fetch SMHI forecast: {e}"}
+
+
+# /api/dashboard sections; must cover dashboard.SECTIONS
+DASHBOARD_SECTIONS = {
+    "current": lambda req, site: current_values(req),
+    "indoor": lambda req, site: indoor_values(req),
+    # Incremental trackers and the aurora snapshot are in-memory, sync code
+    "minmax": lambda req, site: asyncio.to_thread(influx.get_minmax_24h),
+    "aurora": lambda req, site: asyncio.to_thread(aurora_engine.snapshot, site["id"]),
+    "forecast": lambda req, site: smhi_forecast(site),
+    "smhi": lambda req, site: smhi_warnings(site),
+    "sun": lambda req, site: asyncio.to_thread(smhi.get_sun_times, site["lat"], site["lon"]),
+}
+assert DASHBOARD_SECTIONS.keys() == SECTIONS.keys()
+
+
+# ------------------------------------------------------------
+# ROUTES
+# ------------------------------------------------------------
+async def api_current(req):
+    return await current_values(req)
+
+
+async def api_indoor(req):
+    return await indoor_values(req)
+
+
+async def api_history(req):
+    days = HISTORY_RANGES.get(req.args.get('range', '24h'), 1)
+    compact, encoding = history_format(req.args)
+    results = await db.run(influx.history_queries(days), req.timings)
+    return influx.parse_history(results, days, compact, encoding)
+
+
+async def api_indoor_history(req):
+    days = HISTORY_RANGES.get(req.args.get('range', '24h'), 1)
+    compact, encoding = history_format(req.args)
+    results = await db.run(influx.indoor_history_queries(days), req.timings)
+    return influx.parse_indoor_history(results, days, compact, encoding)
+
+
+async def api_smhi(req):
+    return await smhi_warnings(req.location())
+
+
+async def api_forecast(req):
+    return await smhi_forecast(req.location())
+
+
+async def api_forecast_24h(req):
+    try:
+        return smhi.summarize_timeseries(await point_forecast(req.location()), limit=24)
+    except HTTPError:
+        raise
+    except Exception as e:
+        return {"error": f"Failed to fetch SMHI timeseries: {e}", "timeSeries": [], "count": 0}
+
+
+async def api_dashboard(req):
+    site = req.location()
+    try:
+        fields = parse_fields(req.args.get('fields'))
+    except ValueError as e:
+        raise HTTPError(400, {"error": str(e)})
+
+    results = await asyncio.gather(
+        *(DASHBOARD_SECTIONS[name](req, site) for name in fields), return_exceptions=True
+    )
+    payload = {"location": site["id"]}
+    errors = {}
+    for name, value in zip(fields, results):
+        if isinstance(value, Exception):
+            print(f"Dashboard section {name} failed: {value}")
+            errors[name] = str(value)
+        else:
+            payload[name] = value
+    if errors:
+        payload["errors"] = errors
+    return payload
+
+
+ASYNC_ROUTES = {
+    "/api/current": api_current,
+    "/api/indoor": api_indoor,
+    "/api/history": api_history,
+    "/api/indoor-history": api_indoor_history,
+    "/api/smhi": api_smhi,
+    "/api/forecast": api_forecast,
+    "/api/forecast-24h": api_forecast_24h,
+    "/api/dashboard": api_dashboard,
+}
+
+
+# ------------------------------------------------------------
+# RESPONSES (mirrors app.py's after_request handling)
+# ------------------------------------------------------------
+def _not_modified(req, etag, last_modified):
+    if_none_match = req.headers.get("if-none-match")
+    if if_none_match:
+        return parse_etags(if_none_match).contains_weak(etag)
+    if_modified_since = parse_date(req.headers.get("if-modified-since"))
+    return if_modified_since is not None and if_modified_since >= last_modified
+
+
+async def _send_json(send, req, payload, status=200):
+    body = flask_app.json.dumps(payload, separators=(",", ":")).encode("utf-8") + b"\n"
+    headers = [("Content-Type", "application/json"), ("Access-Control-Allow-Origin", "*")]
+    if req.timings:
+        headers.append(("Server-Timing", ", ".join(f"{label};dur={ms:.1f}" for label, ms in req.timings)))
+
+    max_age = API_MAX_AGE.get(req.path)
+    if status == 200 and max_age is not None:
+        # Weak, since the same payload may be sent gzip/br encoded
+        etag = hashlib.sha1(body).hexdigest()
+        last_modified = payload_last_modified(req.full_path, etag)
+        headers += [
+            ("ETag", quote_etag(etag, weak=True)),
+            ("Last-Modified", http_date(last_modified)),
+            ("Cache-Control", f"public, max-age={max_age}, must-revalidate"),
+        ]
+        if _not_modified(req, etag, last_modified):
+            status, body = 304, b""
+    else:
+        headers += [
+            ("Cache-Control", "no-store, no-cache, must-revalidate, max-age=0"),
+            ("Pragma", "no-cache"),
+            ("Expires", "0"),
+        ]
+
+    if status == 200 and len(body) >= MIN_COMPRESS_SIZE:
+        headers.append(("Vary", "Accept-Encoding"))
+        encoding = choose_encoding(parse_accept_header(req.headers.get("accept-encoding")))
+        if encoding is not None:
+            body = compress(body, encoding, level=5 if encoding == 'br' else 6)
+            headers.append(("Content-Encoding", encoding))
+
+    headers.append(("Content-Length", str(len(body))))
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [(k.lower().encode("latin-1"), v.encode("latin-1")) for k, v in headers],
+    })
+    await send({"type": "http.response.body", "body": b"" if req.method == "HEAD" else body})
+
+
+async def _handle(handler, scope, send):
+    req = Request(scope)
+    try:
+        payload, status = await handler(req), 200
+    except HTTPError as e:
+        payload, status = e.payload, e.status
+    except Exception as e:
+        print(f"Error serving {req.path}: {e}")
+        traceback.print_exc()
+        payload, status = {"error": str(e)}, 500
+    await _send_json(send, req, payload, status)
+
+
+# ------------------------------------------------------------
+# LIVE STREAM
+# ------------------------------------------------------------
+async def _disconnected(receive):
+    while (await receive())["type"] != "http.disconnect":
+        pass
+
+
+async def api_stream(scope, receive, send):
+    """Server-Sent Events, as app.py's /api/stream, without holding a thread"""
+    req = Request(scope)
+    try:
+        location = req.location()
+    except HTTPError as e:
+        return await _send_json(send, req, e.payload, e.status)
+
+    subscriber = live_stream.subscribe(location)
+    disconnect = asyncio.ensure_future(_disconnected(receive))
+    try:
+        await send({
+            "type": "http.response.start",
+            "status": 200,
+            "headers": [
+                (b"content-type", b"text/event-stream; charset=utf-8"),
+                (b"cache-control", b"no-cache"),
+                (b"x-accel-buffering", b"no"),   # Don't let nginx buffer the stream
+                (b"access-control-allow-origin", b"*"),
+            ],
+        })
+        chunk, idle = f"retry: {RECONNECT_MS}\n\n", 0.0
+        while not subscriber.dropped:
+            chunk += subscriber.pending()
+            if not chunk and idle >= KEEPALIVE_SECONDS:
+                chunk = ": keepalive\n\n"
+            if chunk:
+                await send({"type": "http.response.body", "body": chunk.encode("utf-8"), "more_body": True})
+                chunk, idle = "", 0.0
+            done, _ = await asyncio.wait([disconnect], timeout=STREAM_POLL_SECONDS)
+            if done:
+                return
+            idle += STREAM_POLL_SECONDS
+        # Fell too far behind: end the response, EventSource reconnects
+        await send({"type": "http.response.body", "body": b""})
+    finally:
+        disconnect.cancel()
+        live_stream.unsubscribe(subscriber)
+
+
+async def _lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            await upstream.start()
+            await db.start()
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            await upstream.close()
+            await db.close()
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+
+async def application(scope, receive, send):
+    if scope["type"] == "lifespan":
+        return await _lifespan(receive, send)
+
+    if scope["type"] == "http" and scope["method"] == "GET" and scope["path"] == "/api/stream":
+        return await api_stream(scope, receive, send)
+
+    if scope["type"] == "http" and scope["method"] in ("GET", "HEAD"):
+        handler = ASYNC_ROUTES.get(scope["path"])
+        if handler is not None:
+            return await _handle(handler, scope, send)
+
+    return await wsgi_app(scope, receive, send)
@@ -0,0 +1,522 @@
+"""
+Aurora visibility model and background computation engine
+See AURORA_ALGORITHM.md for the scoring model
+"""
+import atexit
+import threading
+import time
+import traceback
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait
+from datetime import datetime, timezone
+
+import numpy as np
+
+import aurora_model
+from upstream_cache import cache, fetch_json, get_json
+from ovation import get_grid
+from solar_wind import SolarWindBuffer, MEAN_SECONDS, parse_time_tag
+from smhi import SMHI_FORECAST_URL, calculate_sun_times, get_point_forecast
+from locations import all_locations, DEFAULT_LOCATION
+from influx import write_aurora_samples
+
+OVATION_URL = "https://services.swpc.noaa.gov/json/ovation_aurora_latest.json"
+KP_URL = "https://services.swpc.noaa.gov/products/noaa-planetary-k-index.json"
+KP_FORECAST_URL = "https://services.swpc.noaa.gov/products/noaa-planetary-k-index-forecast.json"
+
+# Refresh interval per upstream feed (seconds)
+FEED_INTERVALS = {
+    "ovation": 900,
+    "kp": 60,
+    "solar_wind_mag": 60,
+    "solar_wind_plasma": 60,
+}
+RETRY_INTERVAL = 30       # Retry a failed feed sooner than its normal schedule
+TICK_SECONDS = 15         # Scheduler resolution
+RECOMPUTE_SECONDS = 60    # Re-score at least this often (daylight, SMHI forecast)
+HISTORY_INTERVAL = 300    # One history sample every 5 minutes
+HISTORY_SIZE = 288        # 24 hours of samples
+LOCATION_WORKERS = 4      # Worker threads for per-site scoring
+FEED_WORKERS = 6          # Worker threads for concurrent feed/forecast fetches
+FEED_DEADLINE = 12        # Seconds a refresh waits for fetches before scoring with what it has
+FIRST_RESULT_WAIT = 2     # Seconds a request before the first refresh waits for its result
+WRITE_INTERVAL = 300      # Recorded inputs/scores are written to InfluxDB in batches this often
+MAX_PENDING_SAMPLES = 2000  # Unwritten samples kept while InfluxDB is unreachable
+SAMPLE_GRID = 60          # Recorded samples are stamped on this grid (seconds)
+FORECAST_HOURS = 24       # Default length of /api/aurora/forecast
+MAX_FORECAST_HOURS = 48   # SMHI's hourly steps end a little after this
+SOLAR_WIND_HOURS = 1      # Measured L1 solar wind only says something about the next hour
+KP_INTERVAL = 3 * 3600    # Each Kp value covers the 3 hours from its time_tag
+
+UNAVAILABLE = {
+    'kp_index': 0,
+    'description': 'Data Unavailable',
+    'probability': 0,
+    'ovation_probability': 0,
+    'ovation_forecast_time': '',
+    'geomagnetic_probability': 0,
+    'weather_factor': 0,
+    'weather_condition': 'Unknown',
+    'activity': 'Unknown',
+    'solar_wind_speed': 0,
+    'bz_component': 0,
+    'cloud_coverage': 0,
+    'visibility_km': 0,
+    'dynamic_pressure': 0,
+    'stale_inputs': [],
+}
+
+
+# ------------------------------------------------------------
+# FEED PARSERS
+# ------------------------------------------------------------
+def parse_kp(data):
+    """Latest planetary KP index (last entry in the data)"""
+    if len(data) > 1:
+        return {"kp_index": float(data[-1][1])}
+    return {"kp_index": 0}
+
+
+def parse_kp_forecast(data):
+    """Observed, estimated and predicted 3-hourly Kp as (start timestamps, kp, kinds)
+    Format: ['time_tag', 'kp', 'observed', 'noaa_scale']
+    """
+    header = data[0]
+    time_col, kp_col, kind_col = header.index("time_tag"), header.index("kp"), header.index("observed")
+    starts, kp, kinds = [], [], []
+    for row in data[1:]:
+        try:
+            start, value = parse_time_tag(row[time_col]), float(row[kp_col])
+        except (TypeError, ValueError):
+            continue
+        starts.append(start)
+        kp.append(value)
+        kinds.append(row[kind_col])
+    return np.array(starts), np.array(kp), kinds
+
+
+def _smoothed(buffer, key):
+    """30-minute mean, falling back to the latest value (NaN, i.e. unknown,
+    while the buffer has none)"""
+    value = buffer.mean(key)
+    if value is None:
+        value = buffer.latest(key)
+    return value if value is not None else np.nan
+
+
+def _rounded(value, digits=1):
+    """Rounded value, or None if it is missing or NaN (unknown)"""
+    return round(value, digits) if value is not None and value == value else None
+
+
+def parse_mag(buffer, data):
+    """Add magnetic field rows to `buffer`; model inputs are smoothed Bz/Bt
+    Format: ['time_tag', 'bx_gsm', 'by_gsm', 'bz_gsm', 'lon_gsm', 'lat_gsm', 'bt']
+    """
+    buffer.ingest(data)
+    return {
+        "bz_component": _smoothed(buffer, "bz"),
+        "bt_component": _smoothed(buffer, "bt"),
+        "mag_stats": {
+            "bz_latest": _rounded(buffer.latest("bz")),
+            "bz_mean_30m": _rounded(buffer.mean("bz", MEAN_SECONDS)),
+            "bt_latest": _rounded(buffer.latest("bt")),
+            "mag_time": buffer.newest_time(),
+        },
+    }
+
+
+def parse_plasma(buffer, data):
+    """Add plasma rows to `buffer`; model inputs are smoothed speed/density
+    Format: ['time_tag', 'density', 'speed', 'temperature']
+    """
+    buffer.ingest(data)
+    return {
+        "solar_wind_speed": _smoothed(buffer, "speed"),
+        "density": _smoothed(buffer, "density"),
+        "plasma_stats": {
+            "speed_latest": _rounded(buffer.latest("speed"), 0),
+            "speed_mean_30m": _rounded(buffer.mean("speed", MEAN_SECONDS), 0),
+            "density_latest": _rounded(buffer.latest("density")),
+            "density_mean_30m": _rounded(buffer.mean("density", MEAN_SECONDS)),
+            "plasma_time": buffer.newest_time(),
+        },
+    }
+
+
+# ------------------------------------------------------------
+# SCORING MODEL
+# ------------------------------------------------------------
+def compute_aurora(kp_index, bz_component, solar_wind_speed, density,
+                   cloud_coverage, visibility_km, precipitation, is_daylight,
+                   ovation_probability=0, ovation_forecast_time=''):
+    """Combine space weather and local weather into the aurora response dict"""
+    # One element of the vectorized model (aurora_model.score)
+    scored = {k: v.item() for k, v in aurora_model.score(
+        kp_index, bz_component, solar_wind_speed, density,
+        cloud_coverage, visibility_km, precipitation, is_daylight,
+    ).items()}
+
+    return {
+        'kp_index': round(kp_index, 1),
+        'description': scored['description'],
+        'probability': scored['probability'],
+        'ovation_probability': round(ovation_probability, 0),
+        'ovation_forecast_time': ovation_forecast_time,
+        'geomagnetic_probability': round(scored['geomagnetic_probability'], 0),
+        'weather_factor': round(scored['weather_factor'] * 100, 0),
+        'weather_condition': scored['weather_condition'],
+        'activity': scored['activity'],
+        'solar_wind_speed': _rounded(solar_wind_speed, 0),
+        'bz_component': _rounded(bz_component, 1),
+        'cloud_coverage': cloud_coverage,
+        'visibility_km': _rounded(visibility_km, 1),
+        'dynamic_pressure': _rounded(scored['dynamic_pressure'], 2)
+    }
+
+
+def score_site(site, inputs, forecast, when=None):
+    """Score one site from parsed feed inputs and its SMHI PointForecast (or None)
+
+    Pure apart from the clock: `when` (aware datetime, default now) decides
+    daylight, so replays of recorded data are reproducible. Solar wind that
+    has never been fetched is NaN, which the model scores as neutral.
+    """
+    # Check if it's daylight - aurora cannot be seen during daytime
+    sun_times = calculate_sun_times(site["lat"], site["lon"], when)
+    is_daylight = not sun_times.get('is_night', True)
+
+    def weather(name, default):
+        return forecast.value(name, default=default) if forecast is not None else np.nan
+
+    grid = inputs.get("ovation_grid")
+    result = compute_aurora(
+        kp_index=inputs["kp_index"],
+        bz_component=inputs.get("bz_component", np.nan),
+        solar_wind_speed=inputs.get("solar_wind_speed", np.nan),
+        density=inputs.get("density", np.nan),
+        cloud_coverage=weather('tcc_mean', 0),   # Total cloud cover (0-8 oktas)
+        visibility_km=weather('vis', 10),        # Visibility in km
+        precipitation=weather('pcat', 0),        # Precipitation category
+        is_daylight=is_daylight,
+        ovation_probability=grid.probability(site["lat"], site["lon"]) if grid else 0,
+        ovation_forecast_time=grid.forecast_time if grid else '',
+    )
+    if forecast is None:
+        # No SMHI forecast cached (first start, or SMHI down): the sky is
+        # unknown, so nothing is reported as visible
+        result.update(probability=0, weather_factor=0, weather_condition='Unknown',
+                      cloud_coverage=None, visibility_km=None)
+    result['solar_wind'] = {**inputs.get("mag_stats", {}), **inputs.get("plasma_stats", {})}
+    return result
+
+
+def forecast_curve(site, inputs, kp_forecast, forecast, now=None, hours=FORECAST_HOURS):
+    """Hourly visibility curve, scored for every hour in one model call
+
+    Each SMHI forecast hour is paired with the predicted Kp interval that
+    contains it (`kp_forecast` is the raw NOAA JSON). Measured solar wind is
+    only used for the first SOLAR_WIND_HOURS; later hours score it as
+    unknown (neutral factors). `now` is a UTC timestamp (default: now).
+    """
+    kp_starts, kp_values, kp_kinds = parse_kp_forecast(kp_forecast)
+    now = now or time.time()
+    times = np.array([datetime.fromisoformat(t.replace("Z", "+00:00")).timestamp() for t in forecast.times])
+    # From the current hour on, as far as both forecasts reach (no hours
+    # without a Kp forecast)
+    kp_end = kp_starts[-1] + KP_INTERVAL if len(kp_starts) else -np.inf
+    rows = np.flatnonzero((times > now - 3600) & (times < kp_end))[:hours]
+    times = times[rows]
+    kp_rows = np.maximum(np.searchsorted(kp_starts, times, side="right") - 1, 0)
+
+    def column(name, default):
+        values = forecast.columns.get(name) or [None] * len(forecast)
+        return np.array([default if v is None else v for v in values], dtype=np.float64)[rows]
+
+    def measured(name):
+        return np.where(times - now < SOLAR_WIND_HOURS * 3600, inputs.get(name, np.nan), np.nan)
+
+    cloud_coverage = column('tcc_mean', 0)
+    is_daylight = np.array([
+        not calculate_sun_times(site["lat"], site["lon"], datetime.fromtimestamp(t, timezone.utc))["is_night"]
+        for t in times
+    ], dtype=bool)
+    scored = aurora_model.score(
+        kp_index=kp_values[kp_rows],
+        bz_component=measured("bz_component"),
+        solar_wind_speed=measured("solar_wind_speed"),
+        density=measured("density"),
+        cloud_coverage=cloud_coverage,
+        visibility_km=column('vis', 10),
+        precipitation=column('pcat', 0),
+        is_daylight=is_daylight,
+    )
+
+    columns = zip(
+        rows.tolist(), kp_rows.tolist(),
+        scored['probability'].tolist(),
+        np.round(scored['geomagnetic_probability'], 0).tolist(),
+        np.round(scored['weather_factor'] * 100, 0).tolist(),
+        scored['weather_condition'].tolist(),
+        cloud_coverage.tolist(), is_daylight.tolist(),
+    )
+    return {
+        "location": site["id"],
+        "generated": datetime.fromtimestamp(now, timezone.utc).isoformat(),
+        "hours": [{
+            "time": forecast.times[row],
+            "kp_index": round(float(kp_values[kp_row]), 1),
+            "kp_type": kp_kinds[kp_row],
+            "probability": probability,
+            "geomagnetic_probability": geomagnetic,
+            "weather_factor": weather,
+            "weather_condition": condition,
+            "cloud_coverage": clouds,
+            "is_daylight": daylight,
+        } for row, kp_row, probability, geomagnetic, weather, condition, clouds, daylight in columns],
+    }
+
+
+# ------------------------------------------------------------
+# BACKGROUND ENGINE
+# ------------------------------------------------------------
+class AuroraEngine:
+    """
+    Refreshes each NOAA feed on its own schedule in a background thread and
+    keeps the latest scored result plus a rolling history per location, so
+    /api/aurora only has to return a precomputed snapshot.
+
+    The OVATION grid, Kp and solar wind feeds are fetched once and shared by
+    every site; each site adds one SMHI point forecast. All due fetches run
+    concurrently with an overall deadline: anything still running then keeps
+    going in the background, and scoring proceeds with the last known values,
+    listed in the result's `stale_inputs`. Per-site scoring runs in a small
+    worker pool.
+    """
+
+    def __init__(self, locations=None, intervals=None,
+                 history_size=HISTORY_SIZE, workers=LOCATION_WORKERS):
+        self.locations = locations or all_locations()
+        # Solar wind is read incrementally into ring buffers; their url()
+        # picks the smallest NOAA product covering the gap since the last read
+        self.mag = SolarWindBuffer("mag", {"bz_gsm": "bz", "bt": "bt"})
+        self.plasma = SolarWindBuffer("plasma", {"speed": "speed", "density": "density"})
+        self.feeds = {
+            "ovation": (OVATION_URL, lambda data: {"ovation_grid": get_grid(data)}),
+            "kp": (KP_URL, parse_kp),
+            "solar_wind_mag": (self.mag.url, lambda data: parse_mag(self.mag, data)),
+            "solar_wind_plasma": (self.plasma.url, lambda data: parse_plasma(self.plasma, data)),
+        }
+        self.intervals = dict(FEED_INTERVALS, **(intervals or {}))
+        self._inputs = {}
+        self._next_due = {name: 0 for name in self.feeds}
+        self._fresh = {name: False for name in self.feeds}   # Last fetch attempt succeeded
+        self._pending = {}          # feed name or ("smhi_forecast", site id) -> future
+        self._dirty = False         # A feed updated since the last score
+        self._latest = {}
+        self._computed_at = 0
+        self._history = {site["id"]: deque(maxlen=history_size) for site in self.locations}
+        self._samples = deque(maxlen=MAX_PENDING_SAMPLES)   # Waiting for the next batched write
+        self._flushed_at = time.time()
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="aurora-site")
+        self._fetch_pool = ThreadPoolExecutor(max_workers=FEED_WORKERS, thread_name_prefix="aurora-feed")
+        self._thread = None
+        self._stop = threading.Event()
+        self._first_refresh = threading.Event()   # Set once the first refresh has finished
+
+    # ---------- Feeds ----------
+    def _refresh_feed(self, name):
+        url = self.feeds[name][0]
+        try:
+            url = url() if callable(url) else url
+            data = fetch_json(url)
+            cache.put(name, url, data)
+            self.ingest(name, data)
+            self._next_due[name] = time.time() + self.intervals[name]
+            return True
+        except Exception as e:
+            print(f"Error refreshing aurora feed {name}: {e}")
+            with self._lock:
+                self._fresh[name] = False
+            self._next_due[name] = time.time() + min(RETRY_INTERVAL, self.intervals[name])
+            return False
+
+    def ingest(self, name, data):
+        """Parse one feed's JSON into the model inputs"""
+        parsed = self.feeds[name][1](data)
+        with self._lock:
+            self._inputs.update(parsed)
+            self._fresh[name] = True
+            self._dirty = True
+
+    def _running(self, key):
+        pending = self._pending.get(key)
+        return pending is not None and not pending.done()
+
+    def _submit(self, key, fn, *args):
+        """Start a fetch unless the previous one for `key` is still running"""
+        if self._running(key):
+            return self._pending[key]
+        future = self._pending[key] = self._fetch_pool.submit(fn, *args)
+        return future
+
+    def refresh(self, force=False):
+        """Fetch every due feed (and each site's SMHI forecast) concurrently,
+        then re-score if anything changed"""
+        with self._refresh_lock:
+            now = time.time()
+            futures = [
+                self._submit(name, self._refresh_feed, name)
+                for name in self.feeds
+                if force or now >= self._next_due[name]
+            ]
+            # Warms the shared SMHI cache; a no-op while it is fresh
+            futures += [
+                self._submit(("smhi_forecast", site["id"]), get_point_forecast, site["lat"], site["lon"])
+                for site in self.locations
+            ]
+            _, not_done = wait(futures, timeout=FEED_DEADLINE)
+            if not_done:
+                print(f"Aurora refresh: {len(not_done)} fetch(es) missed the {FEED_DEADLINE}s deadline")
+
+            with self._lock:
+                updated, self._dirty = self._dirty, False
+            try:
+                if updated or force or now - self._computed_at >= RECOMPUTE_SECONDS:
+                    self.recompute()
+            finally:
+                self._first_refresh.set()
+
+    # ---------- Scoring ----------
+    def _score_location(self, site, inputs, stale):
+        try:
+            # Current weather conditions from the site's SMHI point forecast.
+            # Never blocks: refresh() fetches it, scoring uses whatever is cached
+            state, forecast = cache.lookup(
+                "smhi_forecast", SMHI_FORECAST_URL.format(lat=site["lat"], lon=site["lon"]))
+            stale = list(stale)
+            if state != "fresh":
+                stale.append("smhi_forecast")
+            result = score_site(site, inputs, forecast)
+            result['stale_inputs'] = stale
+            return result
+        except Exception as e:
+            print(f"Error computing aurora probability for {site['id']}: {e}")
+            traceback.print_exc()
+            return None
+
+    def recompute(self):
+        with self._lock:
+            inputs = dict(self._inputs)
+            # Feeds whose latest fetch failed or is still running score with
+            # their previous value (or as unknown if there is none)
+            stale = [name for name in self.feeds
+                     if not self._fresh[name] or self._running(name)]
+        if "kp_index" not in inputs:
+            return None
+
+        results = list(self._pool.map(lambda site: self._score_location(site, inputs, stale), self.locations))
+
+        now = time.time()
+        updated = datetime.now(timezone.utc).isoformat()
+        # Stamped on a fixed grid, so re-scores within one grid step (from
+        # this or any other process) overwrite one point per site instead of
+        # adding interleaved ones
+        sample_time = datetime.fromtimestamp(now // SAMPLE_GRID * SAMPLE_GRID, timezone.utc)
+        with self._lock:
+            self._computed_at = now
+            for site, result in zip(self.locations, results):
+                if result is None:
+                    continue
+                result['location'] = site["id"]
+                result['updated'] = updated
+                self._latest[site["id"]] = result
+                self._samples.append((site["id"], sample_time, {
+                    "probability": result['probability'],
+                    "geomagnetic_probability": result['geomagnetic_probability'],
+                    "ovation_probability": result['ovation_probability'],
+                    "kp_index": result['kp_index'],
+                    "bz_component": inputs.get("bz_component"),
+                    "bt_component": inputs.get("bt_component"),
+                    "solar_wind_speed": inputs.get("solar_wind_speed"),
+                    "density": inputs.get("density"),
+                    "cloud_coverage": result['cloud_coverage'],
+                }))
+                history = self._history[site["id"]]
+                if not history or now - history[-1]["ts"] >= HISTORY_INTERVAL:
+                    history.append({
+                        "ts": now,
+                        "time": updated,
+                        "probability": result['probability'],
+                        "geomagnetic_probability": result['geomagnetic_probability'],
+                        "ovation_probability": result['ovation_probability'],
+                        "kp_index": result['kp_index'],
+                    })
+        self._flush_samples()
+        return results
+
+    def _flush_samples(self, force=False):
+        """Write buffered samples to InfluxDB in one batch every WRITE_INTERVAL"""
+        with self._lock:
+            if not self._samples or (not force and time.time() - self._flushed_at < WRITE_INTERVAL):
+                return
+            samples = list(self._samples)
+            self._samples.clear()
+            self._flushed_at = time.time()
+        try:
+            write_aurora_samples(samples)
+        except Exception as e:
+            print(f"Error writing aurora samples: {e}")
+            with self._lock:
+                # Retry with the next batch, dropping the oldest if over the limit
+                self._samples = deque(samples + list(self._samples), maxlen=MAX_PENDING_SAMPLES)
+
+    # ---------- Public API ----------
+    def snapshot(self, location_id=DEFAULT_LOCATION):
+        """Latest result. Never fetches: before the first refresh has finished
+        it waits up to FIRST_RESULT_WAIT, then reports the site as unavailable"""
+        latest = self._latest.get(location_id)
+        if latest is None and self._first_refresh.wait(FIRST_RESULT_WAIT):
+            latest = self._latest.get(location_id)
+        return latest if latest is not None else dict(UNAVAILABLE, stale_inputs=list(self.feeds))
+
+    def inputs(self):
+        """Copy of the current parsed model inputs"""
+        with self._lock:
+            return dict(self._inputs)
+
+    def history(self, location_id=DEFAULT_LOCATION):
+        with self._lock:
+            return [{k: v for k, v in h.items() if k != "ts"}
+                    for h in self._history.get(location_id, ())]
+
+    def forecast(self, location_id=DEFAULT_LOCATION, hours=FORECAST_HOURS):
+        """Hourly visibility curve for a site (see forecast_curve)"""
+        site = next(s for s in self.locations if s["id"] == location_id)
+        kp_forecast = get_json("kp_forecast", KP_FORECAST_URL)
+        point_forecast = get_point_forecast(site["lat"], site["lon"])
+        return forecast_curve(site, self.inputs(), kp_forecast, point_forecast, hours=hours)
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.refresh()
+            except Exception as e:
+                print(f"Aurora engine error: {e}")
+            self._stop.wait(TICK_SECONDS)
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="aurora-engine", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._flush_samples(force=True)
+
+
+engine = AuroraEngine()
+atexit.register(engine.stop)    # Write any buffered samples
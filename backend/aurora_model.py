@@ -0,0 +1,158 @@
+"""
+Vectorized aurora visibility model
+Each step of the model is a piecewise function over NumPy arrays
+(np.select/np.where), so one call scores a single "now" or a whole hourly
+forecast. Thresholds and branch order are exactly those of the original
+scalar if/elif chain; see AURORA_ALGORITHM.md.
+
+Inputs broadcast against each other. NaN inputs fail every comparison and
+take the fall-through branch, just as they would in scalar Python, which
+is how unknown solar wind scores neutral (factor 1.0) in forecasts.
+"""
+import numpy as np
+
+PRECIPITATION_CONDITIONS = {
+    1: "Snow",
+    2: "Snow/sleet mix",
+    3: "Sleet",
+    4: "Drizzle",
+    5: "Rain",
+    6: "Heavy rain",
+}
+
+
+def _array(values):
+    return np.asarray(values, dtype=np.float64)
+
+
+# ------------------------------------------------------------
+# SPACE WEATHER
+# ------------------------------------------------------------
+def kp_base_probability(kp):
+    """Base probability (%) from Kp, tuned for magnetic latitude ~57°N"""
+    return np.select(
+        [kp < 1, kp < 2, kp < 3, kp < 4, kp < 5, kp < 6, kp < 7],
+        [
+            5,
+            10 + (kp - 1) * 10,
+            20 + (kp - 2) * 10,
+            30 + (kp - 3) * 15,
+            45 + (kp - 4) * 15,
+            60 + (kp - 5) * 15,
+            75 + (kp - 6) * 10,
+        ],
+        default=np.minimum(98, 85 + (kp - 7) * 5),
+    )
+
+
+def bz_factor(bz):
+    """Southward Bz strengthens aurora, northward suppresses it"""
+    return np.select(
+        [bz < -5, bz < -3, bz < -1, bz < 0, bz > 3, bz > 0],
+        [1.4, 1.3, 1.15, 1.05, 0.7, 0.85],
+        default=1.0,
+    )
+
+
+def speed_factor(speed):
+    """Faster solar wind carries more energy"""
+    return np.select(
+        [speed > 600, speed > 500, speed > 450, speed > 400, speed < 300],
+        [1.35, 1.2, 1.1, 1.05, 0.85],
+        default=1.0,
+    )
+
+
+def dynamic_pressure(density, speed):
+    """P = ρ * v^2, scaled to roughly nPa"""
+    return density * (speed ** 2) / 100000
+
+
+def pressure_factor(pressure):
+    return np.select(
+        [pressure > 8, pressure > 5, pressure < 2],
+        [1.15, 1.08, 0.95],
+        default=1.0,
+    )
+
+
+# ------------------------------------------------------------
+# LOCAL WEATHER
+# ------------------------------------------------------------
+def weather_factor(cloud_coverage, visibility_km, precipitation, is_daylight):
+    """Fraction of the geomagnetic probability that is visible, and why
+
+    Returns (factor, condition) arrays.
+    """
+    # Cloud coverage in oktas (8 = completely overcast)
+    clouds = [cloud_coverage <= 1, cloud_coverage <= 3, cloud_coverage <= 5, cloud_coverage <= 7]
+    factor = np.select(clouds, [1.0, 0.85, 0.5, 0.2], default=0.05)
+    condition = np.select(
+        clouds, ["Clear skies", "Mostly clear", "Partly cloudy", "Mostly cloudy"], default="Overcast"
+    ).astype(object)
+
+    # Fog, then any precipitation
+    fog = visibility_km < 1
+    factor = factor * np.select([fog, visibility_km < 5], [0.1, 0.5], default=1.0)
+    condition = np.where(fog, "Fog/poor visibility", condition)
+
+    wet = precipitation > 0
+    factor = np.where(wet, factor * 0.3, factor)
+    for category, name in PRECIPITATION_CONDITIONS.items():
+        condition = np.where(wet & (precipitation == category), name, condition)
+
+    # Aurora cannot be seen during daytime
+    factor = np.where(is_daylight, 0.0, factor)
+    condition = np.where(is_daylight, "Daylight (aurora not visible)", condition)
+    return factor, condition
+
+
+# ------------------------------------------------------------
+# LABELS
+# ------------------------------------------------------------
+def activity_level(kp):
+    return np.select([kp < 3, kp < 5, kp < 7], ["Quiet", "Unsettled", "Active"], default="Storm").astype(object)
+
+
+def kp_description(kp):
+    return np.select(
+        [kp < 2, kp < 3, kp < 4, kp < 5, kp < 6, kp < 7],
+        ["Very Low Activity", "Low Activity", "Minor Storm", "Moderate Storm", "Strong Storm", "Severe Storm"],
+        default="Extreme Storm",
+    ).astype(object)
+
+
+# ------------------------------------------------------------
+# MODEL
+# ------------------------------------------------------------
+def score(kp_index, bz_component, solar_wind_speed, density,
+          cloud_coverage, visibility_km, precipitation, is_daylight):
+    """Evaluate the full model elementwise
+
+    Returns a dict of arrays (unrounded): geomagnetic_probability,
+    probability, weather_factor, weather_condition, activity, description,
+    dynamic_pressure.
+    """
+    kp = _array(kp_index)
+    bz = _array(bz_component)
+    speed = _array(solar_wind_speed)
+    pressure = dynamic_pressure(_array(density), speed)
+
+    geomagnetic = kp_base_probability(kp) * bz_factor(bz) * speed_factor(speed) * pressure_factor(pressure)
+    geomagnetic = np.clip(geomagnetic, 0, 99)
+
+    factor, condition = weather_factor(
+        _array(cloud_coverage), _array(visibility_km), _array(precipitation),
+        np.asarray(is_daylight, dtype=bool),
+    )
+    probability = np.round(np.clip(geomagnetic * factor, 0, 99), 0)
+
+    return {
+        'geomagnetic_probability': geomagnetic,
+        'probability': probability,
+        'weather_factor': factor,
+        'weather_condition': condition,
+        'activity': activity_level(kp),
+        'description': kp_description(kp),
+        'dynamic_pressure': pressure,
+    }
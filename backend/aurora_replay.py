@@ -0,0 +1,278 @@
+#!/usr/bin/env python3
+"""
+Record/replay harness and benchmark for the aurora model.
+`record` captures every NOAA and SMHI document the model reads into a
+fixture directory, together with the results scored from them. `replay`
+re-scores those fixtures offline with the clock fixed at the recording
+time and diffs the output, so model changes show up as explicit
+differences. `bench` measures model evaluations per second and the
+latency of the aurora endpoints through the Flask test client, with
+every upstream fetch answered from the fixtures.
+
+Usage:
+    python3 aurora_replay.py record <dir>              # fetch feeds, save fixtures + expected results
+    python3 aurora_replay.py replay <dir> [--update]   # re-score fixtures and diff (or overwrite) expected
+    python3 aurora_replay.py bench <dir> [seconds]     # evaluations/s and endpoint latency (default 2s each)
+"""
+import json
+import os
+import sys
+import time
+from datetime import datetime, timezone
+
+import aurora
+import aurora_model
+import smhi
+import upstream_cache
+from aurora import AuroraEngine, KP_FORECAST_URL, KP_URL, OVATION_URL, compute_aurora, forecast_curve, score_site
+from locations import all_locations
+from solar_wind import PRODUCT_URL
+from smhi import SMHI_FORECAST_URL, SMHI_URL, PointForecast
+
+MANIFEST = "manifest.json"
+EXPECTED = "expected.json"
+
+# Fixture name -> URL it was recorded from. Solar wind is recorded as the
+# 1-day product, which replay feeds to the buffers like a first fill.
+SHARED_FEEDS = {
+    "ovation": OVATION_URL,
+    "kp": KP_URL,
+    "solar_wind_mag": PRODUCT_URL.format(kind="mag", window="1-day"),
+    "solar_wind_plasma": PRODUCT_URL.format(kind="plasma", window="1-day"),
+    "kp_forecast": KP_FORECAST_URL,
+    "smhi_warnings": SMHI_URL,
+}
+
+# Endpoints timed by `bench`; none of them touch InfluxDB
+BENCH_ENDPOINTS = [
+    "/api/aurora",
+    "/api/aurora/forecast",
+    "/api/aurora/forecast?hours=48",
+    "/api/forecast",
+    "/api/dashboard?fields=aurora,forecast,smhi,sun",
+]
+
+
+def fixture_urls(sites):
+    urls = dict(SHARED_FEEDS)
+    for site in sites:
+        urls[f"smhi_forecast_{site['id']}"] = SMHI_FORECAST_URL.format(lat=site["lat"], lon=site["lon"])
+    return urls
+
+
+# ------------------------------------------------------------
+# FIXTURES
+# ------------------------------------------------------------
+def record(directory):
+    """Fetch every upstream document once and save it with the scores it gives"""
+    os.makedirs(directory, exist_ok=True)
+    sites = all_locations()
+    urls = fixture_urls(sites)
+    fixtures = {}
+    for name, url in urls.items():
+        print(f"Fetching {name}: {url}")
+        fixtures[name] = upstream_cache.fetch_json(url)
+        with open(os.path.join(directory, f"{name}.json"), "w") as f:
+            json.dump(fixtures[name], f)
+
+    manifest = {"recorded_at": time.time(), "sites": sites, "urls": urls}
+    with open(os.path.join(directory, MANIFEST), "w") as f:
+        json.dump(manifest, f, indent=2)
+
+    save_expected(directory, evaluate(fixtures, manifest["recorded_at"], sites))
+    print(f"✅ Recorded {len(fixtures)} fixtures to {directory}")
+
+
+def load(directory):
+    """(manifest, {fixture name: parsed JSON}); sites come from the manifest, not config.py"""
+    with open(os.path.join(directory, MANIFEST)) as f:
+        manifest = json.load(f)
+    fixtures = {}
+    for name in manifest["urls"]:
+        with open(os.path.join(directory, f"{name}.json")) as f:
+            fixtures[name] = json.load(f)
+    manifest.setdefault("sites", all_locations())
+    return manifest, fixtures
+
+
+def save_expected(directory, results):
+    with open(os.path.join(directory, EXPECTED), "w") as f:
+        json.dump(results, f, indent=2, sort_keys=True)
+
+
+# ------------------------------------------------------------
+# REPLAY
+# ------------------------------------------------------------
+def model_inputs(fixtures):
+    """Parsed model inputs, built by the same feed parsers the engine uses"""
+    engine = AuroraEngine()
+    for name in engine.feeds:
+        engine.ingest(name, fixtures[name])
+    return engine.inputs()
+
+
+def evaluate(fixtures, recorded_at, sites):
+    """Score every site's snapshot and hourly forecast at the recording time"""
+    inputs = model_inputs(fixtures)
+    # Aware UTC, so daylight doesn't depend on the replaying host's timezone
+    when = datetime.fromtimestamp(recorded_at, timezone.utc)
+    results = {"snapshot": {}, "forecast": {}}
+    for site in sites:
+        point = PointForecast(fixtures[f"smhi_forecast_{site['id']}"])
+        results["snapshot"][site["id"]] = score_site(site, inputs, point, when=when)
+        results["forecast"][site["id"]] = forecast_curve(
+            site, inputs, fixtures["kp_forecast"], point, now=recorded_at, hours=aurora.MAX_FORECAST_HOURS)
+    # Compare what the API would serialize
+    return json.loads(json.dumps(results))
+
+
+def diff(expected, actual, path=""):
+    """Human-readable differences between two JSON values"""
+    if isinstance(expected, dict) and isinstance(actual, dict):
+        lines = []
+        for key in sorted(expected.keys() | actual.keys()):
+            if key not in actual:
+                lines.append(f"{path}/{key}: missing")
+            elif key not in expected:
+                lines.append(f"{path}/{key}: unexpected {actual[key]!r}")
+            else:
+                lines += diff(expected[key], actual[key], f"{path}/{key}")
+        return lines
+    if isinstance(expected, list) and isinstance(actual, list):
+        if len(expected) != len(actual):
+            return [f"{path}: {len(expected)} entries, got {len(actual)}"]
+        return [line for i, (e, a) in enumerate(zip(expected, actual)) for line in diff(e, a, f"{path}[{i}]")]
+    return [] if expected == actual else [f"{path}: expected {expected!r}, got {actual!r}"]
+
+
+def replay(directory, update=False):
+    manifest, fixtures = load(directory)
+    results = evaluate(fixtures, manifest["recorded_at"], manifest["sites"])
+    if update:
+        save_expected(directory, results)
+        print(f"✅ Updated {os.path.join(directory, EXPECTED)}")
+        return True
+
+    with open(os.path.join(directory, EXPECTED)) as f:
+        expected = json.load(f)
+    lines = diff(expected, results)
+    for line in lines[:50]:
+        print(line)
+    if len(lines) > 50:
+        print(f"... {len(lines) - 50} more")
+    if lines:
+        print(f"❌ {len(lines)} difference(s) from the recorded results")
+        return False
+    print("✅ Replay matches the recorded results")
+    return True
+
+
+# ------------------------------------------------------------
+# BENCHMARK
+# ------------------------------------------------------------
+def _rate(fn, seconds):
+    """Calls per second of fn() over roughly `seconds`"""
+    calls, started = 0, time.perf_counter()
+    deadline = started + seconds
+    while time.perf_counter() < deadline:
+        fn()
+        calls += 1
+    return calls / (time.perf_counter() - started)
+
+
+def _percentile(values, pct):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+
+def stub_upstreams(manifest, fixtures):
+    """Answer every upstream fetch from the fixtures instead of the network"""
+    by_url = {url: fixtures[name] for name, url in manifest["urls"].items()}
+
+    def fetch_json(url, timeout=None):
+        if url in by_url:
+            return by_url[url]
+        # Solar wind buffers ask for whichever product covers their gap
+        for kind in ("mag", "plasma"):
+            if f"/solar-wind/{kind}-" in url:
+                return fixtures[f"solar_wind_{kind}"]
+        raise RuntimeError(f"No fixture for {url}")
+
+    upstream_cache.fetch_json = fetch_json
+    aurora.fetch_json = fetch_json
+    smhi.fetch_json = fetch_json
+
+
+def bench_model(fixtures, recorded_at, site, seconds):
+    inputs = model_inputs(fixtures)
+    when = datetime.fromtimestamp(recorded_at, timezone.utc)
+    point = PointForecast(fixtures[f"smhi_forecast_{site['id']}"])
+    args = dict(
+        kp_index=inputs["kp_index"], bz_component=inputs["bz_component"],
+        solar_wind_speed=inputs["solar_wind_speed"], density=inputs["density"],
+        cloud_coverage=point.value("tcc_mean", default=0), visibility_km=point.value("vis", default=10),
+        precipitation=point.value("pcat", default=0), is_daylight=False,
+    )
+    hours = len(forecast_curve(site, inputs, fixtures["kp_forecast"], point,
+                               now=recorded_at, hours=aurora.MAX_FORECAST_HOURS)["hours"])
+
+    print("Model")
+    rate = _rate(lambda: compute_aurora(**args), seconds)
+    print(f"  compute_aurora         {rate:12,.0f} evaluations/s")
+    rate = _rate(lambda: score_site(site, inputs, point, when=when), seconds)
+    print(f"  score_site             {rate:12,.0f} evaluations/s")
+    batch = {k: [v] * 1000 for k, v in args.items()}
+    rate = _rate(lambda: aurora_model.score(**batch), seconds) * 1000
+    print(f"  aurora_model.score     {rate:12,.0f} evaluations/s (batches of 1000)")
+    rate = _rate(lambda: forecast_curve(site, inputs, fixtures["kp_forecast"], point,
+                                        now=recorded_at, hours=aurora.MAX_FORECAST_HOURS), seconds)
+    print(f"  forecast_curve         {rate:12,.0f} curves/s ({hours} hours each)")
+
+
+def bench_endpoints(seconds):
+    # Imported late: importing app starts the aurora engine, which must
+    # already be talking to the stubs
+    from app import app, aurora_engine
+
+    # Benchmark scores must not end up in the recorded aurora history
+    aurora.write_aurora_samples = lambda samples: None
+    aurora_engine.refresh(force=True)
+    client = app.test_client()
+    print("Endpoints (Flask test client, stubbed upstreams)")
+    for path in BENCH_ENDPOINTS:
+        latencies = []
+        deadline = time.perf_counter() + seconds
+        while time.perf_counter() < deadline:
+            started = time.perf_counter()
+            response = client.get(path)
+            latencies.append((time.perf_counter() - started) * 1000)
+            if response.status_code != 200:
+                print(f"  {path}: HTTP {response.status_code}")
+                break
+        print(f"  {path:48} p50 {_percentile(latencies, 50):7.2f} ms  "
+              f"p95 {_percentile(latencies, 95):7.2f} ms  ({len(latencies)} requests)")
+    aurora_engine.stop()
+
+
+def bench(directory, seconds=2.0):
+    manifest, fixtures = load(directory)
+    stub_upstreams(manifest, fixtures)
+    bench_model(fixtures, manifest["recorded_at"], manifest["sites"][0], seconds)
+    bench_endpoints(seconds)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 3:
+        print(__doc__)
+        sys.exit(1)
+
+    command, directory = sys.argv[1], sys.argv[2]
+    if command == "record":
+        record(directory)
+    elif command == "replay":
+        sys.exit(0 if replay(directory, update="--update" in sys.argv[3:]) else 1)
+    elif command == "bench":
+        bench(directory, float(sys.argv[3]) if len(sys.argv) > 3 else 2.0)
+    else:
+        print(__doc__)
+        sys.exit(1)
@@ -5,6 +5,13 @@ INFLUX_URL = "http://localhost:8086"
 INFLUX_TOKEN = "your-influxdb-token-here"
 INFLUX_ORG = "your-org"
 INFLUX_BUCKET = "your-bucket"
+INFLUX_POOL_SIZE = 10        # Max pooled HTTP connections shared by all threads
+INFLUX_TIMEOUT_MS = 10000    # Per-query timeout
+# Bucket for pre-aggregated 1h/2h/4h/12h history (None = read raw data)
+# Run `python3 downsampling.py backfill` once after enabling
+INFLUX_ROLLUP_BUCKET = None
+# Measurement the aurora engine records its inputs and scores to
+MEASUREMENT_AURORA = "aurora"
 
 # Location for weather data (Ludvika, Sweden example)
 LATITUDE = 60.1495
@@ -21,3 +28,13 @@ FIELD_TEMP_INDOOR = "temperature"
 FIELD_HUMIDITY_INDOOR = "humidity"
 FIELD_CO2 = "eco2"
 FIELD_TVOC = "tvoc"
+
+# Sites served by this backend (?location=<id> on forecast, sun, aurora, warnings)
+# `region` is matched against SMHI warning areas
+LOCATIONS = {
+    "ludvika": {"name": "Ludvika", "lat": 60.1496, "lon": 15.1883, "region": "Dalarna"},
+}
+DEFAULT_LOCATION = "ludvika"
+
+# Async serving (asgi.py): max concurrent requests per SMHI/NOAA host
+UPSTREAM_CONCURRENCY = 4
@@ -0,0 +1,64 @@
+"""
+Batch builder for /api/dashboard
+Runs the requested sections (Influx queries and cached upstream reads)
+concurrently and returns them in one payload, keyed by section name.
+"""
+from concurrent.futures import ThreadPoolExecutor
+
+from influx import (get_current_values, get_indoor_values, get_minmax_24h,
+                    pop_query_timings, record_query_timings)
+from smhi import get_smhi_warnings, get_sun_times, get_smhi_forecast
+from aurora import engine as aurora_engine
+
+DASHBOARD_WORKERS = 8
+
+# section -> builder(location)
+SECTIONS = {
+    "current": lambda site: get_current_values(),
+    "indoor": lambda site: get_indoor_values(),
+    "minmax": lambda site: get_minmax_24h(),
+    "aurora": lambda site: aurora_engine.snapshot(site["id"]),
+    "forecast": lambda site: get_smhi_forecast(site["lat"], site["lon"]),
+    "smhi": lambda site: get_smhi_warnings(site["region"]),
+    "sun": lambda site: get_sun_times(site["lat"], site["lon"]),
+}
+
+_pool = ThreadPoolExecutor(max_workers=DASHBOARD_WORKERS, thread_name_prefix="dashboard")
+
+
+def parse_fields(value):
+    """Field mask from "?fields=a,b"; all sections when empty. Raises ValueError on unknown names"""
+    if not value:
+        return list(SECTIONS)
+    fields = list(dict.fromkeys(f.strip() for f in value.split(",") if f.strip()))
+    unknown = [f for f in fields if f not in SECTIONS]
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(unknown)} (available: {', '.join(SECTIONS)})")
+    return fields
+
+
+def _build(name, site):
+    """Run one section on a worker; returns (value, error, influx timings)"""
+    pop_query_timings()
+    try:
+        return SECTIONS[name](site), None, pop_query_timings()
+    except Exception as e:
+        print(f"Dashboard section {name} failed: {e}")
+        return None, str(e), pop_query_timings()
+
+
+def build_dashboard(site, fields):
+    """{section: payload} for the requested sections; failed ones go under "errors" """
+    futures = {name: _pool.submit(_build, name, site) for name in fields}
+    result = {"location": site["id"]}
+    errors = {}
+    for name, future in futures.items():
+        value, error, timings = future.result()
+        record_query_timings(timings)
+        if error is None:
+            result[name] = value
+        else:
+            errors[name] = error
+    if errors:
+        result["errors"] = errors
+    return result
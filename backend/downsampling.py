@@ -0,0 +1,302 @@
+#!/usr/bin/env python3
+"""
+Downsampled history rollups in InfluxDB.
+One Influx task per chart window (1h/2h/4h/12h) writes pre-aggregated means
+of sensor and recorded aurora data into a rollup bucket, so history charts read a handful of points per window
+instead of re-aggregating raw 10-second data on every request.
+
+Usage:
+    python3 downsampling.py setup            # create bucket + tasks
+    python3 downsampling.py backfill [days]  # fill rollups from raw data (default 30)
+    python3 downsampling.py check            # check that rollups and raw data meet at the cutoff (offline)
+"""
+import re
+import sys
+from datetime import datetime, timezone
+from influxdb_client.domain.task_create_request import TaskCreateRequest
+from config import INFLUX_ORG, INFLUX_BUCKET, MEASUREMENT_OUTDOOR, FIELD_TEMP, FIELD_HUMID, FIELD_PRESS
+
+try:
+    from config import INFLUX_ROLLUP_BUCKET
+except ImportError:
+    INFLUX_ROLLUP_BUCKET = None   # Rollups disabled; history reads raw data
+
+try:
+    from config import MEASUREMENT_AURORA
+except ImportError:
+    MEASUREMENT_AURORA = "aurora"
+
+# Chart windows used by get_24h_history / get_indoor_24h_history / get_aurora_history
+ROLLUP_WINDOWS = ["1h", "2h", "4h", "12h"]
+
+# Raw data newer than this (plus the current window) is read directly,
+# giving the tasks time to run after each window closes
+TASK_OFFSET = "1m"
+RECENT_GRACE = "5m"
+
+INDOOR_FIELDS = [
+    "temperature_indoor", "humidity_indoor", "pressure_indoor",
+    "temperature", "humidity", "pressure", "eco2", "tvoc",
+]
+
+# Written by the aurora engine, one series per `location` tag
+AURORA_FIELDS = [
+    "probability", "geomagnetic_probability", "ovation_probability", "kp_index",
+    "bz_component", "bt_component", "solar_wind_speed", "density", "cloud_coverage",
+]
+
+
+def rollups_enabled():
+    return bool(INFLUX_ROLLUP_BUCKET)
+
+
+def _field_filter(fields):
+    return " or\n       ".join(f'r._field == "{f}"' for f in fields)
+
+
+# ------------------------------------------------------------
+# RAW PIPELINES (shared by tasks, backfill and the live tail)
+# ------------------------------------------------------------
+def outdoor_raw_flux(start, stop=None, bucket=INFLUX_BUCKET):
+    """Outdoor temperature (min-dedup) and humidity/pressure (last-dedup) at 10s"""
+    stop_arg = f", stop: {stop}" if stop else ""
+    return f'''
+temp = from(bucket: "{bucket}")
+  |> range(start: {start}{stop_arg})
+  |> filter(fn: (r) => r._measurement == "{MEASUREMENT_OUTDOOR}")
+  |> filter(fn: (r) => r._field == "{FIELD_TEMP}")
+  |> aggregateWindow(every: 10s, fn: min, createEmpty: false)
+
+other = from(bucket: "{bucket}")
+  |> range(start: {start}{stop_arg})
+  |> filter(fn: (r) => r._measurement == "{MEASUREMENT_OUTDOOR}")
+  |> filter(fn: (r) =>
+       r._field == "{FIELD_HUMID}" or
+       r._field == "{FIELD_PRESS}")
+  |> aggregateWindow(every: 10s, fn: last, createEmpty: false)
+
+outdoor = union(tables: [temp, other])
+'''
+
+
+def indoor_raw_flux(start, stop=None, bucket=INFLUX_BUCKET):
+    stop_arg = f", stop: {stop}" if stop else ""
+    return f'''
+indoor = from(bucket: "{bucket}")
+  |> range(start: {start}{stop_arg})
+  |> filter(fn: (r) => r._measurement == "{MEASUREMENT_OUTDOOR}")
+  |> filter(fn: (r) =>
+       {_field_filter(INDOOR_FIELDS)})
+'''
+
+
+def aurora_raw_flux(start, stop=None, bucket=INFLUX_BUCKET):
+    stop_arg = f", stop: {stop}" if stop else ""
+    return f'''
+aurora = from(bucket: "{bucket}")
+  |> range(start: {start}{stop_arg})
+  |> filter(fn: (r) => r._measurement == "{MEASUREMENT_AURORA}")
+'''
+
+
+# rollup_set -> (raw pipeline, stream it defines, measurement)
+RAW_SOURCES = {
+    "outdoor": (outdoor_raw_flux, "outdoor", MEASUREMENT_OUTDOOR),
+    "indoor": (indoor_raw_flux, "indoor", MEASUREMENT_OUTDOOR),
+    "aurora": (aurora_raw_flux, "aurora", MEASUREMENT_AURORA),
+}
+
+
+def _rollup_write_flux(window, start, stop):
+    """Aggregate raw data in [start, stop) into `window` means and write them"""
+    return f'''
+{outdoor_raw_flux(start, stop)}
+{indoor_raw_flux(start, stop)}
+{aurora_raw_flux(start, stop)}
+outdoor
+  |> aggregateWindow(every: {window}, fn: mean, createEmpty: false)
+  |> set(key: "rollup", value: "{window}")
+  |> set(key: "rollup_set", value: "outdoor")
+  |> to(bucket: "{INFLUX_ROLLUP_BUCKET}", org: "{INFLUX_ORG}")
+
+indoor
+  |> aggregateWindow(every: {window}, fn: mean, createEmpty: false)
+  |> set(key: "rollup", value: "{window}")
+  |> set(key: "rollup_set", value: "indoor")
+  |> to(bucket: "{INFLUX_ROLLUP_BUCKET}", org: "{INFLUX_ORG}")
+
+aurora
+  |> aggregateWindow(every: {window}, fn: mean, createEmpty: false)
+  |> set(key: "rollup", value: "{window}")
+  |> set(key: "rollup_set", value: "aurora")
+  |> to(bucket: "{INFLUX_ROLLUP_BUCKET}", org: "{INFLUX_ORG}")
+'''
+
+
+def task_name(window):
+    return f"rollup_{MEASUREMENT_OUTDOOR}_{window}"
+
+
+def task_flux(window):
+    return f'''import "date"
+
+option task = {{name: "{task_name(window)}", every: {window}, offset: {TASK_OFFSET}}}
+
+stop = date.truncate(t: now(), unit: {window})
+start = date.sub(d: {window}, from: stop)
+{_rollup_write_flux(window, "start", "stop")}'''
+
+
+# ------------------------------------------------------------
+# READ SIDE
+# ------------------------------------------------------------
+def location_filter(location):
+    """Flux filter step for one aurora site (empty for sensor data)"""
+    return f'\n  |> filter(fn: (r) => r.location == "{location}")' if location else ""
+
+
+def history_flux(rollup_set, window, start, fields, location=None, now=None):
+    """
+    Rolled-up history for `fields`: completed windows come from the rollup
+    bucket, the still-open window(s) are aggregated from raw data.
+    Returns a Flux script whose result has _time, _field and _value columns.
+    `now` (aware datetime) fixes the clock, for check_history_bounds().
+    """
+    raw_flux, raw_stream, measurement = RAW_SOURCES[rollup_set]
+    now_expr = now.astimezone(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ") if now else "now()"
+    # Rollup points are stamped with their window's stop, so the one at
+    # `cutoff` covers [cutoff - window, cutoff): read it (stop is exclusive)
+    return f'''import "date"
+
+cutoff = date.truncate(t: date.sub(d: {RECENT_GRACE}, from: {now_expr}), unit: {window})
+
+rolled = from(bucket: "{INFLUX_ROLLUP_BUCKET}")
+  |> range(start: {start}, stop: date.add(d: 1ns, to: cutoff))
+  |> filter(fn: (r) => r._measurement == "{measurement}")
+  |> filter(fn: (r) => r.rollup == "{window}" and r.rollup_set == "{rollup_set}")
+  |> filter(fn: (r) =>
+       {_field_filter(fields)}){location_filter(location)}
+{raw_flux("cutoff")}
+recent = {raw_stream}
+  |> filter(fn: (r) =>
+       {_field_filter(fields)}){location_filter(location)}
+  |> aggregateWindow(every: {window}, fn: mean, createEmpty: false)
+
+union(tables: [rolled, recent])
+  |> keep(columns: ["_time", "_field", "_value"])
+'''
+
+
+def _duration_ns(duration):
+    """Flux duration literal such as "5m" or "12h" in nanoseconds"""
+    units = {"ns": 1, "s": 10**9, "m": 60 * 10**9, "h": 3600 * 10**9, "d": 86400 * 10**9}
+    return sum(int(n) * units[u] for n, u in re.findall(r"(\d+)(ns|s|m|h|d)", duration))
+
+
+def check_history_bounds(now, windows=ROLLUP_WINDOWS):
+    """
+    Build history_flux() for a fixed `now` and check that the last rollup
+    it reads ends exactly where its raw tail starts (no gap, no overlap).
+    Evaluates the range bounds of the generated Flux offline; returns a
+    list of problems (empty if every window is contiguous).
+    """
+    problems = []
+    now_ns = int(now.timestamp()) * 10**9
+    for window in windows:
+        flux = history_flux("outdoor", window, "-1d", [FIELD_TEMP], now=now)
+        w = _duration_ns(window)
+        cutoff = (now_ns - _duration_ns(RECENT_GRACE)) // w * w
+
+        # The only expressions history_flux uses for range bounds
+        bounds = {"cutoff": cutoff, "date.add(d: 1ns, to: cutoff)": cutoff + 1}
+        rolled = re.search(r"rolled = .*?range\(start: [^,]+, stop: (.+?)\)\n", flux, re.S)
+        raw_starts = re.findall(r"range\(start: (\w+)\)", flux.split("rolled = ", 1)[1])
+        if not rolled or rolled.group(1) not in bounds or not raw_starts:
+            problems.append(f"{window}: unrecognised range bounds in history_flux")
+            continue
+        rolled_stop = bounds[rolled.group(1)]
+
+        # Rollups are stamped with their window's stop: the last one read is
+        # the newest multiple of the window before rolled_stop, and it ends there
+        last_rollup_end = (rolled_stop - 1) // w * w
+        for raw_start in raw_starts:
+            if bounds.get(raw_start) != last_rollup_end:
+                gap = ((bounds.get(raw_start) or 0) - last_rollup_end) / 1e9
+                problems.append(f"{window}: rollups end at {last_rollup_end // 10**9}, "
+                                f"raw data starts at {raw_start} ({gap:+.0f}s)")
+    return problems
+
+
+# ------------------------------------------------------------
+# MANAGEMENT
+# ------------------------------------------------------------
+def ensure_rollups(client):
+    """Create the rollup bucket and one task per window (idempotent)"""
+    if not rollups_enabled():
+        return False
+
+    buckets_api = client.buckets_api()
+    if buckets_api.find_bucket_by_name(INFLUX_ROLLUP_BUCKET) is None:
+        print(f"Creating rollup bucket {INFLUX_ROLLUP_BUCKET}")
+        buckets_api.create_bucket(bucket_name=INFLUX_ROLLUP_BUCKET, org=INFLUX_ORG)
+
+    tasks_api = client.tasks_api()
+    org_id = client.organizations_api().find_organizations(org=INFLUX_ORG)[0].id
+    for window in ROLLUP_WINDOWS:
+        flux = task_flux(window)
+        existing = tasks_api.find_tasks(name=task_name(window))
+        if existing:
+            task = existing[0]
+            if task.flux != flux:
+                task.flux = flux
+                tasks_api.update_task(task)
+                print(f"Updated rollup task {task.name}")
+        else:
+            # The script carries its own `option task` (with offset), so
+            # create it directly rather than via create_task_every()
+            tasks_api.create_task(task_create_request=TaskCreateRequest(
+                flux=flux, org_id=org_id, status="active",
+                description=f"Downsample {MEASUREMENT_OUTDOOR} and {MEASUREMENT_AURORA} to {window} means",
+            ))
+            print(f"Created rollup task {task_name(window)}")
+    return True
+
+
+def backfill(client, days=30):
+    """Populate rollups for the last `days` days from raw data"""
+    q = client.query_api()
+    for window in ROLLUP_WINDOWS:
+        print(f"Backfilling {window} rollup for {days}d...")
+        q.query(f'''import "date"
+
+stop = date.truncate(t: now(), unit: {window})
+start = date.sub(d: {days}d, from: stop)
+{_rollup_write_flux(window, "start", "stop")}''')
+    print("✅ Backfill complete")
+
+
+if __name__ == "__main__":
+    command = sys.argv[1] if len(sys.argv) > 1 else "setup"
+    if command == "check":
+        fixed_now = datetime(2024, 1, 15, 12, 3, 27, tzinfo=timezone.utc)
+        problems = check_history_bounds(fixed_now)
+        for problem in problems:
+            print(f"❌ {problem}")
+        if not problems:
+            print(f"✅ Rollups and raw data are contiguous for {', '.join(ROLLUP_WINDOWS)}")
+        sys.exit(1 if problems else 0)
+
+    from influx import _client
+
+    if not rollups_enabled():
+        print("Set INFLUX_ROLLUP_BUCKET in config.py to enable rollups")
+        sys.exit(1)
+
+    with _client() as client:
+        if command == "setup":
+            ensure_rollups(client)
+        elif command == "backfill":
+            backfill(client, int(sys.argv[2]) if len(sys.argv) > 2 else 30)
+        else:
+            print(__doc__)
+            sys.exit(1)
@@ -1,14 +1,158 @@
 from datetime import datetime, timezone, timedelta
-from influxdb_client import InfluxDBClient
+from contextlib import contextmanager
+from influxdb_client import InfluxDBClient, Point
+from influxdb_client.client.write_api import SYNCHRONOUS
 from config import (
     INFLUX_URL, INFLUX_TOKEN, INFLUX_ORG, INFLUX_BUCKET,
     MEASUREMENT_OUTDOOR, FIELD_TEMP, FIELD_HUMID, FIELD_PRESS
 )
+from array import array
+import atexit
+import base64
+import downsampling
+from minmax_tracker import SlidingMinMax
 import math
+import sys
+import threading
+import time
 
+try:
+    from config import INFLUX_POOL_SIZE
+except ImportError:
+    INFLUX_POOL_SIZE = 10
 
+try:
+    from config import INFLUX_TIMEOUT_MS
+except ImportError:
+    INFLUX_TIMEOUT_MS = 10000
+
+
+# ------------------------------------------------------------
+# SHARED CLIENT MANAGER
+# ------------------------------------------------------------
+class InfluxClientManager:
+    """Process-wide InfluxDB client with a pooled, keep-alive HTTP connection.
+
+    The underlying urllib3 pool is thread safe, so Flask worker threads and the
+    notification checker all share one client instead of opening a new TCP
+    connection per query.
+    """
+
+    def __init__(self, url, token, org, pool_size=10, timeout_ms=10000):
+        self.url = url
+        self.token = token
+        self.org = org
+        self.pool_size = pool_size
+        self.timeout_ms = timeout_ms
+        self._client = None
+        self._lock = threading.Lock()
+        self._last_health = None
+
+    def get(self):
+        """Return the shared client, creating it on first use"""
+        client = self._client
+        if client is None:
+            with self._lock:
+                if self._client is None:
+                    self._client = InfluxDBClient(
+                        url=self.url,
+                        token=self.token,
+                        org=self.org,
+                        timeout=self.timeout_ms,
+                        connection_pool_maxsize=self.pool_size,
+                    )
+                client = self._client
+        return client
+
+    def reset(self):
+        """Drop the current client so the next call reconnects"""
+        with self._lock:
+            client, self._client = self._client, None
+        if client is not None:
+            try:
+                client.close()
+            except Exception as e:
+                print(f"Error closing InfluxDB client: {e}")
+
+    def health(self):
+        """Ping InfluxDB and return a small status dict"""
+        started = time.monotonic()
+        try:
+            ok = bool(self.get().ping())
+        except Exception as e:
+            print(f"InfluxDB health check failed: {e}")
+            ok = False
+        if not ok:
+            # Force a fresh connection pool on the next query
+            self.reset()
+        self._last_health = {
+            "ok": ok,
+            "latency_ms": round((time.monotonic() - started) * 1000, 1),
+            "checked_at": datetime.now(timezone.utc).isoformat(),
+            "pool_size": self.pool_size,
+        }
+        return self._last_health
+
+    def close(self):
+        """Close the pooled connections (called at interpreter exit)"""
+        self.reset()
+
+
+_manager = InfluxClientManager(
+    INFLUX_URL, INFLUX_TOKEN, INFLUX_ORG,
+    pool_size=INFLUX_POOL_SIZE, timeout_ms=INFLUX_TIMEOUT_MS,
+)
+atexit.register(_manager.close)
+
+
+@contextmanager
 def _client():
-    return InfluxDBClient(url=INFLUX_URL, token=INFLUX_TOKEN, org=INFLUX_ORG)
+    """Borrow the shared client; it stays open after the block exits"""
+    yield _manager.get()
+
+
+def influx_health():
+    """Health check for the shared InfluxDB connection"""
+    return _manager.health()
+
+
+# ------------------------------------------------------------
+# QUERY TIMINGS
+# ------------------------------------------------------------
+_timings = threading.local()
+
+
+def _query(q, flux, label):
+    """Run a Flux query and record its wall time for the current thread"""
+    started = time.perf_counter()
+    try:
+        return q.query(flux)
+    finally:
+        entries = getattr(_timings, "entries", None)
+        if entries is None:
+            entries = _timings.entries = []
+        entries.append((label, (time.perf_counter() - started) * 1000))
+
+
+def pop_query_timings():
+    """Return and clear [(label, ms)] recorded on this thread"""
+    entries = getattr(_timings, "entries", None) or []
+    _timings.entries = []
+    return entries
+
+
+def record_query_timings(entries):
+    """Add [(label, ms)] measured on another thread to this thread's timings"""
+    if not hasattr(_timings, "entries"):
+        _timings.entries = []
+    _timings.entries.extend(entries)
+
+
+def _run_queries(queries):
+    """Run {label: flux} on the shared client and return {label: tables}"""
+    with _client() as client:
+        q = client.query_api()
+        return {label: _query(q, flux, label) for label, flux in queries.items()}
 
 
 def _magnus_dewpoint(temp_c: float, rh: float) -> float:
@@ -20,11 +164,33 @@ def _magnus_dewpoint(temp_c: float, rh: float) -> float:
     return round(dew, 1)
 
 
+def _history_window(days):
+    """Aggregation window and Flux start for a history range of `days`"""
+    if days <= 1:
+        # 24 hours or less: hourly aggregation
+        return "1h", f"-{int(days * 24)}h"
+    elif days <= 4:
+        # 2-4 days: 2-hour aggregation
+        return "2h", f"-{days}d"
+    elif days <= 7:
+        # 1 week: 4-hour aggregation
+        return "4h", f"-{days}d"
+    else:
+        # 1 month: 12-hour aggregation
+        return "12h", f"-{days}d"
+
+
+def ensure_rollup_tasks():
+    """Create/update the downsampling bucket and tasks if rollups are enabled"""
+    with _client() as client:
+        return downsampling.ensure_rollups(client)
+
+
 # ------------------------------------------------------------
 # GET CURRENT VALUES
 # ------------------------------------------------------------
-def get_current_values():
-
+def current_queries():
+    """Flux for get_current_values(), keyed by timing label"""
     # Last values (within last 24 hours - outdoor sensor may update infrequently)
     flux = f'''
 from(bucket: "{INFLUX_BUCKET}")
@@ -47,6 +213,11 @@ from(bucket: "{INFLUX_BUCKET}")
   |> sort(columns: ["_time"])
 '''
 
+    return {"current": flux, "pressure-trend": trend_flux}
+
+
+def parse_current(results):
+    """/api/current payload from the results of current_queries()"""
     data = {
         "temperature": None,
         "humidity": None,
@@ -56,47 +227,41 @@ from(bucket: "{INFLUX_BUCKET}")
         "pressure_trend": "stable",
     }
 
-    with _client() as client:
-        q = client.query_api()
-
-        # ---------- Latest values ----------
-        tables = q.query(flux)
-
-        for table in tables:
-            for record in table.records:
-                field = record["_field"]
-                value = float(record["_value"])
-                timestamp = record["_time"].isoformat()
-
-                if field == FIELD_TEMP:
-                    # Validate: outdoor temp should be -50 to 50°C
-                    if -50 <= value <= 50:
-                        data["temperature"] = round(value, 1)
-                        data["timestamp"] = timestamp
-                elif field == FIELD_HUMID:
-                    # Validate: humidity should be 0-100%
-                    if 0 <= value <= 100:
-                        data["humidity"] = round(value, 1)
-                elif field == FIELD_PRESS:
-                    # Validate: pressure should be 900-1100 hPa
-                    if 900 <= value <= 1100:
-                        data["pressure"] = round(value, 1)
-
-        # ---------- Dew point ----------
-        data["dew_point"] = _magnus_dewpoint(
-            data["temperature"], data["humidity"]
-        )
-
-        # ---------- Pressure trend ----------
-        trend_tables = q.query(trend_flux)
-        pressures = [rec["_value"] for table in trend_tables for rec in table.records]
-
-        if len(pressures) >= 2:
-            delta = pressures[-1] - pressures[0]
-            if delta > 0.5:
-                data["pressure_trend"] = "rising"
-            elif delta < -0.5:
-                data["pressure_trend"] = "falling"
+    # ---------- Latest values ----------
+    for table in results["current"]:
+        for record in table.records:
+            field = record["_field"]
+            value = float(record["_value"])
+            timestamp = record["_time"].isoformat()
+
+            if field == FIELD_TEMP:
+                # Validate: outdoor temp should be -50 to 50°C
+                if -50 <= value <= 50:
+                    data["temperature"] = round(value, 1)
+                    data["timestamp"] = timestamp
+            elif field == FIELD_HUMID:
+                # Validate: humidity should be 0-100%
+                if 0 <= value <= 100:
+                    data["humidity"] = round(value, 1)
+            elif field == FIELD_PRESS:
+                # Validate: pressure should be 900-1100 hPa
+                if 900 <= value <= 1100:
+                    data["pressure"] = round(value, 1)
+
+    # ---------- Dew point ----------
+    data["dew_point"] = _magnus_dewpoint(
+        data["temperature"], data["humidity"]
+    )
+
+    # ---------- Pressure trend ----------
+    pressures = [rec["_value"] for table in results["pressure-trend"] for rec in table.records]
+
+    if len(pressures) >= 2:
+        delta = pressures[-1] - pressures[0]
+        if delta > 0.5:
+            data["pressure_trend"] = "rising"
+        elif delta < -0.5:
+            data["pressure_trend"] = "falling"
 
     # ---------------------------------------------------------
     # LOCAL WARNINGS
@@ -124,130 +289,195 @@ from(bucket: "{INFLUX_BUCKET}")
     return data
 
 
+def get_current_values():
+    return parse_current(_run_queries(current_queries()))
+
+
 # ------------------------------------------------------------
 # 24-HOUR MIN/MAX
 # ------------------------------------------------------------
-def get_minmax_24h():
+MINMAX_WINDOW = 24 * 3600
+MINMAX_POLL_SECONDS = 10     # Don't query Influx more often than this
+
+_minmax_lock = threading.Lock()
+_minmax_trackers = None
+_minmax_last_time = None
+_minmax_polled_at = 0
+
+
+def _flux_time(dt):
+    return dt.astimezone(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.%fZ")
+
+
+def _update_minmax_trackers():
+    """Seed the trackers with 24h of data once, then add only newer points"""
+    global _minmax_trackers, _minmax_last_time, _minmax_polled_at
+
+    if _minmax_trackers is None:
+        trackers = {f: SlidingMinMax(MINMAX_WINDOW) for f in (FIELD_TEMP, FIELD_HUMID, FIELD_PRESS)}
+        start = "-24h"
+    else:
+        trackers = _minmax_trackers
+        start = _flux_time(_minmax_last_time) if _minmax_last_time else "-24h"
+
     # Note: After temperature correction, there may be duplicate values at same timestamp
     # For temperature, use min() to get corrected values (2C lower than uncorrected)
     # For humidity/pressure, use last() as they weren't changed
-    
-    # Temperature min/max (using min to deduplicate - corrected values are lower)
-    temp_flux = f'''
-from(bucket: "{INFLUX_BUCKET}")
-  |> range(start: -24h)
-  |> filter(fn: (r) => r._measurement == "{MEASUREMENT_OUTDOOR}")
-  |> filter(fn: (r) => r._field == "{FIELD_TEMP}")
-  |> aggregateWindow(every: 10s, fn: min, createEmpty: false)
-  |> keep(columns: ["_value"])
-'''
-
-    # Humidity and pressure (using last)
-    other_flux = f'''
-from(bucket: "{INFLUX_BUCKET}")
-  |> range(start: -24h)
-  |> filter(fn: (r) => r._measurement == "{MEASUREMENT_OUTDOOR}")
-  |> filter(fn: (r) => 
-       r._field == "{FIELD_HUMID}" or
-       r._field == "{FIELD_PRESS}")
-  |> aggregateWindow(every: 10s, fn: last, createEmpty: false)
-  |> keep(columns: ["_field", "_value"])
+    # Both dedup passes run in one query and come back as a single union stream
+    flux = downsampling.outdoor_raw_flux(start) + '''
+outdoor
+  |> keep(columns: ["_time", "_field", "_value"])
 '''
 
-    result = {
-        "temperature": {"min": None, "max": None},
-        "humidity": {"min": None, "max": None},
-        "pressure": {"min": None, "max": None},
-    }
-
     with _client() as client:
         q = client.query_api()
-        
-        # Get temperature (using min-deduplication for corrected values)
-        temp_tables = q.query(temp_flux)
-        temps = []
-        for table in temp_tables:
-            for r in table.records:
-                temps.append(float(r["_value"]))
-        
-        # Get humidity and pressure
-        other_tables = q.query(other_flux)
-        hums, presses = [], []
-        for table in other_tables:
+        tables = _query(q, flux, "minmax")
+
+        points = {field: [] for field in trackers}
+        for table in tables:
             for r in table.records:
                 field = r["_field"]
-                value = float(r["_value"])
-                if field == FIELD_HUMID:
-                    hums.append(value)
-                elif field == FIELD_PRESS:
-                    presses.append(value)
+                if field in points:
+                    points[field].append((r["_time"], float(r["_value"])))
 
-    if temps:
-        result["temperature"]["min"] = round(min(temps), 1)
-        result["temperature"]["max"] = round(max(temps), 1)
+    last_time = _minmax_last_time
+    for field, samples in points.items():
+        samples.sort(key=lambda p: p[0])
+        for ts, value in samples:
+            trackers[field].add(ts.timestamp(), value)
+            if last_time is None or ts > last_time:
+                last_time = ts
 
-    if hums:
-        result["humidity"]["min"] = round(min(hums), 1)
-        result["humidity"]["max"] = round(max(hums), 1)
+    _minmax_trackers = trackers
+    _minmax_last_time = last_time
+    _minmax_polled_at = time.time()
 
-    if presses:
-        result["pressure"]["min"] = round(min(presses), 1)
-        result["pressure"]["max"] = round(max(presses), 1)
+
+def get_minmax_24h():
+    """24h min/max per field from incrementally maintained sliding windows"""
+    with _minmax_lock:
+        if _minmax_trackers is None or time.time() - _minmax_polled_at >= MINMAX_POLL_SECONDS:
+            _update_minmax_trackers()
+
+        now = time.time()
+        result = {}
+        for key, field in (("temperature", FIELD_TEMP), ("humidity", FIELD_HUMID), ("pressure", FIELD_PRESS)):
+            tracker = _minmax_trackers[field]
+            tracker.expire(now)
+            lo, hi = tracker.min(), tracker.max()
+            result[key] = {
+                "min": round(lo, 1) if lo is not None else None,
+                "max": round(hi, 1) if hi is not None else None,
+            }
 
     return result
 
 
 # ------------------------------------------------------------
-# 24-HOUR HISTORY (for charts)
+# COMPACT (COLUMNAR) HISTORY FORMAT
 # ------------------------------------------------------------
-def get_24h_history(days=1):
-    """Get aggregated outdoor data with configurable time range
-    
-    Args:
-        days: Number of days to fetch (1 = 24h, 2 = 2 days, etc.)
+WINDOW_SECONDS = {"1h": 3600, "2h": 7200, "4h": 14400, "12h": 43200}
+
+# Rounding per output series (matches the legacy format)
+HISTORY_DIGITS = {"temperature": 1, "humidity": 1, "pressure": 1, "eco2": 0, "tvoc": 0}
+
+
+def _compact_history(tables, window, field_map, encoding=None):
     """
-    
-    # Calculate start time and aggregation window
-    if days <= 1:
-        # 24 hours or less: hourly aggregation
-        window = "1h"
-        start = f"-{int(days * 24)}h"
-    elif days <= 4:
-        # 2-4 days: 2-hour aggregation
-        window = "2h"
-        start = f"-{days}d"
-    elif days <= 7:
-        # 1 week: 4-hour aggregation
-        window = "4h"
-        start = f"-{days}d"
+    Columnar history: { start, step, count, fields: { name: [...] } }.
+    Slot i is the window ending at start + i * step (epoch seconds, UTC);
+    gaps are null. With encoding="f32" each series is a base64 string of
+    little-endian float32 values with NaN for gaps.
+    Display formatting of timestamps is left to the client.
+    """
+    step = WINDOW_SECONDS[window]
+    names = list(dict.fromkeys(field_map.values()))
+    slots = {}
+
+    for table in tables:
+        for r in table.records:
+            name = field_map.get(r["_field"])
+            if name is None:
+                continue
+            # Windows are epoch-aligned; a still-open window is stamped "now",
+            # so snap it to the end of its window
+            slot = math.ceil(r["_time"].timestamp() / step - 1e-9) * step
+            slots.setdefault(slot, {})[name] = float(r["_value"])
+
+    if not slots:
+        start, count = None, 0
     else:
-        # 1 month: 12-hour aggregation
-        window = "12h"
-        start = f"-{days}d"
-    
-    # For temperature: use min to deduplicate (corrected values are 2C lower)
-    temp_flux = f'''
-from(bucket: "{INFLUX_BUCKET}")
-  |> range(start: {start})
-  |> filter(fn: (r) => r._measurement == "{MEASUREMENT_OUTDOOR}")
-  |> filter(fn: (r) => r._field == "{FIELD_TEMP}")
-  |> aggregateWindow(every: 10s, fn: min, createEmpty: false)
-  |> aggregateWindow(every: {window}, fn: mean, createEmpty: false)
-  |> keep(columns: ["_time", "_field", "_value"])
-'''
-    
-    # For humidity/pressure: use last to deduplicate
-    other_flux = f'''
-from(bucket: "{INFLUX_BUCKET}")
-  |> range(start: {start})
-  |> filter(fn: (r) => r._measurement == "{MEASUREMENT_OUTDOOR}")
-  |> filter(fn: (r) => 
-       r._field == "{FIELD_HUMID}" or
-       r._field == "{FIELD_PRESS}")
-  |> aggregateWindow(every: 10s, fn: last, createEmpty: false)
+        start = min(slots)
+        count = (max(slots) - start) // step + 1
+
+    columns = {name: [None] * count for name in names}
+    for slot, values in slots.items():
+        i = (slot - start) // step
+        for name, value in values.items():
+            columns[name][i] = round(value, HISTORY_DIGITS.get(name, 1))
+
+    if encoding == "f32":
+        for name, values in columns.items():
+            buf = array("f", (math.nan if v is None else v for v in values))
+            if sys.byteorder == "big":
+                buf.byteswap()
+            columns[name] = base64.b64encode(buf.tobytes()).decode("ascii")
+
+    return {
+        "format": "compact",
+        "encoding": encoding or "json",
+        "start": start,
+        "step": step,
+        "count": count,
+        "fields": columns,
+    }
+
+
+# ------------------------------------------------------------
+# 24-HOUR HISTORY (for charts)
+# ------------------------------------------------------------
+def history_queries(days=1):
+    """Flux for get_24h_history(), keyed by timing label"""
+    window, start = _history_window(days)
+
+    if downsampling.rollups_enabled() and window in downsampling.ROLLUP_WINDOWS:
+        # Completed windows come pre-aggregated from the rollup bucket
+        return {"history": downsampling.history_flux(
+            "outdoor", window, start, [FIELD_TEMP, FIELD_HUMID, FIELD_PRESS])}
+
+    # Temperature deduped with min (corrected values are 2C lower) and
+    # humidity/pressure deduped with last, merged into one query
+    return {"history": downsampling.outdoor_raw_flux(start) + f'''
+outdoor
   |> aggregateWindow(every: {window}, fn: mean, createEmpty: false)
   |> keep(columns: ["_time", "_field", "_value"])
-'''
+'''}
+
+
+def _display_time(timestamp, days, now):
+    """Chart label for a history point, based on the requested range"""
+    if days <= 1:
+        # 24h: show date for yesterday, time only for today
+        if timestamp.date() < now.date():
+            return timestamp.strftime("%d %b %H:%M")
+        return timestamp.strftime("%H:%M")
+    elif days <= 7:
+        # Up to 1 week: show date and time
+        return timestamp.strftime("%d %b %H:%M")
+    else:
+        # 1 month: show date only
+        return timestamp.strftime("%d %b")
+
+
+def parse_history(results, days=1, compact=False, encoding=None):
+    """/api/history payload from the results of history_queries(days)"""
+    window, _ = _history_window(days)
+    tables = results["history"]
+
+    if compact:
+        return _compact_history(tables, window, {
+            FIELD_TEMP: "temperature", FIELD_HUMID: "humidity", FIELD_PRESS: "pressure",
+        }, encoding)
 
     history = {
         "timestamps": [],
@@ -256,72 +486,56 @@ from(bucket: "{INFLUX_BUCKET}")
         "pressure": []
     }
 
-    with _client() as client:
-        q = client.query_api()
-        
-        # Run both queries
-        temp_tables = q.query(temp_flux)
-        other_tables = q.query(other_flux)
-
-        data_points = {}
-        
-        def process_records(tables):
-            for table in tables:
-                for r in table.records:
-                    # Use full datetime for sorting, but format for display
-                    timestamp = r["_time"]
-                    now = datetime.now(timezone.utc)
-                    
-                    # Format timestamp based on time range
-                    if days <= 1:
-                        # 24h: show date for yesterday, time only for today
-                        if timestamp.date() < now.date():
-                            time_str = timestamp.strftime("%d %b %H:%M")
-                        else:
-                            time_str = timestamp.strftime("%H:%M")
-                    elif days <= 7:
-                        # Up to 1 week: show date and time
-                        time_str = timestamp.strftime("%d %b %H:%M")
-                    else:
-                        # 1 month: show date only
-                        time_str = timestamp.strftime("%d %b")
-                    
-                    # Use full timestamp as key to maintain uniqueness
-                    timestamp_key = timestamp.isoformat()
-                    field = r["_field"]
-                    value = float(r["_value"])
-
-                    if timestamp_key not in data_points:
-                        data_points[timestamp_key] = {"display_time": time_str}
-                    
-                    if field == FIELD_TEMP:
-                        data_points[timestamp_key]["temperature"] = round(value, 1)
-                    elif field == FIELD_HUMID:
-                        data_points[timestamp_key]["humidity"] = round(value, 1)
-                    elif field == FIELD_PRESS:
-                        data_points[timestamp_key]["pressure"] = round(value, 1)
-        
-        process_records(temp_tables)
-        process_records(other_tables)
-
-        # Sort by timestamp key (ISO format) and convert to arrays
-        sorted_keys = sorted(data_points.keys())
-        
-        for key in sorted_keys:
-            point = data_points[key]
-            history["timestamps"].append(point["display_time"])
-            history["temperature"].append(point.get("temperature"))
-            history["humidity"].append(point.get("humidity"))
-            history["pressure"].append(point.get("pressure"))
+    data_points = {}
+    now = datetime.now(timezone.utc)
+
+    for table in tables:
+        for r in table.records:
+            # Use full datetime for sorting, but format for display
+            timestamp = r["_time"]
+
+            # Use full timestamp as key to maintain uniqueness
+            timestamp_key = timestamp.isoformat()
+            field = r["_field"]
+            value = float(r["_value"])
+
+            if timestamp_key not in data_points:
+                data_points[timestamp_key] = {"display_time": _display_time(timestamp, days, now)}
+
+            if field == FIELD_TEMP:
+                data_points[timestamp_key]["temperature"] = round(value, 1)
+            elif field == FIELD_HUMID:
+                data_points[timestamp_key]["humidity"] = round(value, 1)
+            elif field == FIELD_PRESS:
+                data_points[timestamp_key]["pressure"] = round(value, 1)
+
+    # Sort by timestamp key (ISO format) and convert to arrays
+    for key in sorted(data_points.keys()):
+        point = data_points[key]
+        history["timestamps"].append(point["display_time"])
+        history["temperature"].append(point.get("temperature"))
+        history["humidity"].append(point.get("humidity"))
+        history["pressure"].append(point.get("pressure"))
 
     return history
 
+
+def get_24h_history(days=1, compact=False, encoding=None):
+    """Get aggregated outdoor data with configurable time range
+    
+    Args:
+        days: Number of days to fetch (1 = 24h, 2 = 2 days, etc.)
+        compact: Return the columnar format (see _compact_history)
+        encoding: "f32" for base64 float32 series in compact mode
+    """
+    return parse_history(_run_queries(history_queries(days)), days, compact, encoding)
+
+
 # ------------------------------------------------------------
 # GET INDOOR VALUES
 # ------------------------------------------------------------
-def get_indoor_values():
-    """Get current indoor sensor values"""
-    
+def indoor_queries():
+    """Flux for get_indoor_values(), keyed by timing label"""
     flux = f'''
 from(bucket: "{INFLUX_BUCKET}")
   |> range(start: -20m)
@@ -335,6 +549,11 @@ from(bucket: "{INFLUX_BUCKET}")
   |> last()
 '''
 
+    return {"indoor": flux}
+
+
+def parse_indoor(results):
+    """/api/indoor payload from the results of indoor_queries()"""
     data = {
         "temperature": None,
         "humidity": None,
@@ -345,42 +564,38 @@ from(bucket: "{INFLUX_BUCKET}")
         "timestamp": None
     }
 
-    with _client() as client:
-        q = client.query_api()
-        tables = q.query(flux)
-
-        for table in tables:
-            for record in table.records:
-                field = record["_field"]
-                value = float(record["_value"])
-                timestamp = record["_time"].isoformat()
-
-                if field == "temperature_indoor":
-                    # Validate: indoor temp should be 10-40°C
-                    if 10 <= value <= 40:
-                        data["temperature"] = round(value, 1)
-                        data["timestamp"] = timestamp
-                elif field == "humidity_indoor":
-                    # Validate: humidity should be 0-100%
-                    if 0 <= value <= 100:
-                        data["humidity"] = round(value, 1)
-                elif field == "pressure_indoor":
-                    # Validate: pressure should be 900-1100 hPa
-                    if 900 <= value <= 1100:
-                        data["pressure"] = round(value, 1)
-                elif field == "eco2":
-                    # Validate: eCO2 should be 400-10000 ppm
-                    if 400 <= value <= 10000:
-                        data["eco2"] = round(value, 0)
-                elif field == "tvoc":
-                    # Validate: TVOC should be 0-5000 ppb
-                    if 0 <= value <= 5000:
-                        data["tvoc"] = round(value, 0)
-
-        # Calculate dew point
-        data["dew_point"] = _magnus_dewpoint(
-            data["temperature"], data["humidity"]
-        )
+    for table in results["indoor"]:
+        for record in table.records:
+            field = record["_field"]
+            value = float(record["_value"])
+            timestamp = record["_time"].isoformat()
+
+            if field == "temperature_indoor":
+                # Validate: indoor temp should be 10-40°C
+                if 10 <= value <= 40:
+                    data["temperature"] = round(value, 1)
+                    data["timestamp"] = timestamp
+            elif field == "humidity_indoor":
+                # Validate: humidity should be 0-100%
+                if 0 <= value <= 100:
+                    data["humidity"] = round(value, 1)
+            elif field == "pressure_indoor":
+                # Validate: pressure should be 900-1100 hPa
+                if 900 <= value <= 1100:
+                    data["pressure"] = round(value, 1)
+            elif field == "eco2":
+                # Validate: eCO2 should be 400-10000 ppm
+                if 400 <= value <= 10000:
+                    data["eco2"] = round(value, 0)
+            elif field == "tvoc":
+                # Validate: TVOC should be 0-5000 ppb
+                if 0 <= value <= 5000:
+                    data["tvoc"] = round(value, 0)
+
+    # Calculate dew point
+    data["dew_point"] = _magnus_dewpoint(
+        data["temperature"], data["humidity"]
+    )
 
     # Air quality assessment
     warnings = []
@@ -412,35 +627,24 @@ from(bucket: "{INFLUX_BUCKET}")
     return data
 
 
+def get_indoor_values():
+    """Get current indoor sensor values"""
+    return parse_indoor(_run_queries(indoor_queries()))
+
+
 # ------------------------------------------------------------
 # GET INDOOR 24H HISTORY
 # ------------------------------------------------------------
-def get_indoor_24h_history(days=1):
-    """Get history for indoor sensors with configurable time range
-    
-    Args:
-        days: Number of days to fetch (0.04 = 1 hour, 1 = 24h, 2 = 2 days, etc.)
-    """
-    
-    # Calculate start time and aggregation window
-    if days <= 1:
-        # 24 hours or less: hourly aggregation
-        window = "1h"
-        start = f"-{int(days * 24)}h"
-    elif days <= 4:
-        # 2-4 days: 2-hour aggregation
-        window = "2h"
-        start = f"-{days}d"
-    elif days <= 7:
-        # 1 week: 4-hour aggregation
-        window = "4h"
-        start = f"-{days}d"
-    else:
-        # 1 month: 12-hour aggregation
-        window = "12h"
-        start = f"-{days}d"
-    
-    flux = f'''
+def indoor_history_queries(days=1):
+    """Flux for get_indoor_24h_history(), keyed by timing label"""
+    window, start = _history_window(days)
+
+    if downsampling.rollups_enabled() and window in downsampling.ROLLUP_WINDOWS:
+        # Completed windows come pre-aggregated from the rollup bucket
+        return {"indoor-history": downsampling.history_flux(
+            "indoor", window, start, downsampling.INDOOR_FIELDS)}
+
+    return {"indoor-history": f'''
 from(bucket: "{INFLUX_BUCKET}")
   |> range(start: {start})
   |> filter(fn: (r) => r._measurement == "{MEASUREMENT_OUTDOOR}")
@@ -455,7 +659,22 @@ from(bucket: "{INFLUX_BUCKET}")
        r._field == "tvoc")
   |> aggregateWindow(every: {window}, fn: mean, createEmpty: false)
   |> sort(columns: ["_time"])
-'''
+'''}
+
+
+def parse_indoor_history(results, days=1, compact=False, encoding=None):
+    """/api/indoor-history payload from the results of indoor_history_queries(days)"""
+    window, _ = _history_window(days)
+    tables = results["indoor-history"]
+
+    if compact:
+        # Support both old and new indoor field names
+        return _compact_history(tables, window, {
+            "temperature_indoor": "temperature", "temperature": "temperature",
+            "humidity_indoor": "humidity", "humidity": "humidity",
+            "pressure_indoor": "pressure", "pressure": "pressure",
+            "eco2": "eco2", "tvoc": "tvoc",
+        }, encoding)
 
     history = {
         "timestamps": [],
@@ -466,63 +685,130 @@ from(bucket: "{INFLUX_BUCKET}")
         "tvoc": []
     }
 
+    data_points = {}
+    now = datetime.now(timezone.utc)
+
+    for table in tables:
+        for r in table.records:
+            # Use full datetime for sorting, but format for display
+            timestamp = r["_time"]
+
+            # Use full timestamp as key to maintain uniqueness
+            timestamp_key = timestamp.isoformat()
+            field = r["_field"]
+            value = float(r["_value"])
+
+            if timestamp_key not in data_points:
+                data_points[timestamp_key] = {"display_time": _display_time(timestamp, days, now)}
+
+            # Support both old field names (temperature, humidity, pressure) 
+            # and new field names (temperature_indoor, humidity_indoor, pressure_indoor)
+            if field == "temperature_indoor" or field == "temperature":
+                data_points[timestamp_key]["temperature"] = round(value, 1)
+            elif field == "humidity_indoor" or field == "humidity":
+                data_points[timestamp_key]["humidity"] = round(value, 1)
+            elif field == "pressure_indoor" or field == "pressure":
+                data_points[timestamp_key]["pressure"] = round(value, 1)
+            elif field == "eco2":
+                data_points[timestamp_key]["eco2"] = round(value, 0)
+            elif field == "tvoc":
+                data_points[timestamp_key]["tvoc"] = round(value, 0)
+
+    # Sort by timestamp key (ISO format) and convert to arrays
+    for key in sorted(data_points.keys()):
+        point = data_points[key]
+        history["timestamps"].append(point["display_time"])
+        history["temperature"].append(point.get("temperature"))
+        history["humidity"].append(point.get("humidity"))
+        history["pressure"].append(point.get("pressure"))
+        history["eco2"].append(point.get("eco2"))
+        history["tvoc"].append(point.get("tvoc"))
+
+    return history
+
+
+def get_indoor_24h_history(days=1, compact=False, encoding=None):
+    """Get history for indoor sensors with configurable time range
+    
+    Args:
+        days: Number of days to fetch (0.04 = 1 hour, 1 = 24h, 2 = 2 days, etc.)
+        compact: Return the columnar format (see _compact_history)
+        encoding: "f32" for base64 float32 series in compact mode
+    """
+    return parse_indoor_history(_run_queries(indoor_history_queries(days)), days, compact, encoding)
+
+
+# ------------------------------------------------------------
+# AURORA TIME SERIES
+# ------------------------------------------------------------
+def write_aurora_samples(samples):
+    """Write [(location_id, datetime, {field: value})] in one batch"""
+    points = []
+    for location_id, when, fields in samples:
+        point = Point(downsampling.MEASUREMENT_AURORA).tag("location", location_id).time(when)
+        for name, value in fields.items():
+            # None/NaN: unknown (e.g. a solar wind feed with no data yet)
+            if value is not None and value == value:
+                point = point.field(name, float(value))
+        points.append(point)
+    if not points:
+        return
     with _client() as client:
-        q = client.query_api()
-        tables = q.query(flux)
+        client.write_api(write_options=SYNCHRONOUS).write(
+            bucket=INFLUX_BUCKET, org=INFLUX_ORG, record=points
+        )
 
-        data_points = {}
 
-        for table in tables:
-            for r in table.records:
-                # Use full datetime for sorting, but format for display
-                timestamp = r["_time"]
-                now = datetime.now(timezone.utc)
-                
-                # Format timestamp based on time range
-                if days <= 1:
-                    # 24h: show date for yesterday, time only for today
-                    if timestamp.date() < now.date():
-                        time_str = timestamp.strftime("%d %b %H:%M")
-                    else:
-                        time_str = timestamp.strftime("%H:%M")
-                elif days <= 7:
-                    # Up to 1 week: show date and time
-                    time_str = timestamp.strftime("%d %b %H:%M")
-                else:
-                    # 1 month: show date only
-                    time_str = timestamp.strftime("%d %b")
-                
-                # Use full timestamp as key to maintain uniqueness
-                timestamp_key = timestamp.isoformat()
-                field = r["_field"]
-                value = float(r["_value"])
-
-                if timestamp_key not in data_points:
-                    data_points[timestamp_key] = {"display_time": time_str}
-                
-                # Support both old field names (temperature, humidity, pressure) 
-                # and new field names (temperature_indoor, humidity_indoor, pressure_indoor)
-                if field == "temperature_indoor" or field == "temperature":
-                    data_points[timestamp_key]["temperature"] = round(value, 1)
-                elif field == "humidity_indoor" or field == "humidity":
-                    data_points[timestamp_key]["humidity"] = round(value, 1)
-                elif field == "pressure_indoor" or field == "pressure":
-                    data_points[timestamp_key]["pressure"] = round(value, 1)
-                elif field == "eco2":
-                    data_points[timestamp_key]["eco2"] = round(value, 0)
-                elif field == "tvoc":
-                    data_points[timestamp_key]["tvoc"] = round(value, 0)
-
-        # Sort by timestamp key (ISO format) and convert to arrays
-        sorted_keys = sorted(data_points.keys())
-        
-        for key in sorted_keys:
-            point = data_points[key]
-            history["timestamps"].append(point["display_time"])
-            history["temperature"].append(point.get("temperature"))
-            history["humidity"].append(point.get("humidity"))
-            history["pressure"].append(point.get("pressure"))
-            history["eco2"].append(point.get("eco2"))
-            history["tvoc"].append(point.get("tvoc"))
+def aurora_history_queries(location_id, days=1):
+    """Flux for get_aurora_history(), keyed by timing label"""
+    window, start = _history_window(days)
+    fields = downsampling.AURORA_FIELDS
+
+    if downsampling.rollups_enabled() and window in downsampling.ROLLUP_WINDOWS:
+        # Completed windows come pre-aggregated from the rollup bucket
+        return {"aurora-history": downsampling.history_flux(
+            "aurora", window, start, fields, location=location_id)}
+
+    return {"aurora-history": downsampling.aurora_raw_flux(start) + f'''
+aurora{downsampling.location_filter(location_id)}
+  |> aggregateWindow(every: {window}, fn: mean, createEmpty: false)
+  |> keep(columns: ["_time", "_field", "_value"])
+'''}
+
+
+def parse_aurora_history(results, days=1, compact=False, encoding=None):
+    """/api/aurora/history?range= payload from aurora_history_queries() results"""
+    window, _ = _history_window(days)
+    tables = results["aurora-history"]
+    fields = downsampling.AURORA_FIELDS
+
+    if compact:
+        return _compact_history(tables, window, {f: f for f in fields}, encoding)
+
+    data_points = {}
+    now = datetime.now(timezone.utc)
+    for table in tables:
+        for r in table.records:
+            if r["_field"] not in fields:
+                continue
+            timestamp = r["_time"]
+            point = data_points.setdefault(
+                timestamp.isoformat(), {"display_time": _display_time(timestamp, days, now)}
+            )
+            point[r["_field"]] = round(float(r["_value"]), 1)
+
+    history = {"timestamps": [], **{f: [] for f in fields}}
+    for key in sorted(data_points.keys()):
+        point = data_points[key]
+        history["timestamps"].append(point["display_time"])
+        for f in fields:
+            history[f].append(point.get(f))
 
     return history
+
+
+def get_aurora_history(location_id, days=1, compact=False, encoding=None):
+    """Recorded aurora inputs and scores for one site over `days`"""
+    return parse_aurora_history(
+        _run_queries(aurora_history_queries(location_id, days)), days, compact, encoding
+    )
@@ -0,0 +1,190 @@
+"""
+Live dashboard stream for /api/stream (Server-Sent Events)
+A single producer thread reads every source on its own interval - once per
+tick no matter how many clients are connected - and fans out only what
+changed. Sensor sources are shared by all sites; SMHI and aurora sources
+are read once per site that has listeners.
+
+Events:
+    snapshot  {source: payload, ...}  replaces those sources
+    update    {source: {key: value}}  merges changed keys into a source
+"""
+import json
+import queue
+import threading
+import time
+
+from influx import get_current_values, get_indoor_values, get_minmax_24h
+from smhi import get_smhi_warnings, get_smhi_forecast
+from aurora import engine as aurora_engine
+
+TICK_SECONDS = 2
+KEEPALIVE_SECONDS = 15
+RECONNECT_MS = 5000
+SUBSCRIBER_QUEUE_SIZE = 50     # Slow clients beyond this are dropped (EventSource reconnects)
+
+# source -> seconds between reads (matches the frontend's old polling)
+SENSOR_SOURCES = {
+    "current": (get_current_values, 10),
+    "indoor": (get_indoor_values, 10),
+    "minmax": (get_minmax_24h, 30),
+}
+
+SITE_SOURCES = {
+    "aurora": (lambda site: aurora_engine.snapshot(site["id"]), 30),
+    "smhi": (lambda site: get_smhi_warnings(site["region"]), 120),
+    "forecast": (lambda site: get_smhi_forecast(site["lat"], site["lon"]), 300),
+}
+
+
+def _diff(old, new):
+    """Changed top-level keys of a dict payload, or None if it must be replaced"""
+    if not isinstance(old, dict) or not isinstance(new, dict) or old.keys() - new.keys():
+        return None
+    return {k: v for k, v in new.items() if old.get(k) != v}
+
+
+def format_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data, separators=(',', ':'))}\n\n"
+
+
+class Subscriber:
+    def __init__(self, site):
+        self.site = site
+        self.queue = queue.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        self.dropped = False
+
+    def send(self, event, data):
+        try:
+            self.queue.put_nowait((event, data))
+        except queue.Full:
+            self.dropped = True
+
+    def events(self):
+        """SSE text chunks until the client goes away or falls too far behind"""
+        yield f"retry: {RECONNECT_MS}\n\n"
+        while not self.dropped:
+            try:
+                event, data = self.queue.get(timeout=KEEPALIVE_SECONDS)
+            except queue.Empty:
+                yield ": keepalive\n\n"
+                continue
+            yield format_event(event, data)
+
+    def pending(self):
+        """Queued events as SSE text, without blocking (for the async server)"""
+        chunks = []
+        while True:
+            try:
+                event, data = self.queue.get_nowait()
+            except queue.Empty:
+                return "".join(chunks)
+            chunks.append(format_event(event, data))
+
+
+class LiveStream:
+    def __init__(self, tick=TICK_SECONDS):
+        self.tick = tick
+        self._subscribers = set()
+        self._values = {}               # (source, site id or None) -> last payload
+        self._due = {}                  # (source, site id or None) -> next read (monotonic)
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+
+    # ---------- Subscribers ----------
+    def subscribe(self, site):
+        """Register a client; it starts with a snapshot of everything known so far"""
+        sub = Subscriber(site)
+        with self._lock:
+            snapshot = {name: self._values[(name, None)]
+                        for name in SENSOR_SOURCES if (name, None) in self._values}
+            snapshot.update({name: self._values[(name, site["id"])]
+                             for name in SITE_SOURCES if (name, site["id"]) in self._values})
+            if snapshot:
+                sub.send("snapshot", snapshot)
+            self._subscribers.add(sub)
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="live-stream", daemon=True)
+                self._thread.start()
+        self._wake.set()
+        return sub
+
+    def unsubscribe(self, sub):
+        with self._lock:
+            self._subscribers.discard(sub)
+
+    def client_count(self):
+        return len(self._subscribers)
+
+    # ---------- Producer ----------
+    def _read(self, key, fetch, interval, now):
+        """Call `fetch` if the source is due; returns (old, new) or None if unchanged"""
+        if now < self._due.get(key, 0):
+            return None
+        self._due[key] = now + interval
+        try:
+            value = fetch()
+        except Exception as e:
+            print(f"Live stream: {key[0]} read failed: {e}")
+            return None
+        old = self._values.get(key)
+        if old == value:
+            return None
+        return old, value
+
+    def _publish(self, results):
+        """Store new values and send each subscriber the changes relevant to it"""
+        with self._lock:
+            for key, (_, value) in results.items():
+                self._values[key] = value
+            for sub in list(self._subscribers):
+                snapshot, update = {}, {}
+                for (name, site_id), (old, value) in results.items():
+                    if site_id is not None and site_id != sub.site["id"]:
+                        continue
+                    patch = _diff(old, value)
+                    if patch is None:
+                        snapshot[name] = value
+                    elif patch:
+                        update[name] = patch
+                if snapshot:
+                    sub.send("snapshot", snapshot)
+                if update:
+                    sub.send("update", update)
+                if sub.dropped:
+                    self._subscribers.discard(sub)
+
+    def step(self):
+        now = time.monotonic()
+        with self._lock:
+            sites = {sub.site["id"]: sub.site for sub in self._subscribers}
+
+        results = {}
+        for name, (fetch, interval) in SENSOR_SOURCES.items():
+            result = self._read((name, None), fetch, interval, now)
+            if result:
+                results[(name, None)] = result
+        for site_id, site in sites.items():
+            for name, (fetch, interval) in SITE_SOURCES.items():
+                result = self._read((name, site_id), lambda: fetch(site), interval, now)
+                if result:
+                    results[(name, site_id)] = result
+
+        if results:
+            self._publish(results)
+
+    def _run(self):
+        while True:
+            with self._lock:
+                if not self._subscribers:
+                    # Stop until the next client; start from fresh reads then
+                    self._thread = None
+                    self._due.clear()
+                    return
+            self.step()
+            self._wake.wait(self.tick)
+            self._wake.clear()
+
+
+stream = LiveStream()
@@ -0,0 +1,37 @@
+"""
+Location registry for multi-site deployments
+Sites can be overridden with LOCATIONS / DEFAULT_LOCATION in config.py
+"""
+
+# id -> site definition. `region` is matched against SMHI warning areas.
+DEFAULT_LOCATIONS = {
+    "ludvika": {
+        "name": "Ludvika",
+        "lat": 60.1496,
+        "lon": 15.1883,
+        "region": "Dalarna",
+    },
+}
+
+try:
+    from config import LOCATIONS
+except ImportError:
+    LOCATIONS = DEFAULT_LOCATIONS
+
+try:
+    from config import DEFAULT_LOCATION
+except ImportError:
+    DEFAULT_LOCATION = next(iter(LOCATIONS))
+
+
+def get_location(location_id=None):
+    """Return the site dict (with its id) or None if the id is unknown"""
+    location_id = (location_id or DEFAULT_LOCATION).lower()
+    site = LOCATIONS.get(location_id)
+    if site is None:
+        return None
+    return dict(site, id=location_id)
+
+
+def all_locations():
+    return [dict(site, id=location_id) for location_id, site in LOCATIONS.items()]
@@ -0,0 +1,42 @@
+"""
+Sliding-window min/max using monotonic deques
+Each add/expire is amortised O(1); min()/max() are O(1)
+"""
+from collections import deque
+
+
+class SlidingMinMax:
+    """Min and max of (timestamp, value) samples over the last `window` seconds
+
+    Timestamps must be added in increasing order.
+    """
+
+    def __init__(self, window_seconds):
+        self.window = window_seconds
+        self._mins = deque()   # values increasing from front to back
+        self._maxs = deque()   # values decreasing from front to back
+        self.last_ts = None
+
+    def add(self, ts, value):
+        if self.last_ts is not None and ts <= self.last_ts:
+            return
+        self.last_ts = ts
+        while self._mins and self._mins[-1][1] >= value:
+            self._mins.pop()
+        self._mins.append((ts, value))
+        while self._maxs and self._maxs[-1][1] <= value:
+            self._maxs.pop()
+        self._maxs.append((ts, value))
+
+    def expire(self, now):
+        cutoff = now - self.window
+        while self._mins and self._mins[0][0] < cutoff:
+            self._mins.popleft()
+        while self._maxs and self._maxs[0][0] < cutoff:
+            self._maxs.popleft()
+
+    def min(self):
+        return self._mins[0][1] if self._mins else None
+
+    def max(self):
+        return self._maxs[0][1] if self._maxs else None
@@ -5,12 +5,13 @@ Runs periodically to check thresholds and send push notifications
 """
 import time
 import json
-import os
 import sys
 import requests
 from datetime import datetime
 from influx import get_current_values, get_indoor_values
 from smhi import get_smhi_warnings
+from subscription_store import store as subscription_store
+from push_dispatcher import dispatcher as push_dispatcher
 
 # Default notification settings
 DEFAULT_SETTINGS = {
@@ -25,61 +26,31 @@ DEFAULT_SETTINGS = {
 last_notification_times = {}
 BACKEND_URL = "http://localhost:5000"
 
-def _subscriptions_path():
-    return os.path.join(os.path.dirname(__file__), 'push_subscriptions.json')
+# State changes from the current check cycle: { endpoint: { key: { lastSent, once } } }.
+# Written in one transaction by flush_state() at the end of check_all().
+pending_state = {}
 
-def _load_subscriptions():
-    path = _subscriptions_path()
-    if not os.path.exists(path):
-        return []
-    try:
-        with open(path, 'r') as f:
-            return json.load(f)
-    except Exception:
-        return []
+def _update_subscription_state(endpoint, key, once_flag=False, last_sent_ts=None):
+    node = pending_state.setdefault(endpoint, {}).setdefault(key, {})
+    if last_sent_ts is not None:
+        node['lastSent'] = float(last_sent_ts)
+    if once_flag:
+        node['once'] = True
 
-def _save_subscriptions(data):
-    path = _subscriptions_path()
+def flush_state():
+    """Persist this cycle's state changes; kept for the next cycle if the write fails"""
+    if not pending_state:
+        return
     try:
-        with open(path, 'w') as f:
-            json.dump(data, f, indent=2)
-        return True
+        updated = subscription_store.update_states(pending_state)
     except Exception as e:
-        print(f"✗ Failed to save subscriptions: {e}")
-        return False
-
-def _update_subscription_state(endpoint, key, once_flag=False, last_sent_ts=None):
-    data = _load_subscriptions()
-    updated = False
-    for i, entry in enumerate(data):
-        sub = entry.get('subscription', entry) if isinstance(entry, dict) else entry
-        ep = sub.get('endpoint', '') if isinstance(sub, dict) else ''
-        if ep == endpoint:
-            if isinstance(entry, dict):
-                state = entry.get('state', {})
-                node = state.get(key, {})
-                if last_sent_ts is not None:
-                    node['lastSent'] = float(last_sent_ts)
-                if once_flag:
-                    node['once'] = True
-                state[key] = node
-                entry['state'] = state
-                data[i] = entry
-                updated = True
-            else:
-                # Convert old format to new with minimal state
-                data[i] = {
-                    'subscription': sub,
-                    'settings': DEFAULT_SETTINGS,
-                    'state': { key: { 'lastSent': float(last_sent_ts or time.time()), 'once': bool(once_flag) } }
-                }
-                updated = True
-            break
-    if updated:
-        _save_subscriptions(data)
+        print(f"✗ Failed to save notification state: {e}")
+        return
+    print(f"✓ Saved notification state for {updated} subscription(s)")
+    pending_state.clear()
 
 def can_notify(endpoint, key, cooldown_seconds, settings, state):
-    """Decide whether to notify, respecting 'once' and cooldowns, and persist state"""
+    """Decide whether to notify, respecting 'once' and cooldowns, and record state"""
     now = time.time()
     # Respect one-time notifications
     if settings.get(key, {}).get('once'):
@@ -97,55 +68,57 @@ def can_notify(endpoint, key, cooldown_seconds, settings, state):
     
     if now - last_time >= float(cooldown_seconds or 0):
         last_notification_times[endpoint][key] = now
-        # Persist lastSent; if once is enabled, mark once on send site
+        # Record lastSent (saved by flush_state); if once is enabled, mark once on send site
         _update_subscription_state(endpoint, key, once_flag=False, last_sent_ts=now)
         return True
     return False
 
-def send_push_notification(title, body):
-    """Send push notification via backend API"""
-    try:
-        response = requests.post(
-            f"{BACKEND_URL}/api/push/send",
-            json={"title": title, "body": body},
-            timeout=10
-        )
-        if response.status_code == 200:
-            result = response.json()
-            print(f"✓ Push sent: {title} - {result.get('sent', 0)} recipients")
-            return True
-        else:
-            print(f"✗ Push failed: {response.status_code}")
-            return False
-    except Exception as e:
-        print(f"✗ Push error: {e}")
-        return False
+# Notifications from the current check cycle: { (title, body): [endpoint, ...] }.
+# Sent by deliver_notifications() as one targeted batch per message.
+outbox = {}
+
+def queue_notification(endpoint, title, body):
+    """Queue a notification for one subscriber; identical messages share a batch"""
+    outbox.setdefault((title, body), []).append(endpoint)
+
+def deliver_notifications(subscriptions):
+    """Send each queued message to the subscribers it was queued for
+
+    subscriptions maps endpoint -> subscription info. Expired subscriptions
+    reported by the push services are removed from the store.
+    """
+    expired = set()
+    for (title, body), endpoints in outbox.items():
+        targets = [subscriptions[e] for e in dict.fromkeys(endpoints) if e in subscriptions and e not in expired]
+        if not targets:
+            continue
+        try:
+            result = push_dispatcher.send(targets, title, body)
+        except Exception as e:
+            print(f"✗ Push error: {e}")
+            continue
+        expired.update(result["expired"])
+    outbox.clear()
+
+    if expired:
+        removed = subscription_store.delete_endpoints(expired)
+        print(f"✓ Removed {removed} expired subscription(s)")
 
 def load_user_settings():
     """Load notification settings + state per subscription"""
-    data = _load_subscriptions()
     result = []
     try:
-        for entry in data:
-            if not isinstance(entry, dict):
-                # Old format: subscription only
-                sub = entry
-                endpoint = sub.get('endpoint', '')
-                settings = DEFAULT_SETTINGS.copy()
-                state = {}
-            else:
-                sub = entry.get('subscription', {})
-                endpoint = sub.get('endpoint', '')
-                raw_settings = entry.get('settings', {})
-                # Deep-merge defaults
-                settings = json.loads(json.dumps(DEFAULT_SETTINGS))
-                for k, v in raw_settings.items():
-                    if isinstance(v, dict) and k in settings:
-                        settings[k].update(v)
-                    else:
-                        settings[k] = v
-                state = entry.get('state', {}) or {}
-            result.append({ 'endpoint': endpoint, 'settings': settings, 'state': state })
+        for entry in subscription_store.all():
+            endpoint = entry['endpoint']
+            # Deep-merge defaults
+            settings = json.loads(json.dumps(DEFAULT_SETTINGS))
+            for k, v in entry['settings'].items():
+                if isinstance(v, dict) and k in settings:
+                    settings[k].update(v)
+                else:
+                    settings[k] = v
+            state = entry['state'] or {}
+            result.append({ 'endpoint': endpoint, 'subscription': entry['subscription'], 'settings': settings, 'state': state })
         return result
     except Exception as e:
         print(f"✗ Error loading subscriptions: {e}")
@@ -161,7 +134,8 @@ def check_co2(endpoint, settings, state, indoor_data):
     cooldown = settings["co2"].get("cooldown", 3600)
     
     if co2 >= threshold and can_notify(endpoint, "co2", cooldown, settings, state):
-        send_push_notification(
+        queue_notification(
+            endpoint,
             "High CO₂ Detected",
             f"Indoor CO₂ is {int(co2)} ppm (≥ {threshold} ppm). Open windows to ventilate."
         )
@@ -178,7 +152,8 @@ def check_aurora(endpoint, settings, state, aurora_data):
     cooldown = settings["auroraChance"].get("cooldown", 7200)
     
     if chance >= threshold and can_notify(endpoint, "auroraChance", cooldown, settings, state):
-        send_push_notification(
+        queue_notification(
+            endpoint,
             "Aurora Opportunity!",
             f"Aurora chance is {int(chance)}% (≥ {threshold}%). Good viewing conditions!"
         )
@@ -195,7 +170,8 @@ def check_kp(endpoint, settings, state, aurora_data):
     cooldown = settings["kp"].get("cooldown", 10800)
     
     if kp >= threshold and can_notify(endpoint, "kp", cooldown, settings, state):
-        send_push_notification(
+        queue_notification(
+            endpoint,
             "High KP Index",
             f"KP index is {kp} (≥ {threshold}). Increased aurora activity expected."
         )
@@ -217,7 +193,8 @@ def check_smhi(endpoint, settings, state):
         
         if severe_warnings and can_notify(endpoint, "smhi", cooldown, settings, state):
             w = severe_warnings[0]
-            send_push_notification(
+            queue_notification(
+                endpoint,
                 "SMHI Weather Warning",
                 f"{w.get('event', 'Weather alert')}: {w.get('description', w.get('headline', ''))} from {w.get('area', 'Dalarna')}"
             )
@@ -236,7 +213,8 @@ def check_humidity(endpoint, settings, state, indoor_data):
     cooldown = settings["lowHumidity"].get("cooldown", 7200)
     
     if humidity > 0 and humidity <= threshold and can_notify(endpoint, "lowHumidity", cooldown, settings, state):
-        send_push_notification(
+        queue_notification(
+            endpoint,
             "Low Indoor Humidity",
             f"Indoor humidity is {int(humidity)}% (≤ {threshold}%). Consider using a humidifier."
         )
@@ -246,6 +224,7 @@ def check_humidity(endpoint, settings, state, indoor_data):
 def check_all():
     """Run all checks for all subscribed users"""
     print(f"\n[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] Running notification checks...")
+    subscriptions = {}
     
     try:
         # Load all user subscriptions with their settings
@@ -256,6 +235,7 @@ def check_all():
             return
         
         print(f"Checking notifications for {len(user_subscriptions)} subscription(s)")
+        subscriptions = {user['endpoint']: user['subscription'] for user in user_subscriptions}
         
         # Get current data once for all users
         outdoor_data = get_current_values()
@@ -287,6 +267,11 @@ def check_all():
         print(f"✗ Check failed: {e}")
         import traceback
         traceback.print_exc()
+    finally:
+        # One targeted send per message, then save state; also runs when a
+        # check failed part way, so queued notifications still go out
+        deliver_notifications(subscriptions)
+        flush_state()
 
 def main():
     """Main loop - check every 5 minutes"""
@@ -0,0 +1,78 @@
+"""
+Dense lat/lon index over the NOAA OVATION aurora grid
+Parsed once per forecast time, then looked up by index arithmetic
+"""
+import threading
+import numpy as np
+
+# OVATION publishes a 1° global grid as [Longitude, Latitude, Aurora]
+GRID_STEP = 1.0
+LON_CELLS = 360
+
+
+class OvationGrid:
+    """Aurora probability (%) on a regular lat x lon array"""
+
+    def __init__(self, forecast_time, lat_min, values):
+        self.forecast_time = forecast_time
+        self.lat_min = lat_min
+        self.values = values  # shape (n_lat, 360), float32
+        self.lat_max = lat_min + (values.shape[0] - 1) * GRID_STEP
+
+    @classmethod
+    def from_json(cls, data):
+        coords = np.asarray(data.get('coordinates', []), dtype=np.float32)
+        if coords.ndim != 2 or coords.shape[0] == 0:
+            raise ValueError("OVATION data has no coordinates")
+
+        lon_idx = np.rint(coords[:, 0] / GRID_STEP).astype(np.int64) % LON_CELLS
+        lat_idx = np.rint(coords[:, 1] / GRID_STEP).astype(np.int64)
+        lat_min = int(lat_idx.min())
+        n_lat = int(lat_idx.max()) - lat_min + 1
+
+        values = np.zeros((n_lat, LON_CELLS), dtype=np.float32)
+        values[lat_idx - lat_min, lon_idx] = coords[:, 2]
+        return cls(data.get('Forecast Time', ''), lat_min * GRID_STEP, values)
+
+    def probabilities(self, lats, lons):
+        """Bilinear-interpolated probability for arrays of coordinates"""
+        lats = np.asarray(lats, dtype=np.float64)
+        lons = np.asarray(lons, dtype=np.float64)
+
+        # Longitude wraps around (east longitudes negative or > 360 are fine)
+        x = np.mod(lons, 360.0) / GRID_STEP
+        x0 = np.floor(x).astype(np.int64) % LON_CELLS
+        x1 = (x0 + 1) % LON_CELLS
+        fx = x - np.floor(x)
+
+        # Latitude is clamped to the grid edges
+        n_lat = self.values.shape[0]
+        y = np.clip((lats - self.lat_min) / GRID_STEP, 0, n_lat - 1)
+        y0 = np.floor(y).astype(np.int64)
+        y1 = np.minimum(y0 + 1, n_lat - 1)
+        fy = y - y0
+
+        v = self.values
+        top = v[y0, x0] * (1 - fx) + v[y0, x1] * fx
+        bottom = v[y1, x0] * (1 - fx) + v[y1, x1] * fx
+        return top * (1 - fy) + bottom * fy
+
+    def probability(self, lat, lon):
+        return float(self.probabilities(lat, lon))
+
+
+_lock = threading.Lock()
+_latest = None
+
+
+def get_grid(data):
+    """Return the parsed grid for this document, reusing it while Forecast Time is unchanged"""
+    global _latest
+    forecast_time = data.get('Forecast Time', '')
+    with _lock:
+        if _latest is not None and forecast_time and _latest.forecast_time == forecast_time:
+            return _latest
+    grid = OvationGrid.from_json(data)
+    with _lock:
+        _latest = grid
+    return grid
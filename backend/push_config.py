@@ -5,5 +5,6 @@ VAPID_CLAIMS = {
     "sub": "mailto:admin@weather-dashboard.local"
 }
 
-# Push subscriptions storage (in production, use a database)
-SUBSCRIPTIONS_FILE = "push_subscriptions.json"
+# Push subscriptions storage (SQLite, see subscription_store.py)
+SUBSCRIPTIONS_DB = "push_subscriptions.db"
+SUBSCRIPTIONS_FILE = "push_subscriptions.json"   # Old JSON store, imported once into the database
@@ -0,0 +1,150 @@
+"""
+Concurrent web push fan-out
+One notification goes to many subscriptions from a bounded worker pool.
+Each push service host (FCM, Mozilla, Apple, WNS) gets its own concurrency
+limit and its own requests.Session, so connections are reused across a
+fan-out. 429 and 5xx responses are retried with exponential backoff,
+honouring Retry-After. send() returns a summary with one result per
+endpoint.
+"""
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+from pywebpush import WebPushException
+
+from push_config import VAPID_PRIVATE_KEY_PATH, VAPID_CLAIMS
+from push_handler import get_signer, notification_payload
+
+PUSH_WORKERS = 16           # Requests in flight across all push services
+PER_HOST_CONCURRENCY = 4    # Requests in flight to one push service
+MAX_ATTEMPTS = 3
+BACKOFF_SECONDS = 1.0       # Doubled after every retry, plus jitter
+MAX_RETRY_AFTER = 30        # Cap on a push service's Retry-After
+EXPIRED_STATUSES = {404, 410}   # Subscription is gone; remove it
+
+
+def _retry_after(response):
+    """Seconds from a Retry-After header (delta or HTTP date), or None"""
+    value = response.headers.get("Retry-After") if response is not None else None
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def _retryable(status):
+    return status is None or status == 429 or status >= 500
+
+
+class _Host:
+    """Concurrency limit and connection pool for one push service"""
+
+    def __init__(self, limit):
+        self.semaphore = threading.BoundedSemaphore(limit)
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=limit)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+
+class PushDispatcher:
+    def __init__(self, workers=PUSH_WORKERS, per_host=PER_HOST_CONCURRENCY, max_attempts=MAX_ATTEMPTS):
+        self.per_host = per_host
+        self.max_attempts = max_attempts
+        # Loads the VAPID key on first use and reuses signed headers per push service
+        self.signer = get_signer(VAPID_PRIVATE_KEY_PATH, VAPID_CLAIMS["sub"])
+        self._hosts = {}
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="push")
+
+    def _host(self, host):
+        with self._lock:
+            entry = self._hosts.get(host)
+            if entry is None:
+                entry = self._hosts[host] = _Host(self.per_host)
+            return entry
+
+    def _post(self, subscription, data, session):
+        """One signed push request; raises WebPushException on an error status"""
+        return self.signer.send(subscription, data, session=session)
+
+    def _deliver(self, subscription, data):
+        """Send to one subscription with retries; returns its result dict"""
+        endpoint = subscription.get('endpoint', '')
+        host = urlparse(endpoint).netloc
+        entry = self._host(host)
+        result = {"endpoint": endpoint, "host": host, "ok": False, "status": None,
+                  "attempts": 0, "expired": False, "error": None}
+        started = time.perf_counter()
+
+        for attempt in range(1, self.max_attempts + 1):
+            result["attempts"] = attempt
+            response = None
+            try:
+                with entry.semaphore:
+                    response = self._post(subscription, data, entry.session)
+                result.update(ok=True, status=getattr(response, "status_code", None), error=None)
+                break
+            except WebPushException as e:
+                response = e.response
+                status = response.status_code if response is not None else None
+                result.update(status=status, error=str(e))
+                if status in EXPIRED_STATUSES:
+                    result["expired"] = True
+                    break
+                if not _retryable(status):
+                    break
+            except requests.RequestException as e:
+                # Connection errors and timeouts are worth another try
+                result.update(status=None, error=str(e))
+            except Exception as e:
+                result.update(status=None, error=str(e))
+                break
+
+            if attempt < self.max_attempts:
+                delay = _retry_after(response)
+                if delay is None:
+                    delay = BACKOFF_SECONDS * 2 ** (attempt - 1) + random.uniform(0, BACKOFF_SECONDS / 2)
+                time.sleep(min(delay, MAX_RETRY_AFTER))
+
+        result["ms"] = round((time.perf_counter() - started) * 1000, 1)
+        return result
+
+    def send(self, subscriptions, title, body):
+        """Push one notification to every subscription concurrently
+
+        Returns {"sent", "failed", "expired": [endpoints], "results": [...]}
+        with one result per subscription, in input order.
+        """
+        data = notification_payload(title, body)
+        futures = [self._pool.submit(self._deliver, sub, data) for sub in subscriptions]
+        results = [f.result() for f in futures]
+
+        sent = sum(1 for r in results if r["ok"])
+        expired = [r["endpoint"] for r in results if r["expired"]]
+        print(f"Push '{title}': {sent}/{len(results)} sent, {len(expired)} expired, "
+              f"{len(results) - sent - len(expired)} failed")
+        for r in results:
+            if not r["ok"]:
+                print(f"  ✗ {r['host']} ({r['status']}, {r['attempts']} attempt(s)): {r['error']}")
+        return {
+            "sent": sent,
+            "failed": len(results) - sent,
+            "expired": expired,
+            "results": results,
+        }
+
+
+dispatcher = PushDispatcher()
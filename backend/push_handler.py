@@ -4,10 +4,18 @@ Web Push Handler - Wrapper for pywebpush with proper key handling
 import json
 import base64
 import sys
-from pywebpush import webpush, WebPushException
+import threading
+import time
+from urllib.parse import urlparse
+from py_vapid import Vapid
+from pywebpush import WebPusher, WebPushException
 from cryptography.hazmat.primitives import serialization
 from cryptography.hazmat.backends import default_backend
 
+PUSH_TIMEOUT = 10
+VAPID_TTL = 12 * 3600           # Lifetime of a signed VAPID JWT (push services allow up to 24h)
+VAPID_REFRESH_MARGIN = 600      # Re-sign this long before the cached JWT expires
+
 def log(msg):
     """Print to stdout so Flask logs it"""
     print(msg, file=sys.stdout, flush=True)
@@ -32,47 +40,110 @@ def load_vapid_private_key(key_path):
     log(f"VAPID key loaded successfully")
     return d_bytes
 
+def push_audience(endpoint):
+    """VAPID audience (scheme://host) of a push endpoint"""
+    try:
+        parsed = urlparse(endpoint)
+        if parsed.scheme and parsed.netloc:
+            return f"{parsed.scheme}://{parsed.netloc}"
+    except ValueError:
+        pass
+    return "https://fcm.googleapis.com"
+
+def notification_payload(title, body):
+    """JSON payload the service worker shows as a notification"""
+    return json.dumps({
+        "title": title,
+        "body": body,
+        "icon": "/icon-192.png"
+    })
+
+class PushSigner:
+    """
+    VAPID signing for one key, reused across pushes.
+    The key is loaded once; the signed VAPID header for each push service
+    (audience) is cached until VAPID_REFRESH_MARGIN before it expires, so
+    the only per-message work left is encrypting the payload.
+    """
+
+    def __init__(self, private_key_path, vapid_subject, ttl=VAPID_TTL):
+        self.private_key_path = private_key_path
+        self.vapid_subject = vapid_subject
+        self.ttl = ttl
+        self._vapid = None
+        self._headers = {}      # aud -> (exp, headers)
+        self._lock = threading.Lock()
+
+    def _key(self):
+        if self._vapid is None:
+            # Convert private key bytes to URL-safe base64
+            private_key_bytes = load_vapid_private_key(self.private_key_path)
+            self._vapid = Vapid.from_raw(base64.urlsafe_b64encode(private_key_bytes).rstrip(b'='))
+        return self._vapid
+
+    def headers(self, endpoint):
+        """VAPID Authorization headers for an endpoint's push service"""
+        aud = push_audience(endpoint)
+        now = time.time()
+        with self._lock:
+            cached = self._headers.get(aud)
+            if cached is None or cached[0] - VAPID_REFRESH_MARGIN <= now:
+                exp = int(now) + self.ttl
+                cached = self._headers[aud] = (exp, self._key().sign({
+                    "sub": self.vapid_subject,
+                    "aud": aud,
+                    "exp": exp
+                }))
+        # WebPusher.send adds its own headers to the dict it is given
+        return dict(cached[1])
+
+    def send(self, subscription_info, data, session=None, timeout=PUSH_TIMEOUT, ttl=0):
+        """Encrypt and send one push; raises WebPushException on an error response"""
+        response = WebPusher(subscription_info, requests_session=session).send(
+            data,
+            headers=self.headers(subscription_info.get('endpoint', '')),
+            ttl=ttl,
+            content_encoding="aes128gcm",
+            timeout=timeout
+        )
+        # Same success check as pywebpush.webpush()
+        if response.status_code > 202:
+            raise WebPushException(
+                f"Push failed: {response.status_code} {response.reason}\nResponse body:{response.text}",
+                response=response
+            )
+        return response
+
+_signers = {}
+_signers_lock = threading.Lock()
+
+def get_signer(private_key_path, vapid_subject):
+    """Shared PushSigner per key file and subject"""
+    with _signers_lock:
+        signer = _signers.get((private_key_path, vapid_subject))
+        if signer is None:
+            signer = _signers[(private_key_path, vapid_subject)] = PushSigner(private_key_path, vapid_subject)
+        return signer
+
+def post_web_push(subscription_info, data, private_key_path, vapid_subject, session=None, timeout=PUSH_TIMEOUT):
+    """Send one push request; raises WebPushException on an error response"""
+    return get_signer(private_key_path, vapid_subject).send(subscription_info, data, session=session, timeout=timeout)
+
 def send_web_push(subscription_info, title, body, private_key_path, vapid_subject):
     """Send web push notification with proper key handling"""
     try:
         log(f"Sending push: {title}")
         endpoint = subscription_info.get('endpoint', '')
         log(f"  Endpoint: {endpoint[:80]}...")
-        
-        # Convert private key bytes to URL-safe base64
-        private_key_bytes = load_vapid_private_key(private_key_path)
-        private_key_b64 = base64.urlsafe_b64encode(private_key_bytes).decode().rstrip('=')
-        
-        # Extract audience from endpoint URL
-        try:
-            from urllib.parse import urlparse
-            parsed = urlparse(endpoint)
-            aud = f"{parsed.scheme}://{parsed.netloc}"
-        except:
-            aud = "https://fcm.googleapis.com"
-        
-        log(f"  Audience: {aud}")
-        
+        log(f"  Audience: {push_audience(endpoint)}")
+
         # Prepare notification payload
-        notification_data = json.dumps({
-            "title": title,
-            "body": body,
-            "icon": "/icon-192.png"
-        })
-        
+        notification_data = notification_payload(title, body)
         log(f"  Payload: {notification_data}")
-        
+
         # Send push notification
-        webpush(
-            subscription_info=subscription_info,
-            data=notification_data,
-            vapid_private_key=private_key_b64,
-            vapid_claims={
-                "sub": vapid_subject,
-                "aud": aud
-            }
-        )
-        
+        post_web_push(subscription_info, notification_data, private_key_path, vapid_subject)
+
         log(f"✓ Push sent successfully")
         return True, "Push sent successfully"
     except WebPushException as e:
@@ -85,4 +156,3 @@ def send_web_push(subscription_info, title, body, private_key_path, vapid_subjec
         import traceback
         traceback.print_exc()
         return False, f"Error: {str(e)}"
-
@@ -1,6 +1,6 @@
-import requests
-from datetime import datetime, timezone
+from datetime import datetime, timedelta, timezone
 import math
+from upstream_cache import cache, get_json, fetch_json
 
 SMHI_URL = "https://opendata-download-warnings.smhi.se/ibww/api/version/1/warning.json"
 
@@ -8,6 +8,8 @@ SMHI_URL = "https://opendata-download-warnings.smhi.se/ibww/api/version/1/warnin
 DALARNA_LAT = 60.1496
 DALARNA_LON = 15.1883
 
+SMHI_FORECAST_URL = "https://opendata-download-metfcst.smhi.se/api/category/pmp3g/version/2/geotype/point/lon/{lon}/lat/{lat}/data.json"
+
 
 def safe_parse_time(t):
     """Convert SMHI time format to ISO8601 (or None)"""
@@ -19,21 +21,25 @@ def safe_parse_time(t):
         return None
 
 
-def get_smhi_warnings():
+def get_smhi_warnings(region="Dalarna"):
     """
     Robust SMHI warning parser for the current API format (2026).
-    Parses warnings with warningAreas and filters for Dalarna region.
+    Parses warnings with warningAreas and filters for the given region.
+    The warnings document itself is shared (cached) across all regions.
     """
-
     try:
-        response = requests.get(SMHI_URL, timeout=10)
-        response.raise_for_status()
-        data = response.json()
+        data = get_json("smhi_warnings", SMHI_URL)
     except Exception as e:
         return {
             "error": f"Failed to fetch SMHI warnings: {e}",
             "warnings": []
         }
+    return parse_warnings(data, region)
+
+
+def parse_warnings(data, region="Dalarna"):
+    """Warnings affecting `region` from the SMHI warnings document"""
+    region_key = region.lower()
 
     # Current SMHI format (2026): List of warning objects
     if not isinstance(data, list):
@@ -47,19 +53,19 @@ def get_smhi_warnings():
             event_obj = item.get("event", {})
             event_name = event_obj.get("sv", "Unknown") if isinstance(event_obj, dict) else str(event_obj)
             
-            # Check warningAreas for Dalarna
+            # Check warningAreas for the region
             warning_areas = item.get("warningAreas", [])
             
             for area in warning_areas:
-                # Check if this warning area affects Dalarna
+                # Check if this warning area affects the region
                 affected_areas = area.get("affectedAreas", [])
-                is_dalarna = any(
-                    "dalarna" in str(a.get("sv", "")).lower() or 
-                    "dalarna" in str(a.get("en", "")).lower()
+                in_region = any(
+                    region_key in str(a.get("sv", "")).lower() or 
+                    region_key in str(a.get("en", "")).lower()
                     for a in affected_areas
                 )
                 
-                if not is_dalarna:
+                if not in_region:
                     continue
                 
                 # Extract warning level
@@ -76,7 +82,7 @@ def get_smhi_warnings():
                 
                 # Get area name
                 area_name_obj = area.get("areaName", {})
-                area_name = area_name_obj.get("sv", "Dalarna") if isinstance(area_name_obj, dict) else "Dalarna"
+                area_name = area_name_obj.get("sv", region) if isinstance(area_name_obj, dict) else region
                 
                 # Get event description
                 event_desc_obj = area.get("eventDescription", {})
@@ -103,13 +109,19 @@ def get_smhi_warnings():
     }
 
 
-def calculate_sun_times(lat, lon):
+def calculate_sun_times(lat, lon, when=None):
     """
     Calculate approximate sunrise and sunset times for given coordinates.
     Uses simplified algorithm - good enough for weather dashboard.
     Returns times in local Swedish time (UTC+1/UTC+2 depending on DST).
+    `when` (default now) selects the day and is_night hour; an aware datetime
+    is converted to Swedish time, so the result doesn't depend on the host's
+    timezone. A naive one is taken to be Swedish time already.
     """
-    now = datetime.now()
+    now = when or datetime.now(timezone.utc)
+    if now.tzinfo is not None:
+        utc = now.astimezone(timezone.utc).replace(tzinfo=None)
+        now = utc + timedelta(hours=2 if 3 <= utc.month <= 10 else 1)
     
     # Day of year
     day_of_year = now.timetuple().tm_yday
@@ -158,73 +170,121 @@ def calculate_sun_times(lat, lon):
     }
 
 
-def get_sun_times():
-    """Get sunrise/sunset times for Dalarna, Sweden"""
-    return calculate_sun_times(DALARNA_LAT, DALARNA_LON)
+def get_sun_times(lat=DALARNA_LAT, lon=DALARNA_LON):
+    """Get sunrise/sunset times (defaults to Dalarna, Sweden)"""
+    return calculate_sun_times(lat, lon)
+
+
+class PointForecast:
+    """
+    Compact, column-oriented view of one SMHI pmp3g point forecast.
+    `times` holds the validTime strings and `columns` maps each parameter
+    name to a list of values aligned with `times` (None where missing).
+    `names` holds the parameter names each entry listed, in its order.
+    """
+    __slots__ = ("approved_time", "times", "columns", "names")
+
+    def __init__(self, data):
+        self.approved_time = data.get("approvedTime")
+        series = data.get("timeSeries", []) or []
+        self.times = []
+        self.columns = {}
+        self.names = []
+        shared_names = {}   # Entries mostly list the same parameters: one tuple each
+
+        for entry in series:
+            idx = len(self.times)
+            try:
+                values = {p["name"]: p.get("values", [None])[0] for p in entry.get("parameters", [])}
+            except Exception:
+                # Skip malformed entries
+                continue
+            self.times.append(entry.get("validTime"))
+            names = tuple(values)
+            self.names.append(shared_names.setdefault(names, names))
+            for name, value in values.items():
+                column = self.columns.get(name)
+                if column is None:
+                    column = self.columns[name] = [None] * idx
+                column.append(value)
+            for name, column in self.columns.items():
+                if len(column) == idx:
+                    column.append(None)
+
+    def __len__(self):
+        return len(self.times)
+
+    def value(self, name, index=0, default=None):
+        column = self.columns.get(name)
+        if column is None or index >= len(column) or column[index] is None:
+            return default
+        return column[index]
+
+    def row(self, index):
+        """Parameters for one validTime as { name: value }, with every
+        parameter the entry listed (None if it had no value)"""
+        return {name: self.columns[name][index] for name in self.names[index]}
+
+
+def get_point_forecast(lat=DALARNA_LAT, lon=DALARNA_LON):
+    """
+    Download and parse the SMHI point forecast once per update cycle.
+    The parsed PointForecast is what gets cached, so forecast, timeseries and
+    aurora consumers all share one download and one parse.
+    """
+    url = SMHI_FORECAST_URL.format(lat=lat, lon=lon)
+    return cache.get("smhi_forecast", url, lambda: PointForecast(fetch_json(url)))
 
 
-def get_smhi_forecast():
+def get_smhi_forecast(lat=DALARNA_LAT, lon=DALARNA_LON):
     """
-    Get current weather forecast from SMHI for Dalarna.
+    Get current weather forecast from SMHI (defaults to Dalarna).
     Returns weather symbol and key parameters.
     """
-    url = f"https://opendata-download-metfcst.smhi.se/api/category/pmp3g/version/2/geotype/point/lon/{DALARNA_LON}/lat/{DALARNA_LAT}/data.json"
-    
     try:
-        response = requests.get(url, timeout=10)
-        response.raise_for_status()
-        data = response.json()
-        
-        # Get the first (current) time period
-        if not data.get('timeSeries') or len(data['timeSeries']) == 0:
-            return {"error": "No forecast data available"}
-        
-        current = data['timeSeries'][0]
-        params = {p['name']: p['values'][0] for p in current['parameters']}
-        
-        return {
-            "symbol": params.get('Wsymb2', 1),  # Weather symbol
-            "temperature": params.get('t'),
-            "humidity": params.get('r'),
-            "pressure": params.get('msl'),
-            "visibility": params.get('vis'),
-            "cloud_cover": params.get('tcc_mean'),
-            "wind_speed": params.get('ws'),
-            "precipitation": params.get('pcat', 0)
-        }
-        
+        return summarize_forecast(get_point_forecast(lat, lon))
     except Exception as e:
         return {"error": f"Failed to fetch SMHI forecast: {e}"}
 
 
-def get_smhi_timeseries(limit=24):
+def summarize_forecast(forecast):
+    """Current conditions (first time period) from a PointForecast"""
+    # Get the first (current) time period
+    if len(forecast) == 0:
+        return {"error": "No forecast data available"}
+
+    params = forecast.row(0)
+
+    return {
+        "symbol": params.get('Wsymb2', 1),  # Weather symbol
+        "temperature": params.get('t'),
+        "humidity": params.get('r'),
+        "pressure": params.get('msl'),
+        "visibility": params.get('vis'),
+        "cloud_cover": params.get('tcc_mean'),
+        "wind_speed": params.get('ws'),
+        "precipitation": params.get('pcat', 0)
+    }
+
+
+def get_smhi_timeseries(limit=24, lat=DALARNA_LAT, lon=DALARNA_LON):
     """
     Return SMHI raw time series for the given coordinates.
     Limits to the first `limit` entries (default 24 hours).
     Each entry is simplified to { validTime: str, params: { name: value } }.
     """
-    url = f"https://opendata-download-metfcst.smhi.se/api/category/pmp3g/version/2/geotype/point/lon/{DALARNA_LON}/lat/{DALARNA_LAT}/data.json"
-
     try:
-        response = requests.get(url, timeout=10)
-        response.raise_for_status()
-        data = response.json()
+        return summarize_timeseries(get_point_forecast(lat, lon), limit)
+    except Exception as e:
+        return {"error": f"Failed to fetch SMHI timeseries: {e}", "timeSeries": [], "count": 0}
 
-        series = data.get("timeSeries", [])
-        trimmed = series[:limit] if limit and isinstance(limit, int) else series
 
-        simplified = []
-        for entry in trimmed:
-            try:
-                params = {p.get("name"): (p.get("values", [None])[0]) for p in entry.get("parameters", [])}
-                simplified.append({
-                    "validTime": entry.get("validTime"),
-                    "params": params
-                })
-            except Exception:
-                # Skip malformed entries
-                continue
+def summarize_timeseries(forecast, limit=24):
+    """First `limit` entries of a PointForecast as { validTime, params }"""
+    count = min(limit, len(forecast)) if limit and isinstance(limit, int) else len(forecast)
+    simplified = [
+        {"validTime": forecast.times[i], "params": forecast.row(i)}
+        for i in range(count)
+    ]
 
-        return {"timeSeries": simplified, "count": len(simplified)}
-    except Exception as e:
-        return {"error": f"Failed to fetch SMHI timeseries: {e}", "timeSeries": [], "count": 0}
+    return {"timeSeries": simplified, "count": len(simplified)}
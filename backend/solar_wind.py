@@ -0,0 +1,140 @@
+"""
+Rolling in-memory buffers of NOAA real-time solar wind samples
+The first fill reads the 1-day product; after that each refresh reads the
+smallest product (5-minute, 2-hour, ...) that still covers the time since
+the newest buffered sample, so a normal refresh parses a handful of rows
+instead of ~1,440. Recent means smooth the inputs to the aurora model.
+"""
+import math
+import threading
+import time
+from collections import deque
+from datetime import datetime, timezone
+
+PRODUCT_URL = "https://services.swpc.noaa.gov/products/solar-wind/{kind}-{window}.json"
+
+# Product window -> seconds of data it covers, smallest first
+PRODUCT_WINDOWS = [
+    ("5-minute", 300),
+    ("2-hour", 7200),
+    ("6-hour", 21600),
+    ("1-day", 86400),
+]
+OVERLAP_SECONDS = 120       # Extra coverage so publishing delays don't leave gaps
+BUFFER_SECONDS = 24 * 3600
+MEAN_SECONDS = 30 * 60
+
+
+def parse_time_tag(tag):
+    """NOAA time_tag ("2026-01-01 12:34:00.000") to a UTC timestamp"""
+    return datetime.strptime(tag[:19], "%Y-%m-%d %H:%M:%S").replace(tzinfo=timezone.utc).timestamp()
+
+
+def _float(value):
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        return None
+    return value if math.isfinite(value) else None
+
+
+class SolarWindBuffer:
+    """Time-ordered samples from one NOAA product family ("mag" or "plasma")
+
+    `fields` maps NOAA column names to sample keys, e.g. {"bz_gsm": "bz"}.
+    Missing/null readings are kept as None and skipped by latest()/mean().
+    """
+
+    def __init__(self, kind, fields, buffer_seconds=BUFFER_SECONDS):
+        self.kind = kind
+        self.fields = fields
+        self.buffer_seconds = buffer_seconds
+        self._samples = deque()     # (timestamp, {key: value}), oldest first
+        self._last_tag = None
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._samples)
+
+    def url(self, now=None):
+        """Smallest product that covers everything since the newest sample"""
+        with self._lock:
+            newest = self._samples[-1][0] if self._samples else None
+        if newest is None:
+            window = PRODUCT_WINDOWS[-1][0]
+        else:
+            gap = (now or time.time()) - newest + OVERLAP_SECONDS
+            window = next((w for w, seconds in PRODUCT_WINDOWS if seconds >= gap), PRODUCT_WINDOWS[-1][0])
+        return PRODUCT_URL.format(kind=self.kind, window=window)
+
+    def ingest(self, data):
+        """Append rows newer than the newest sample; returns how many were added
+
+        Rows come oldest first after a header row, so only the tail past the
+        last seen time_tag is parsed.
+        """
+        if not data or len(data) < 2:
+            return 0
+        header = data[0]
+        try:
+            time_col = header.index("time_tag")
+        except ValueError:
+            return 0
+        columns = {key: header.index(col) for col, key in self.fields.items() if col in header}
+
+        with self._lock:
+            new_rows = []
+            for row in reversed(data[1:]):
+                tag = row[time_col] if len(row) > time_col else None
+                if not tag:
+                    continue
+                if self._last_tag is not None and tag <= self._last_tag:
+                    break
+                new_rows.append(row)
+
+            for row in reversed(new_rows):
+                try:
+                    ts = parse_time_tag(row[time_col])
+                except (TypeError, ValueError):
+                    continue
+                values = {key: _float(row[i]) if i < len(row) else None for key, i in columns.items()}
+                self._samples.append((ts, values))
+                self._last_tag = row[time_col]
+
+            if self._samples:
+                cutoff = self._samples[-1][0] - self.buffer_seconds
+                while self._samples[0][0] < cutoff:
+                    self._samples.popleft()
+        return len(new_rows)
+
+    def latest(self, key):
+        """Newest non-null value of `key`, or None"""
+        with self._lock:
+            for _, values in reversed(self._samples):
+                if values.get(key) is not None:
+                    return values[key]
+        return None
+
+    def mean(self, key, seconds=MEAN_SECONDS):
+        """Mean of `key` over the `seconds` before the newest sample, or None"""
+        with self._lock:
+            if not self._samples:
+                return None
+            cutoff = self._samples[-1][0] - seconds
+            total, count = 0.0, 0
+            for ts, values in reversed(self._samples):
+                if ts < cutoff:
+                    break
+                value = values.get(key)
+                if value is not None:
+                    total += value
+                    count += 1
+        return total / count if count else None
+
+    def newest_time(self):
+        """ISO time of the newest sample, or None"""
+        with self._lock:
+            if not self._samples:
+                return None
+            ts = self._samples[-1][0]
+        return datetime.fromtimestamp(ts, timezone.utc).isoformat()
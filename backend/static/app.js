@@ -562,17 +562,51 @@ function applyWeatherVisuals(ws) {
 }
 
 
+// ----------------------------------------------------
+// LIVE DATA (SSE stream with polling fallback)
+// ----------------------------------------------------
+// current/indoor/minmax/aurora/smhi/forecast come from /api/stream while it
+// is connected (see live-stream.js); otherwise they are fetched as before
+async function getLive(name) {
+  if (window.liveStream) return window.liveStream.get(name);
+  const res = await fetch(`${API}/api/${name}`);
+  return res.json();
+}
+
+// Several sources in one round trip (stream, or a batched /api/dashboard)
+async function getLiveMany(names) {
+  if (window.liveStream) return window.liveStream.getMany(names);
+  const res = await fetch(`${API}/api/dashboard?fields=${names.join(',')}`);
+  return res.json();
+}
+
+function isStreamLive() {
+  return Boolean(window.liveStream && window.liveStream.isLive());
+}
+
+// Redraw whatever the stream just changed
+function handleStreamUpdate(changed) {
+  if (changed.includes('current') || changed.includes('minmax')) updateData();
+  if (changed.includes('smhi')) updateSMHI();
+  if (changed.includes('forecast')) updateSMHIForecast();
+  if (changed.includes('aurora')) updateAuroraData();
+
+  const activeTab = document.querySelector('.tab-content.active');
+  if (!activeTab) return;
+  if (activeTab.id === 'indoor-content' && changed.includes('indoor')) {
+    updateIndoorPage();
+  } else if (activeTab.id === 'overview-content' && changed.some(name => name !== 'minmax')) {
+    updateOverviewPage();
+  }
+}
+
 // ----------------------------------------------------
 // FETCH SENSOR DATA
 // ----------------------------------------------------
 async function updateData() {
   try {
-    const res = await fetch(`${API}/api/current`);
-    const sensor = await res.json();
-    
-    // Fetch 24h min/max data
-    const minmaxRes = await fetch(`${API}/api/minmax`);
-    const minmax = await minmaxRes.json();
+    // Current values and 24h min/max in one request
+    const { current: sensor, minmax } = await getLiveMany(['current', 'minmax']);
 
     // Update main temperature display
     if (mainTempEl) {
@@ -840,13 +874,12 @@ function updateMoonPhase() {
 // Fetch SMHI forecast
 async function updateSMHIForecast() {
   try {
-    const res = await fetch(`${API}/api/forecast`);
-    smhiForecast = await res.json();
+    // Forecast plus current values for the background/condition update
+    const { forecast, current: sensor } = await getLiveMany(['forecast', 'current']);
+    smhiForecast = forecast;
     console.log("SMHI forecast:", smhiForecast);
     
     // Trigger background and condition update after getting SMHI data
-    const sensorRes = await fetch(`${API}/api/current`);
-    const sensor = await sensorRes.json();
     
     updateBackgroundForCurrentWeather(sensor);
     weatherState = deriveWeatherState(sensor, currentSmhiData);
@@ -1222,8 +1255,7 @@ function computeActualCondition(sensor) {
 // ----------------------------------------------------
 async function updateSMHI() {
   try {
-    const res = await fetch(`${API}/api/smhi`);
-    const data = await res.json();
+    const data = await getLive('smhi');
     currentSmhiData = data;
 
     if (smhiWarningsEl) {
@@ -1700,12 +1732,53 @@ function initChart() {
   });
 }
 
+// ============================================
+// HISTORY (compact columnar format)
+// ============================================
+const HISTORY_MONTHS = ['Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec'];
+
+// Same labels the server used to build (UTC, "%d %b %H:%M" etc.)
+function formatHistoryLabel(date, range) {
+  const pad = n => String(n).padStart(2, '0');
+  const day = `${pad(date.getUTCDate())} ${HISTORY_MONTHS[date.getUTCMonth()]}`;
+  const time = `${pad(date.getUTCHours())}:${pad(date.getUTCMinutes())}`;
+  
+  if (range === '1m') return day;
+  if (range === '2d' || range === '4d' || range === '1w') return `${day} ${time}`;
+  
+  // 24h: show date for yesterday, time only for today
+  const today = new Date().toISOString().slice(0, 10);
+  return date.toISOString().slice(0, 10) < today ? `${day} ${time}` : time;
+}
+
+// Expand { start, step, count, fields } into { timestamps, <field>: [...] }
+function expandCompactHistory(data, range) {
+  const fields = data.fields || {};
+  const names = Object.keys(fields);
+  const history = { timestamps: [] };
+  names.forEach(name => { history[name] = []; });
+  
+  for (let i = 0; i < (data.count || 0); i++) {
+    // Skip empty windows, like the legacy format did
+    if (names.every(name => fields[name][i] === null)) continue;
+    
+    const date = new Date((data.start + i * data.step) * 1000);
+    history.timestamps.push(formatHistoryLabel(date, range));
+    names.forEach(name => history[name].push(fields[name][i]));
+  }
+  return history;
+}
+
+async function fetchHistory(endpoint, range = '24h') {
+  const res = await fetch(`${endpoint}?range=${range}&format=compact`);
+  return expandCompactHistory(await res.json(), range);
+}
+
 async function updateChart() {
   if (!weatherChart) return;
   
   try {
-    const res = await fetch(`${API}/api/history`);
-    const data = await res.json();
+    const data = await fetchHistory(`${API}/api/history`);
     
     if (data && data.timestamps && data.timestamps.length > 0) {
       // Convert timestamps to include day name
@@ -1853,22 +1926,27 @@ async function initializeApp() {
     setTimeout(hideLoading, 1000);
   }
 
+  // Live data is pushed over /api/stream; the timers below only poll it
+  // while the stream is down
+  if (window.liveStream) window.liveStream.onUpdate(handleStreamUpdate);
+
   // Consolidated update loop - single interval with counters
   let updateCounter = 0;
   setInterval(() => {
     updateCounter++;
+    const live = isStreamLive();
     
     // Every 10 seconds: sensor data
-    if (updateCounter % 1 === 0) updateData();
+    if (!live && updateCounter % 1 === 0) updateData();
 
     // Every 30 seconds: refresh Overview page (hero + comparisons + sparklines)
-    if (updateCounter % 3 === 0) updateOverviewPage();
+    if (!live && updateCounter % 3 === 0) updateOverviewPage();
     
     // Every 1 minute: sun position
     if (updateCounter % 6 === 0) updateSunPosition();
     
     // Every 5 minutes: SMHI weather and aurora data
-    if (updateCounter % 30 === 0) {
+    if (!live && updateCounter % 30 === 0) {
       updateSMHI();
       updateSMHIForecast();
       updateAuroraData();  // OVATION model updates every ~15 min, so check every 5 min
@@ -1912,8 +1990,7 @@ function updateGaugeArc(arcId, percentage) {
 // Update Northern Lights / Aurora data
 async function updateAuroraData() {
   try {
-    const response = await fetch(`${API}/api/aurora`);
-    const data = await response.json();
+    const data = await getLive('aurora');
     
     // KP Index Badge
     const kpElement = document.getElementById('kp-value');
@@ -1975,8 +2052,11 @@ async function updateAuroraData() {
     const solarWindStatus = document.getElementById('solar-wind-status');
     if (solarWindValue && solarWindStatus) {
       const speed = data.solar_wind_speed;
-      solarWindValue.textContent = `${Math.round(speed)} km/s`;
-      if (speed >= 500) {
+      solarWindValue.textContent = speed == null ? '-- km/s' : `${Math.round(speed)} km/s`;
+      if (speed == null) {
+        solarWindStatus.textContent = 'No data';
+        solarWindStatus.className = 'metric-status';
+      } else if (speed >= 500) {
         solarWindStatus.textContent = 'Fast - Aurora likely';
         solarWindStatus.className = 'metric-status status-good';
       } else if (speed >= 400) {
@@ -1994,8 +2074,11 @@ async function updateAuroraData() {
     if (bzValue && bzStatus) {
       const bz = data.bz_component;
       const direction = bz < 0 ? '↓S' : '↑N';
-      bzValue.textContent = `${bz.toFixed(1)} nT ${direction}`;
-      if (bz < -5) {
+      bzValue.textContent = bz == null ? '-- nT' : `${bz.toFixed(1)} nT ${direction}`;
+      if (bz == null) {
+        bzStatus.textContent = 'No data';
+        bzStatus.className = 'metric-status';
+      } else if (bz < -5) {
         bzStatus.textContent = 'Strong South - Excellent!';
         bzStatus.className = 'metric-status status-good';
       } else if (bz < 0) {
@@ -2012,8 +2095,11 @@ async function updateAuroraData() {
     const cloudStatus = document.getElementById('cloud-status');
     if (cloudValue && cloudStatus) {
       const clouds = data.cloud_coverage;
-      cloudValue.textContent = `${clouds}/8`;
-      if (clouds <= 2) {
+      cloudValue.textContent = clouds == null ? '--/8' : `${clouds}/8`;
+      if (clouds == null) {
+        cloudStatus.textContent = 'Unknown';
+        cloudStatus.className = 'metric-status';
+      } else if (clouds <= 2) {
         cloudStatus.textContent = 'Clear - Excellent';
         cloudStatus.className = 'metric-status status-good';
       } else if (clouds <= 5) {
@@ -2031,10 +2117,13 @@ async function updateAuroraData() {
     if (visValue && visStatus) {
       const vis = data.visibility_km;
       const clouds = data.cloud_coverage;
-      visValue.textContent = `${vis.toFixed(1)} km`;
+      visValue.textContent = vis == null ? '-- km' : `${vis.toFixed(1)} km`;
       
       // If overcast, visibility doesn't matter for aurora
-      if (clouds >= 7) {
+      if (vis == null) {
+        visStatus.textContent = 'Unknown';
+        visStatus.className = 'metric-status';
+      } else if (clouds >= 7) {
         visStatus.textContent = 'Sky Blocked by Clouds';
         visStatus.className = 'metric-status status-bad';
       } else if (vis >= 10) {
@@ -2079,8 +2168,7 @@ async function updateAuroraData() {
 // ==========================================
 async function updateIndoorPage() {
   try {
-    const response = await fetch(`${API}/api/indoor`);
-    const data = await response.json();
+    const data = await getLive('indoor');
     
     // Climate metrics
     if (document.getElementById('indoor-temp')) {
@@ -2304,13 +2392,7 @@ async function updateOverviewPage() {
 async function updateComparisonPage() {
   try {
     // Fetch current indoor and outdoor data
-    const [outdoorRes, indoorRes] = await Promise.all([
-      fetch(`${API}/api/current`),
-      fetch(`${API}/api/indoor`)
-    ]);
-    
-    const outdoor = await outdoorRes.json();
-    const indoor = await indoorRes.json();
+    const { current: outdoor, indoor } = await getLiveMany(['current', 'indoor']);
     
     // Update temperature comparison
     const indoorTempEl = document.getElementById('overview-indoor-temp');
@@ -2370,14 +2452,11 @@ function updateTrendArrow(indoorId, outdoorId, indoorVal, outdoorVal) {
 async function drawSparklines() {
   try {
     // Fetch 24h history for both indoor and outdoor
-    const [outdoorRes, indoorRes] = await Promise.all([
-      fetch(`${API}/api/history?range=24h`),
-      fetch(`${API}/api/indoor-history?range=24h`)
+    const [outdoor, indoor] = await Promise.all([
+      fetchHistory(`${API}/api/history`, '24h'),
+      fetchHistory(`${API}/api/indoor-history`, '24h')
     ]);
     
-    const outdoor = await outdoorRes.json();
-    const indoor = await indoorRes.json();
-    
     // Helper to draw a sparkline
     const drawSparkline = (canvasId, data, color) => {
       const canvas = document.getElementById(canvasId);
@@ -2624,8 +2703,7 @@ async function showHistoryModal(metric, range = '24h') {
   
   try {
     // Fetch history data with range parameter
-    const response = await fetch(`/api/indoor-history?range=${range}`);
-    const data = await response.json();
+    const data = await fetchHistory('/api/indoor-history', range);
     
     if (!data.timestamps || data.timestamps.length === 0) {
       ctx.clearRect(0, 0, canvas.width, canvas.height);
@@ -2765,6 +2843,9 @@ window.setInterval = function(...args) {
     args[0] = function() {
       originalFn();
       
+      // Streamed updates redraw the active tab themselves
+      if (isStreamLive()) return;
+
       // Update active tab
       const activeTab = document.querySelector('.tab-content.active');
       if (activeTab) {
@@ -2863,8 +2944,7 @@ async function loadAnalyticsChart() {
   try {
     // Fetch history data for chart
     const historyEndpoint = currentAnalyticsSource === 'indoor' ? '/api/indoor-history' : '/api/history';
-    const response = await fetch(`${historyEndpoint}?range=${currentAnalyticsRange}`);
-    const data = await response.json();
+    const data = await fetchHistory(historyEndpoint, currentAnalyticsRange);
     
     // Fetch current data for accurate "Current" value
     const currentEndpoint = currentAnalyticsSource === 'indoor' ? '/api/indoor' : '/api/current';
@@ -3439,9 +3519,9 @@ async function clearAllNotifications() {
       return;
     }
     
-    // Delete all subscriptions one by one (from highest index to avoid shifting)
-    for (let i = data.subscriptions.length - 1; i >= 0; i--) {
-      await fetch(`/api/push/subscriptions/${i}`, { method: 'DELETE' });
+    // Delete all subscriptions one by one (ids are stable)
+    for (const sub of data.subscriptions) {
+      await fetch(`/api/push/subscriptions/${sub.id}`, { method: 'DELETE' });
     }
     
     console.log('All notification subscriptions cleared');
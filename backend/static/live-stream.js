@@ -0,0 +1,97 @@
+// ==================================================
+// LIVE STREAM - Server-Sent Events from /api/stream
+// ==================================================
+// Keeps the latest current/indoor/minmax/aurora/smhi/forecast payloads in
+// memory. While the stream is connected, liveStream.get()/getMany() answer
+// from memory instead of polling; otherwise they fall back to fetch(), with
+// getMany() batching its sources into one /api/dashboard request.
+
+(function () {
+  const SOURCES = {
+    current: '/api/current',
+    indoor: '/api/indoor',
+    minmax: '/api/minmax',
+    aurora: '/api/aurora',
+    smhi: '/api/smhi',
+    forecast: '/api/forecast'
+  };
+  const RETRY_CLOSED_MS = 30000;
+
+  const data = {};
+  const listeners = [];
+  let source = null;
+  let connected = false;
+
+  function apply(payload, merge) {
+    const changed = Object.keys(payload);
+    changed.forEach(name => {
+      const value = payload[name];
+      data[name] = merge && data[name] ? Object.assign({}, data[name], value) : value;
+    });
+    listeners.forEach(fn => {
+      try {
+        fn(changed, data);
+      } catch (err) {
+        console.error('Live stream listener failed:', err);
+      }
+    });
+  }
+
+  function connect() {
+    if (typeof EventSource === 'undefined' || source) return;
+
+    const api = window.API || '';
+    source = new EventSource(`${api}/api/stream`);
+    source.addEventListener('open', () => {
+      connected = true;
+      console.log('Live stream connected');
+    });
+    source.addEventListener('snapshot', e => apply(JSON.parse(e.data), false));
+    source.addEventListener('update', e => apply(JSON.parse(e.data), true));
+    source.addEventListener('error', () => {
+      // EventSource reconnects by itself unless the server refused the stream
+      connected = false;
+      if (source.readyState === EventSource.CLOSED) {
+        source = null;
+        setTimeout(connect, RETRY_CLOSED_MS);
+      }
+    });
+  }
+
+  window.liveStream = {
+    connect,
+
+    isLive() {
+      return connected;
+    },
+
+    // Latest payload for a source: from the stream when connected, else fetched
+    async get(name) {
+      if (connected && name in data) return data[name];
+      const api = window.API || '';
+      const res = await fetch(`${api}${SOURCES[name]}`);
+      return res.json();
+    },
+
+    // {name: payload} for several sources in one round trip
+    async getMany(names) {
+      if (connected && names.every(name => name in data)) {
+        return Object.fromEntries(names.map(name => [name, data[name]]));
+      }
+      const api = window.API || '';
+      const res = await fetch(`${api}/api/dashboard?fields=${names.join(',')}`);
+      return res.json();
+    },
+
+    // fn(changedSources, allData) after every snapshot/update event
+    onUpdate(fn) {
+      listeners.push(fn);
+    }
+  };
+
+  if (document.readyState === 'loading') {
+    document.addEventListener('DOMContentLoaded', connect);
+  } else {
+    connect();
+  }
+})();
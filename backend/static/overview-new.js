@@ -9,24 +9,27 @@ let overlayTestMode = 'auto';
 let lastOutdoorData = null;
 let lastForecastData = null;
 
+// Latest payloads for several dashboard sections: from the live stream when
+// connected, otherwise one batched /api/dashboard request
+async function getDashboardData(names) {
+  if (typeof window !== 'undefined' && window.liveStream) {
+    return window.liveStream.getMany(names);
+  }
+  const res = await fetch(`${API}/api/dashboard?fields=${names.join(',')}`);
+  return res.json();
+}
+
 async function updateNewOverviewPage() {
   try {
     console.log('updateNewOverviewPage called, API base:', API);
     
-    // Fetch all needed data
-    const [outdoorRes, indoorRes, auroraRes, forecastRes, smhiRes] = await Promise.all([
-      fetch(`${API}/api/current`),
-      fetch(`${API}/api/indoor`),
-      fetch(`${API}/api/aurora`),
-      fetch(`${API}/api/forecast`),
-      fetch(`${API}/api/smhi`)
-    ]);
-    
-    const outdoor = await outdoorRes.json();
-    const indoor = await indoorRes.json();
-    const aurora = await auroraRes.json();
-    const forecast = await forecastRes.json();
-    const smhi = await smhiRes.json();
+    // Fetch all needed data in one round trip
+    const data = await getDashboardData(['current', 'indoor', 'aurora', 'forecast', 'smhi']);
+    const outdoor = data.current;
+    const indoor = data.indoor;
+    const aurora = data.aurora;
+    const forecast = data.forecast;
+    const smhi = data.smhi;
 
     console.log('Fetched data - outdoor:', outdoor, 'indoor:', indoor, 'aurora:', aurora);
 
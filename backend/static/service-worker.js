@@ -1,4 +1,4 @@
-const CACHE_NAME = 'weather-dashboard-v58';
+const CACHE_NAME = 'weather-dashboard-v59';
 const urlsToCache = [
   '/',
   '/styles.css',
@@ -37,8 +37,10 @@ self.addEventListener('fetch', event => {
     return event.respondWith(fetch(event.request));
   }
   
-  // Skip caching for JS files - always fetch fresh
-  if (event.request.url.endsWith('.js')) {
+  // Skip caching for JS files - always fetch fresh. Match on the path:
+  // scripts are requested as versioned URLs (app.js?v=<hash>), which the
+  // browser's HTTP cache keeps as immutable anyway
+  if (new URL(event.request.url).pathname.endsWith('.js')) {
     return event.respondWith(fetch(event.request));
   }
 
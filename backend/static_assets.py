@@ -0,0 +1,173 @@
+"""
+In-memory static asset store with precompressed variants and content-hashed URLs.
+
+At startup every file under static/ is hashed; text assets (JS, CSS, HTML,
+SVG, JSON) are kept in memory together with gzip (and brotli, if the
+`brotli` package is installed) variants. Local references inside HTML, CSS
+and JS ("app.js?v=17", "../vendor/three.module.js", url('background/...'))
+are rewritten to "<path>?v=<content hash>", so a request carrying the
+current hash can be cached as immutable.
+"""
+import gzip
+import hashlib
+import mimetypes
+import os
+import posixpath
+import re
+import threading
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Kept in memory and precompressed
+TEXT_EXTENSIONS = {".js", ".css", ".html", ".svg", ".json"}
+
+# Files whose references get rewritten to versioned URLs
+REWRITE_EXTENSIONS = {".js", ".css", ".html"}
+
+# Never versioned: the browser must always find these at a stable URL
+UNVERSIONED = {"service-worker.js", "manifest.json"}
+
+SKIP_SUFFIXES = (".backup",)
+
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+MIN_COMPRESS_SIZE = 512
+
+# A quoted string or url( ) holding a relative/absolute local path, with an
+# optional existing ?v= cache-buster
+REF_RE = re.compile(
+    r"""(?P<open>["'(])(?P<path>(?:\.{1,2}/|/)?[\w\-./]+\.(?:js|css|png|jpg|svg|json))"""
+    r"""(?:\?v=[\w.\-]*)?(?=["')])"""
+)
+
+mimetypes.add_type("application/javascript", ".js")
+mimetypes.add_type("application/manifest+json", ".webmanifest")
+
+
+class Asset:
+    __slots__ = ("path", "file_path", "mtime", "mimetype", "version", "data", "gzip", "br")
+
+    def __init__(self, path, file_path, mtime, mimetype):
+        self.path = path
+        self.file_path = file_path
+        self.mtime = mtime
+        self.mimetype = mimetype
+        self.version = None
+        self.data = None
+        self.gzip = None
+        self.br = None
+
+
+def compress(data, encoding, level=None):
+    """Compress bytes for a Content-Encoding of 'gzip' or 'br'"""
+    if encoding == "br":
+        return brotli.compress(data, quality=11 if level is None else level)
+    return gzip.compress(data, compresslevel=9 if level is None else level)
+
+
+def choose_encoding(accept_encodings):
+    """Best supported Content-Encoding for a werkzeug Accept-Encoding header"""
+    if brotli is not None and accept_encodings.quality("br") > 0:
+        return "br"
+    if accept_encodings.quality("gzip") > 0:
+        return "gzip"
+    return None
+
+
+class AssetStore:
+    def __init__(self, root):
+        self.root = root
+        self._assets = {}
+        self._lock = threading.Lock()
+        self._reload_lock = threading.Lock()    # One rebuild at a time
+        self.load()
+
+    # ---------- Loading ----------
+    def load(self):
+        assets = {}
+        for dirpath, _, filenames in os.walk(self.root):
+            for filename in filenames:
+                if filename.endswith(SKIP_SUFFIXES):
+                    continue
+                file_path = os.path.join(dirpath, filename)
+                path = os.path.relpath(file_path, self.root).replace(os.sep, "/")
+                mimetype = mimetypes.guess_type(filename)[0] or "application/octet-stream"
+                assets[path] = Asset(path, file_path, os.path.getmtime(file_path), mimetype)
+
+        resolving = set()
+
+        def resolve(asset):
+            """Load, rewrite references and hash an asset (dependencies first)"""
+            if asset.version is not None:
+                return asset.version
+            resolving.add(asset.path)
+
+            with open(asset.file_path, "rb") as f:
+                raw = f.read()
+            ext = os.path.splitext(asset.path)[1]
+
+            if ext in REWRITE_EXTENSIONS:
+                base = posixpath.dirname(asset.path)
+
+                def versioned(match):
+                    ref = match.group("path")
+                    target = posixpath.normpath(ref.lstrip("/") if ref.startswith("/") else posixpath.join(base, ref))
+                    dep = assets.get(target)
+                    if dep is None or dep.path in UNVERSIONED or dep.path in resolving:
+                        return match.group(0)
+                    return f"{match.group('open')}{ref}?v={resolve(dep)}"
+
+                raw = REF_RE.sub(versioned, raw.decode("utf-8")).encode("utf-8")
+
+            asset.version = hashlib.sha1(raw).hexdigest()[:12]
+            if ext in TEXT_EXTENSIONS:
+                asset.data = raw
+                if len(raw) >= MIN_COMPRESS_SIZE:
+                    asset.gzip = compress(raw, "gzip")
+                    if brotli is not None:
+                        asset.br = compress(raw, "br")
+            resolving.discard(asset.path)
+            return asset.version
+
+        for asset in assets.values():
+            resolve(asset)
+
+        with self._lock:
+            self._assets = assets
+
+    # ---------- Lookup ----------
+    def get(self, path):
+        """Asset for a URL path, reloading the store if the file changed on disk
+        or was added after the store was built"""
+        asset = self._assets.get(path)
+        if asset is None:
+            return self._added(path)
+        try:
+            if os.path.getmtime(asset.file_path) != asset.mtime:
+                with self._reload_lock:
+                    # Another request may have rebuilt the store while this one waited
+                    asset = self._assets.get(path)
+                    if asset is not None and os.path.getmtime(asset.file_path) != asset.mtime:
+                        self.load()
+                        asset = self._assets.get(path)
+        except OSError:
+            return None
+        return asset
+
+    def _added(self, path):
+        """Reload for a file created since the last load; None if there is no such file"""
+        root = os.path.join(os.path.abspath(self.root), "")
+        file_path = os.path.abspath(os.path.join(root, path))
+        if (not file_path.startswith(root) or path.endswith(SKIP_SUFFIXES)
+                or not os.path.isfile(file_path)):
+            return None
+        with self._reload_lock:
+            if path not in self._assets:
+                self.load()
+            return self._assets.get(path)
+
+    def version(self, path):
+        asset = self._assets.get(path)
+        return asset.version if asset else None
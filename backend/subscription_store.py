@@ -0,0 +1,202 @@
+"""
+SQLite store for web push subscriptions
+One row per push endpoint (unique index) with the subscription, its
+notification settings and the checker's per-rule state as JSON columns.
+WAL mode lets the Flask app and the notification checker read while the
+other writes; every change is its own short transaction, so adding,
+updating or removing one device never rewrites the others.
+
+The old push_subscriptions.json is imported once, the first time the
+database is opened.
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+from push_config import SUBSCRIPTIONS_DB, SUBSCRIPTIONS_FILE
+
+BASE_DIR = os.path.abspath(os.path.dirname(__file__))
+BUSY_TIMEOUT = 10       # Seconds to wait for another process's write lock
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS subscriptions (
+    id           INTEGER PRIMARY KEY AUTOINCREMENT,
+    endpoint     TEXT NOT NULL UNIQUE,
+    subscription TEXT NOT NULL,
+    settings     TEXT NOT NULL DEFAULT '{}',
+    state        TEXT NOT NULL DEFAULT '{}',
+    created      REAL NOT NULL,
+    updated      REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS meta (
+    key   TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+
+def _path(path):
+    return path if os.path.isabs(path) else os.path.join(BASE_DIR, path)
+
+
+def _row(row):
+    return {
+        "id": row["id"],
+        "endpoint": row["endpoint"],
+        "subscription": json.loads(row["subscription"]),
+        "settings": json.loads(row["settings"]),
+        "state": json.loads(row["state"]),
+    }
+
+
+class SubscriptionStore:
+    def __init__(self, path=SUBSCRIPTIONS_DB, legacy_json=SUBSCRIPTIONS_FILE):
+        self.path = _path(path)
+        self.legacy_json = _path(legacy_json) if legacy_json else None
+        self._local = threading.local()
+        self._init_lock = threading.Lock()
+        self._ready = False
+
+    # ---------- Connection ----------
+    def _conn(self):
+        """One connection per thread, created (and the schema set up) on first use"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            # Autocommit; writes use explicit BEGIN IMMEDIATE transactions
+            conn = sqlite3.connect(self.path, timeout=BUSY_TIMEOUT, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        if not self._ready:
+            with self._init_lock:
+                if not self._ready:
+                    conn.executescript(SCHEMA)
+                    self._migrate_json(conn)
+                    self._ready = True
+        return conn
+
+    @contextmanager
+    def transaction(self):
+        """Write transaction; takes the database write lock up front"""
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    def _migrate_json(self, conn):
+        """Import push_subscriptions.json once (old and settings formats)"""
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            # Checked under the write lock, so only one process imports
+            if conn.execute("SELECT 1 FROM meta WHERE key = 'json_migrated'").fetchone():
+                conn.execute("ROLLBACK")
+                return
+            entries = []
+            if self.legacy_json and os.path.exists(self.legacy_json):
+                with open(self.legacy_json, "r") as f:
+                    entries = json.load(f)
+
+            imported = 0
+            for entry in entries:
+                if not isinstance(entry, dict):
+                    continue
+                # Old format: the subscription itself, no settings
+                subscription = entry.get("subscription", entry)
+                endpoint = subscription.get("endpoint") if isinstance(subscription, dict) else None
+                if not endpoint:
+                    continue
+                cursor = conn.execute(
+                    "INSERT OR IGNORE INTO subscriptions (endpoint, subscription, settings, state, created, updated) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    (endpoint, json.dumps(subscription), json.dumps(entry.get("settings", {})),
+                     json.dumps(entry.get("state", {}) or {}), now, now),
+                )
+                imported += cursor.rowcount
+            conn.execute("INSERT INTO meta (key, value) VALUES ('json_migrated', ?)", (str(now),))
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+        if entries:
+            print(f"✓ Migrated {imported} subscription(s) from {self.legacy_json} to {self.path}")
+
+    # ---------- Reads ----------
+    def all(self):
+        """Every subscription, oldest first, as {id, endpoint, subscription, settings, state}"""
+        rows = self._conn().execute("SELECT * FROM subscriptions ORDER BY id").fetchall()
+        return [_row(row) for row in rows]
+
+    def count(self):
+        return self._conn().execute("SELECT COUNT(*) FROM subscriptions").fetchone()[0]
+
+    # ---------- Writes ----------
+    def upsert(self, subscription, settings):
+        """Add a subscription, or replace the subscription/settings stored for its endpoint
+
+        Checker state (last sent times, "once" flags) is kept. Returns the row id.
+        """
+        now = time.time()
+        with self.transaction() as conn:
+            conn.execute(
+                "INSERT INTO subscriptions (endpoint, subscription, settings, created, updated) "
+                "VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT(endpoint) DO UPDATE SET "
+                "subscription = excluded.subscription, settings = excluded.settings, updated = excluded.updated",
+                (subscription["endpoint"], json.dumps(subscription), json.dumps(settings), now, now),
+            )
+            return conn.execute("SELECT id FROM subscriptions WHERE endpoint = ?",
+                                (subscription["endpoint"],)).fetchone()[0]
+
+    def delete(self, subscription_id):
+        """Remove one subscription by id; True if it existed"""
+        with self.transaction() as conn:
+            return conn.execute("DELETE FROM subscriptions WHERE id = ?", (subscription_id,)).rowcount > 0
+
+    def delete_endpoints(self, endpoints):
+        """Remove subscriptions by endpoint (e.g. expired ones); returns how many"""
+        with self.transaction() as conn:
+            return sum(conn.execute("DELETE FROM subscriptions WHERE endpoint = ?", (endpoint,)).rowcount
+                       for endpoint in endpoints)
+
+    def update_state(self, endpoint, key, last_sent=None, once=False):
+        """Record a sent notification for one rule of one subscription"""
+        fields = {}
+        if last_sent is not None:
+            fields['lastSent'] = float(last_sent)
+        if once:
+            fields['once'] = True
+        return self.update_states({endpoint: {key: fields}}) > 0
+
+    def update_states(self, changes):
+        """Merge {endpoint: {key: {field: value}}} into the stored state in one transaction
+
+        Returns the number of subscriptions updated; unknown endpoints are skipped.
+        """
+        if not changes:
+            return 0
+        updated = 0
+        now = time.time()
+        with self.transaction() as conn:
+            for endpoint, keys in changes.items():
+                row = conn.execute("SELECT state FROM subscriptions WHERE endpoint = ?", (endpoint,)).fetchone()
+                if row is None:
+                    continue
+                state = json.loads(row["state"])
+                for key, fields in keys.items():
+                    state.setdefault(key, {}).update(fields)
+                conn.execute("UPDATE subscriptions SET state = ?, updated = ? WHERE endpoint = ?",
+                             (json.dumps(state), now, endpoint))
+                updated += 1
+        return updated
+
+
+store = SubscriptionStore()
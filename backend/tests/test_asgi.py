@@ -0,0 +1,47 @@
+"""ASGI serving: Flask routes must not wait behind an open /api/stream"""
+import socket
+import threading
+import time
+
+import pytest
+
+uvicorn = pytest.importorskip("uvicorn")
+httpx = pytest.importorskip("httpx")
+pytest.importorskip("config", reason="needs backend/config.py")
+
+
+@pytest.fixture(scope="module")
+def server():
+    from asgi import application
+
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+    srv = uvicorn.Server(uvicorn.Config(application, host="127.0.0.1", port=port, log_level="warning"))
+    thread = threading.Thread(target=srv.run, daemon=True)
+    thread.start()
+    deadline = time.time() + 30
+    while not srv.started:
+        assert time.time() < deadline, "server did not start"
+        time.sleep(0.05)
+    yield f"http://127.0.0.1:{port}"
+    srv.should_exit = True
+    thread.join(10)
+
+
+def test_static_paths_served_while_stream_open(server):
+    with httpx.Client(base_url=server, timeout=5) as client:
+        with client.stream("GET", "/api/stream") as stream:
+            assert stream.status_code == 200
+            assert stream.headers["content-type"].startswith("text/event-stream")
+            assert next(stream.iter_text()).startswith("retry:")
+
+            for path in ("/manifest.json", "/", "/service-worker.js"):
+                assert client.get(path).status_code == 200
+
+
+def test_two_streams_and_static(server):
+    with httpx.Client(base_url=server, timeout=5) as client:
+        with client.stream("GET", "/api/stream") as first, client.stream("GET", "/api/stream") as second:
+            assert first.status_code == second.status_code == 200
+            assert client.get("/manifest.json").status_code == 200
@@ -0,0 +1,27 @@
+"""Aurora scoring with solar wind feeds that have no data yet"""
+import math
+from datetime import datetime, timezone
+
+import pytest
+
+pytest.importorskip("config", reason="needs backend/config.py")
+
+from aurora import parse_mag, parse_plasma, score_site
+from locations import all_locations
+from solar_wind import SolarWindBuffer
+
+MAG_HEADER = ["time_tag", "bx_gsm", "by_gsm", "bz_gsm", "lon_gsm", "lat_gsm", "bt"]
+PLASMA_HEADER = ["time_tag", "density", "speed", "temperature"]
+
+
+def test_empty_solar_wind_buffers_are_unknown():
+    mag = parse_mag(SolarWindBuffer("mag", {"bz_gsm": "bz", "bt": "bt"}), [MAG_HEADER])
+    plasma = parse_plasma(SolarWindBuffer("plasma", {"speed": "speed", "density": "density"}), [PLASMA_HEADER])
+    for value in (mag["bz_component"], mag["bt_component"], plasma["solar_wind_speed"], plasma["density"]):
+        assert math.isnan(value)
+
+    site = all_locations()[0]
+    inputs = {"kp_index": 5.0, **mag, **plasma}
+    result = score_site(site, inputs, None, when=datetime(2026, 1, 1, 0, tzinfo=timezone.utc))
+    assert result["bz_component"] is None
+    assert result["solar_wind_speed"] is None
@@ -0,0 +1,87 @@
+"""
+Async upstream fetches for the ASGI app
+Shares entries (and their parsed values) with the threaded UpstreamCache,
+fetches with httpx and caps concurrent requests per upstream host, so a
+slow SMHI/NOAA response can't pile up unbounded connections.
+"""
+import asyncio
+from urllib.parse import urlsplit
+
+import httpx
+
+from upstream_cache import cache, REQUEST_TIMEOUT
+
+try:
+    from config import UPSTREAM_CONCURRENCY
+except ImportError:
+    UPSTREAM_CONCURRENCY = 4     # Concurrent requests per upstream host
+
+
+class AsyncUpstream:
+    """Stale-while-revalidate and request coalescing on top of `cache`
+
+    - Fresh hit: return cached value
+    - Stale hit: return cached value and start one background refresh task
+    - Miss: concurrent callers await the same fetch task
+    """
+
+    def __init__(self, cache, concurrency=UPSTREAM_CONCURRENCY, timeout=REQUEST_TIMEOUT):
+        self.cache = cache
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self._client = None
+        self._semaphores = {}
+        self._inflight = {}
+
+    async def start(self):
+        if self._client is None:
+            self._client = httpx.AsyncClient(timeout=self.timeout)
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    async def fetch_json(self, url):
+        """Uncached GET of a JSON document, limited per host"""
+        await self.start()
+        host = urlsplit(url).netloc
+        semaphore = self._semaphores.get(host)
+        if semaphore is None:
+            semaphore = self._semaphores[host] = asyncio.Semaphore(self.concurrency)
+        async with semaphore:
+            response = await self._client.get(url)
+        response.raise_for_status()
+        return response.json()
+
+    async def _refresh(self, source, url, parse):
+        try:
+            data = await self.fetch_json(url)
+            value = parse(data) if parse else data
+            self.cache.put(source, url, value)
+            return value
+        except Exception as e:
+            print(f"Upstream refresh failed for {source}: {e}")
+            self.cache.record_error(source, url, e)
+            raise
+        finally:
+            self._inflight.pop((source, url), None)
+
+    async def get_json(self, source, url, parse=None):
+        """GET a JSON document through the shared cache; `parse` shapes what is cached"""
+        state, value = self.cache.lookup(source, url)
+        if state == "fresh":
+            return value
+
+        task = self._inflight.get((source, url))
+        if task is None:
+            task = self._inflight[(source, url)] = asyncio.ensure_future(self._refresh(source, url, parse))
+            # A failed background refresh is already logged
+            task.add_done_callback(lambda t: t.cancelled() or t.exception())
+
+        if state == "stale":
+            return value
+        return await asyncio.shield(task)
+
+
+upstream = AsyncUpstream(cache)
@@ -0,0 +1,204 @@
+"""
+Upstream cache for SMHI and NOAA fetches
+TTL per source, stale-while-revalidate and request coalescing
+"""
+import threading
+import time
+import requests
+
+# Seconds a cached response is considered fresh, per upstream source
+SOURCE_TTL = {
+    "smhi_forecast": 1800,   # SMHI point forecast, updated roughly hourly
+    "smhi_warnings": 300,
+    "ovation": 900,          # OVATION model runs every ~15 minutes
+    "kp": 60,
+    "kp_forecast": 1800,     # 3-hourly predicted Kp, reissued a few times a day
+    "solar_wind_mag": 60,
+    "solar_wind_plasma": 60,
+}
+DEFAULT_TTL = 300
+
+# How long past its TTL an entry may still be served while it refreshes
+MAX_STALE_SECONDS = 6 * 3600
+
+REQUEST_TIMEOUT = 10
+
+
+class _Entry:
+    __slots__ = ("value", "fetched_at", "refreshing", "event", "error")
+
+    def __init__(self):
+        self.value = None
+        self.fetched_at = None
+        self.refreshing = False
+        self.event = None
+        self.error = None
+
+
+class UpstreamCache:
+    """Thread-safe TTL cache keyed by upstream request
+
+    - Fresh hit: return cached value
+    - Stale hit: return cached value and start one background refresh
+    - Miss: the first caller fetches, concurrent callers wait for its result
+    """
+
+    def __init__(self, ttl=None, default_ttl=DEFAULT_TTL, max_stale=MAX_STALE_SECONDS):
+        self.ttl = dict(ttl or {})
+        self.default_ttl = default_ttl
+        self.max_stale = max_stale
+        self._entries = {}
+        self._lock = threading.Lock()
+        self._stats = {}
+
+    def _ttl_for(self, source):
+        return self.ttl.get(source, self.default_ttl)
+
+    def _count(self, source, kind):
+        stats = self._stats.setdefault(source, {"hits": 0, "stale_hits": 0, "misses": 0, "errors": 0})
+        stats[kind] += 1
+
+    def get(self, source, key, fetch):
+        """Return the cached value for (source, key), calling fetch() when needed"""
+        cache_key = (source, key)
+        ttl = self._ttl_for(source)
+        now = time.time()
+
+        with self._lock:
+            entry = self._entries.get(cache_key)
+            if entry is None:
+                entry = self._entries[cache_key] = _Entry()
+
+            if entry.fetched_at is not None:
+                age = now - entry.fetched_at
+                if age < ttl:
+                    self._count(source, "hits")
+                    return entry.value
+                if age < ttl + self.max_stale:
+                    self._count(source, "stale_hits")
+                    if not entry.refreshing:
+                        entry.refreshing = True
+                        entry.event = threading.Event()
+                        threading.Thread(
+                            target=self._refresh, args=(source, cache_key, entry, fetch),
+                            daemon=True
+                        ).start()
+                    return entry.value
+
+            # Miss (or too stale to serve): coalesce onto a single fetch
+            self._count(source, "misses")
+            if entry.refreshing and entry.event is not None:
+                waiter = entry.event
+                leader = False
+            else:
+                entry.refreshing = True
+                entry.event = waiter = threading.Event()
+                leader = True
+
+        if leader:
+            self._refresh(source, cache_key, entry, fetch)
+        else:
+            waiter.wait(REQUEST_TIMEOUT * 3)
+
+        with self._lock:
+            if entry.fetched_at is None:
+                raise entry.error or RuntimeError(f"Upstream fetch failed for {source}")
+            return entry.value
+
+    def _refresh(self, source, cache_key, entry, fetch):
+        try:
+            value = fetch()
+            with self._lock:
+                entry.value = value
+                entry.fetched_at = time.time()
+                entry.error = None
+        except Exception as e:
+            print(f"Upstream refresh failed for {source}: {e}")
+            with self._lock:
+                entry.error = e
+                self._count(source, "errors")
+        finally:
+            with self._lock:
+                entry.refreshing = False
+                event, entry.event = entry.event, None
+            if event is not None:
+                event.set()
+
+    def lookup(self, source, key):
+        """Non-blocking check for callers that fetch on their own (the async path).
+        Returns ("fresh" | "stale" | "miss", value) and counts it in the stats."""
+        ttl = self._ttl_for(source)
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get((source, key))
+            if entry is not None and entry.fetched_at is not None:
+                age = now - entry.fetched_at
+                if age < ttl:
+                    self._count(source, "hits")
+                    return "fresh", entry.value
+                if age < ttl + self.max_stale:
+                    self._count(source, "stale_hits")
+                    return "stale", entry.value
+            self._count(source, "misses")
+            return "miss", None
+
+    def record_error(self, source, key, error):
+        """Note a failed fetch made outside get()"""
+        with self._lock:
+            entry = self._entries.setdefault((source, key), _Entry())
+            entry.error = error
+            self._count(source, "errors")
+
+    def put(self, source, key, value):
+        """Store a value fetched elsewhere (e.g. by a background refresher)"""
+        with self._lock:
+            entry = self._entries.setdefault((source, key), _Entry())
+            entry.value = value
+            entry.fetched_at = time.time()
+            entry.error = None
+
+    def age(self, source, key):
+        """Seconds since (source, key) was last fetched, or None"""
+        with self._lock:
+            entry = self._entries.get((source, key))
+            if entry is None or entry.fetched_at is None:
+                return None
+            return time.time() - entry.fetched_at
+
+    def stats(self):
+        """Hit/miss counters and entry ages per source"""
+        now = time.time()
+        with self._lock:
+            result = {}
+            for (source, key), entry in self._entries.items():
+                info = result.setdefault(source, {
+                    "ttl": self._ttl_for(source),
+                    **self._stats.get(source, {"hits": 0, "stale_hits": 0, "misses": 0, "errors": 0}),
+                    "entries": [],
+                })
+                info["entries"].append({
+                    "key": key,
+                    "age": round(now - entry.fetched_at, 1) if entry.fetched_at else None,
+                    "refreshing": entry.refreshing,
+                    "error": str(entry.error) if entry.error else None,
+                })
+            return result
+
+
+cache = UpstreamCache(SOURCE_TTL)
+
+
+def fetch_json(url, timeout=REQUEST_TIMEOUT):
+    """Uncached GET of a JSON document"""
+    response = requests.get(url, timeout=timeout)
+    response.raise_for_status()
+    return response.json()
+
+
+def get_json(source, url, timeout=REQUEST_TIMEOUT):
+    """GET a JSON document through the shared upstream cache"""
+    return cache.get(source, url, lambda: fetch_json(url, timeout))
+
+
+def cache_stats():
+    return cache.stats()